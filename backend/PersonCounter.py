@@ -1,141 +1,460 @@
-
 import cv2
-import pandas as pd
 import numpy as np
-from ultralytics import YOLO
 from tracker import Tracker
+from counting_lines import LineCounter, parse_lines
+from detections import box_iou, decode_person_boxes, person_class_ids
+from detector_backends import load_detector
 import cvzone
+import argparse
+import json
+import multiprocessing as mp
 import os
-import torch
+import shutil
+import subprocess
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+
+def annotate_frame(frame, bbox_id, crossings, entry_count, exit_count, frame_count, fps, line_counter):
+    """Draw boxes, crossings, the counting lines and counters onto the frame in place"""
+    height, width = frame.shape[:2]
+
+    for x3, y3, x4, y4, id in bbox_id:
+        cx = int((x3 + x4) // 2)
+        cy = int((y3 + y4) // 2)
+        cv2.rectangle(frame, (x3, y3), (x4, y4), (0, 255, 0), 2)
+        cv2.circle(frame, (cx, cy), 4, (255, 0, 255), -1)
+        cvzone.putTextRect(frame, f'{id}', (x3, y3), 1, 2)
+
+    for kind, line, id, cx, cy in crossings:
+        color = (0, 255, 0) if kind == 'entry' else (0, 0, 255)
+        cv2.circle(frame, (cx, cy), 15, color, 3)
+        cvzone.putTextRect(frame, 'ENTRY' if kind == 'entry' else 'EXIT', (cx-30, cy-30), 1, 2, colorR=color)
+
+    line_counter.draw(frame)
+
+    cvzone.putTextRect(frame, f'Entry: {entry_count}', (245, 25), 2, 2, colorR=(0, 255, 0))
+    cvzone.putTextRect(frame, f'Exit: {exit_count}', (25, 25), 2, 2, colorR=(0, 0, 255))
+
+    cvzone.putTextRect(frame, f'Frame: {frame_count}', (15, 80), 1, 1)
+    cvzone.putTextRect(frame, f'Density: {entry_count+exit_count}', (15, 130), 1, 1)
+
+    cv2.putText(frame, f'Density: {entry_count + exit_count}', (10, height - 50),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+    cv2.putText(frame, f'FPS: {fps}', (10, height - 20),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+    return frame
+
 
 def entry_exit_video_processing():
-    torch.cuda.is_available = lambda : False
-    
-    model = YOLO('yolov8s.pt')
-    
+    model = load_detector('torch')
+
     input_video = 'zone4.mp4'
     output_video = 'zone4out.mp4'
-    
+
     if not os.path.exists(input_video):
         print(f"Error: {input_video} not found!")
         return
-    
+
     cap = cv2.VideoCapture(input_video)
-    
+
     fps = int(cap.get(cv2.CAP_PROP_FPS))
     width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
     height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-    
+
     print(f"Video properties: {width}x{height} @ {fps}fps")
-    
+
     fourcc = cv2.VideoWriter_fourcc(*'mp4v')
     out = cv2.VideoWriter(output_video, fourcc, fps, (width, height))
-    
-    with open('object_class.names', 'r') as file:
-        class_list = file.read().split('\n')
-    
+
+    person_classes = list(person_class_ids())
+
     tracker = Tracker()
-    
-    previous_positions = {}
-    
+
+    line_counter = LineCounter(parse_lines(None), width, height)
+
     entry_count = 0
     exit_count = 0
-    
-    center_line_x = width // 2
-    
+
     frame_count = 0
-    
+
     print(f"Processing {input_video}...")
-    print(f"Center line at x = {center_line_x}")
+    print(f"Center line at x = {width // 2}")
     print("Using CPU for processing...")
-    
+
     while True:
         ret, frame = cap.read()
         if not ret:
             break
-        
+
         frame_count += 1
-        
-        results = model.predict(frame, conf=0.5, device='cpu')
-        
-        a = results[0].boxes.data
-        px = pd.DataFrame(a).astype("float")
-        
-        person_list = []
-        for index, row in px.iterrows():
-            x1, y1, x2, y2, conf, d = row
-            if conf > 0.5:
-                class_name = class_list[int(d)]
-                if 'person' in class_name:
-                    person_list.append([int(x1), int(y1), int(x2), int(y2)])
-        
-        bbox_id = tracker.update(person_list)
-        
-        current_positions = {}
-        
-        for bbox in bbox_id:
-            x3, y3, x4, y4, id = bbox
-            cx = int((x3 + x4) // 2)
-            cy = int((y3 + y4) // 2)
-            
-            current_positions[id] = (cx, cy)
-            
-            cv2.rectangle(frame, (x3, y3), (x4, y4), (0, 255, 0), 2)
-            
-            cv2.circle(frame, (cx, cy), 4, (255, 0, 255), -1)
-            
-            cvzone.putTextRect(frame, f'{id}', (x3, y3), 1, 2)
-            
-            if id in previous_positions:
-                prev_x, prev_y = previous_positions[id]
-                
-                if (prev_x < center_line_x and cx >= center_line_x):
-                    entry_count += 1
-                    print(f"Person {id} ENTERED (left to right) - Entry count: {entry_count}")
-                    
-                    cv2.circle(frame, (cx, cy), 15, (0, 255, 0), 3)
-                    cvzone.putTextRect(frame, 'ENTRY', (cx-30, cy-30), 1, 2, colorR=(0, 255, 0))
-                    
-                elif (prev_x > center_line_x and cx <= center_line_x):
-                    exit_count += 1
-                    print(f"Person {id} EXITED (right to left) - Exit count: {exit_count}")
-                    
-                    cv2.circle(frame, (cx, cy), 15, (0, 0, 255), 3)
-                    cvzone.putTextRect(frame, 'EXIT', (cx-30, cy-30), 1, 2, colorR=(0, 0, 255))
-        
-        previous_positions = current_positions.copy()
-        
-        cv2.line(frame, (center_line_x, 0), (center_line_x, height), (255, 255, 255), 3)
-        
-        cvzone.putTextRect(frame, f'Entry: {entry_count}', (245, 25), 2, 2, colorR=(0, 255, 0))
-        cvzone.putTextRect(frame, f'Exit: {exit_count}', (25, 25), 2, 2, colorR=(0, 0, 255))
-        
-        cvzone.putTextRect(frame, f'Frame: {frame_count}', (15, 80), 1, 1)
-        cvzone.putTextRect(frame, f'Density: {entry_count+exit_count}', (15, 130), 1, 1)
-        
-        cv2.putText(frame, f'Density: {entry_count + exit_count}', (10, height - 50),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
-        cv2.putText(frame, f'FPS: {fps}', (10, height - 20),
-                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-        
+
+        results = model.predict(frame, conf=0.5, device='cpu', classes=person_classes)
+
+        person_boxes = decode_person_boxes(results[0], conf=0.5, classes=person_classes)
+
+        bbox_id = tracker.update(person_boxes)
+
+        crossings = line_counter.update(bbox_id)
+
+        for kind, line, id, cx, cy in crossings:
+            if kind == 'entry':
+                entry_count += 1
+                print(f"Person {id} ENTERED (left to right) - Entry count: {entry_count}")
+            else:
+                exit_count += 1
+                print(f"Person {id} EXITED (right to left) - Exit count: {exit_count}")
+
+        annotate_frame(frame, bbox_id, crossings, entry_count, exit_count, frame_count, fps, line_counter)
+
         out.write(frame)
-        
+
         if frame_count % 30 == 0:
             print(f"Processed {frame_count} frames - Entry: {entry_count}, Exit: {exit_count}")
-        
+
         cv2.imshow('Entry/Exit Counter', frame)
         if cv2.waitKey(1) & 0xff == 27:
             break
-    
+
     cap.release()
     out.release()
     cv2.destroyAllWindows()
-    
+
     print(f"\nProcessing complete!")
     print(f"Output saved as: {output_video}")
     print(f"Final counts - Entry: {entry_count}, Exit: {exit_count}")
     print(f"Total frames processed: {frame_count}")
     print(f"Net flow: {entry_count - exit_count}")
 
+
+# Batch mode: the video is split into frame segments processed by a pool of worker processes.
+#
+# Tracker and line counter state is only the previous frame's centers, so a segment that
+# starts decoding warmup_frames before its first frame makes exactly the same associations,
+# and counts exactly the same crossings, as a sequential run. Track ids are local to each
+# segment and are stitched afterwards by matching boxes on the boundary frame both saw.
+
+_worker_model = None
+
+
+def _init_worker(backend, threads):
+    """Pool initializer: split the cores between workers and load the model once per process"""
+    global _worker_model
+    cv2.setNumThreads(1)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        pass
+    _worker_model = load_detector(backend)
+
+
+def _process_segment(task):
+    """Detect, track and count one segment; returns its events and boundary tracks"""
+    index, video, start, end, warmup_frames, conf, record_tracks, lines = task
+    person_classes = list(person_class_ids())
+    started = time.time()
+
+    cap = cv2.VideoCapture(video)
+    first = max(0, start - warmup_frames)
+    if first:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, first)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+
+    tracker = Tracker()
+    line_counter = LineCounter(lines, width, height)
+    events = []
+    tracks = {}
+    head = []
+    tail = []
+    ids_seen = set()
+    frames_read = 0
+
+    for frame_index in range(first, end):
+        ret, frame = cap.read()
+        if not ret:
+            break
+
+        results = _worker_model.predict(frame, conf=conf, device='cpu', classes=person_classes, verbose=False)
+        person_boxes = decode_person_boxes(results[0] if results else None, conf=conf, classes=person_classes)
+        bbox_id = tracker.update(person_boxes)
+        crossings = line_counter.update(bbox_id)
+
+        if frame_index == start - 1:
+            head = bbox_id
+        if frame_index < start:
+            continue
+
+        frames_read += 1
+        ids_seen.update(id for *_, id in bbox_id)
+        events.extend((frame_index, kind, line, id, cx, cy) for kind, line, id, cx, cy in crossings)
+        if record_tracks:
+            tracks[frame_index] = bbox_id
+        tail = bbox_id
+
+    cap.release()
+    return {
+        'index': index,
+        'start': start,
+        'end': end,
+        'frames': frames_read,
+        'events': events,
+        'head': head,
+        'tail': tail,
+        'ids_seen': sorted(ids_seen),
+        'tracks': tracks,
+        'elapsed': time.time() - started,
+    }
+
+
+def _match_boundary(head, tail, iou_threshold=0.5):
+    """Map this segment's ids on the boundary frame to the previous segment's ids"""
+    if not head or not tail:
+        return {}
+    head_boxes = np.array([b[:4] for b in head])
+    tail_boxes = np.array([b[:4] for b in tail])
+    iou = box_iou(head_boxes, tail_boxes)
+    mapping = {}
+    # Same frame and same detector, so boxes normally match exactly; best IoU first
+    for flat in np.argsort(-iou, axis=None):
+        i, j = np.unravel_index(flat, iou.shape)
+        if iou[i, j] < iou_threshold:
+            break
+        if head[i][4] not in mapping and tail[j][4] not in mapping.values():
+            mapping[head[i][4]] = tail[j][4]
+    return mapping
+
+
+def stitch_segments(segments):
+    """
+    Give every track a global id and return the segments' events in frame order.
+
+    Returns:
+        (events, unique_people) with events as dicts of frame, type and global id
+    """
+    next_id = 0
+    previous = None
+    for segment in segments:
+        mapping = {}
+        if previous is not None:
+            boundary = _match_boundary(segment['head'], previous['tail'])
+            mapping = {local: previous['id_map'][prev] for local, prev in boundary.items()
+                       if prev in previous['id_map']}
+        for local in segment['ids_seen']:
+            if local not in mapping:
+                mapping[local] = next_id
+                next_id += 1
+        segment['id_map'] = mapping
+        previous = segment
+
+    events = []
+    for segment in segments:
+        id_map = segment['id_map']
+        events.extend({'frame': frame_index, 'type': kind, 'line': line, 'id': id_map[id], 'x': cx, 'y': cy}
+                      for frame_index, kind, line, id, cx, cy in segment['events'])
+    events.sort(key=lambda e: (e['frame'], e['id']))
+    return events, next_id
+
+
+def _annotate_segment(task):
+    """Draw one segment with global ids and running totals into its own video file"""
+    video, start, end, part_path, tracks, crossings, entry_offset, exit_offset, fps, lines = task
+    cap = cv2.VideoCapture(video)
+    if start:
+        cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    line_counter = LineCounter(lines, width, height)
+    out = cv2.VideoWriter(part_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+
+    entry_count, exit_count = entry_offset, exit_offset
+    for frame_index in range(start, end):
+        ret, frame = cap.read()
+        if not ret:
+            break
+        frame_crossings = crossings.get(frame_index, [])
+        for kind, *_ in frame_crossings:
+            if kind == 'entry':
+                entry_count += 1
+            else:
+                exit_count += 1
+        annotate_frame(frame, tracks.get(frame_index, []), frame_crossings,
+                       entry_count, exit_count, frame_index + 1, fps, line_counter)
+        out.write(frame)
+
+    cap.release()
+    out.release()
+    return part_path
+
+
+def _concat_videos(parts, output_path, fps, size):
+    """Join the segment videos, without re-encoding when ffmpeg is available"""
+    if shutil.which('ffmpeg'):
+        list_path = output_path + '.parts.txt'
+        with open(list_path, 'w') as file:
+            file.writelines(f"file '{os.path.abspath(p)}'\n" for p in parts)
+        try:
+            subprocess.run(['ffmpeg', '-y', '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                            '-i', list_path, '-c', 'copy', output_path], check=True)
+            return
+        except subprocess.CalledProcessError as e:
+            print(f"ffmpeg concat failed ({e}), falling back to OpenCV")
+        finally:
+            os.remove(list_path)
+
+    out = cv2.VideoWriter(output_path, cv2.VideoWriter_fourcc(*'mp4v'), fps, size)
+    for part in parts:
+        cap = cv2.VideoCapture(part)
+        while True:
+            ret, frame = cap.read()
+            if not ret:
+                break
+            out.write(frame)
+        cap.release()
+    out.release()
+
+
+def batch_video_processing(input_video, summary_path=None, output_video=None, workers=None,
+                           segment_seconds=None, warmup_frames=2, conf=0.5, backend='torch', lines=None):
+    """
+    Count entries/exits in a recorded video with a pool of worker processes.
+
+    Args:
+        input_video: Video file to analyse
+        summary_path: Where to write the JSON summary (defaults to <video>_summary.json)
+        output_video: Optional path for the annotated video
+        workers: Number of worker processes (defaults to the number of cores)
+        segment_seconds: Segment length; defaults to four segments per worker
+        warmup_frames: Frames decoded before each segment to rebuild the tracker state (at least 1)
+        conf: Detection confidence threshold
+        backend: Detector backend for the workers
+        lines: Counting lines (see counting_lines.parse_lines); defaults to the vertical center line
+
+    Returns:
+        The summary dict
+    """
+    if not os.path.exists(input_video):
+        print(f"Error: {input_video} not found!")
+        return None
+
+    cap = cv2.VideoCapture(input_video)
+    fps = int(cap.get(cv2.CAP_PROP_FPS)) or 30
+    width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH))
+    height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
+    total_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    if total_frames <= 0:
+        print(f"Error: could not read the frame count of {input_video}")
+        return None
+
+    lines = parse_lines(lines)
+    workers = workers or os.cpu_count() or 1
+    warmup_frames = max(1, warmup_frames)
+    if segment_seconds:
+        segment_frames = max(int(segment_seconds * fps), warmup_frames + 1)
+    else:
+        segment_frames = max(-(-total_frames // (workers * 4)), warmup_frames + 1)
+    bounds = [(start, min(start + segment_frames, total_frames))
+              for start in range(0, total_frames, segment_frames)]
+
+    print(f"Video properties: {width}x{height} @ {fps}fps, {total_frames} frames")
+    print(f"Processing {input_video} in {len(bounds)} segments on {workers} workers...")
+
+    started = time.time()
+    threads = max(1, (os.cpu_count() or 1) // workers)
+    tasks = [(i, input_video, start, end, warmup_frames, conf, bool(output_video), lines)
+             for i, (start, end) in enumerate(bounds)]
+    context = mp.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context,
+                             initializer=_init_worker, initargs=(backend, threads)) as pool:
+        segments = []
+        for segment in pool.map(_process_segment, tasks):
+            segments.append(segment)
+            print(f"Segment {segment['index'] + 1}/{len(bounds)}: frames {segment['start']}-{segment['end']} "
+                  f"in {segment['elapsed']:.1f}s, {len(segment['events'])} crossings")
+            if segment['frames'] != segment['end'] - segment['start']:
+                print(f"Warning: segment {segment['index'] + 1} read {segment['frames']} frames, "
+                      f"expected {segment['end'] - segment['start']}")
+
+        events, unique_people = stitch_segments(segments)
+        entry_count = sum(1 for e in events if e['type'] == 'entry')
+        exit_count = len(events) - entry_count
+        line_counts = {line['name']: {'entry': 0, 'exit': 0} for line in lines}
+        for event in events:
+            line_counts[event['line']][event['type']] += 1
+        processed = time.time()
+
+        if output_video:
+            print(f"Writing annotated video to {output_video}...")
+            with tempfile.TemporaryDirectory() as parts_dir:
+                annotate_tasks = []
+                entry_offset = exit_offset = 0
+                for segment in segments:
+                    id_map = segment['id_map']
+                    tracks = {f: [[x3, y3, x4, y4, id_map[id]] for x3, y3, x4, y4, id in boxes]
+                              for f, boxes in segment['tracks'].items()}
+                    crossings = {}
+                    for frame_index, kind, line, id, cx, cy in segment['events']:
+                        crossings.setdefault(frame_index, []).append((kind, line, id_map[id], cx, cy))
+                    part_path = os.path.join(parts_dir, f"part_{segment['index']:05d}.mp4")
+                    annotate_tasks.append((input_video, segment['start'], segment['end'], part_path,
+                                           tracks, crossings, entry_offset, exit_offset, fps, lines))
+                    entry_offset += sum(1 for e in segment['events'] if e[1] == 'entry')
+                    exit_offset += sum(1 for e in segment['events'] if e[1] == 'exit')
+                parts = list(pool.map(_annotate_segment, annotate_tasks))
+                _concat_videos(parts, output_video, fps, (width, height))
+
+    elapsed = time.time() - started
+    frames_processed = sum(s['frames'] for s in segments)
+    summary = {
+        'input': input_video,
+        'frames': frames_processed,
+        'fps': fps,
+        'duration_s': frames_processed / fps,
+        'resolution': [width, height],
+        'workers': workers,
+        'segments': len(segments),
+        'warmup_frames': warmup_frames,
+        'entry': entry_count,
+        'exit': exit_count,
+        'net_flow': entry_count - exit_count,
+        'lines': line_counts,
+        'unique_people': unique_people,
+        'events': [{**e, 'time_s': e['frame'] / fps} for e in events],
+        'processing_s': processed - started,
+        'elapsed_s': elapsed,
+        'realtime_factor': (frames_processed / fps) / (processed - started) if processed > started else None,
+        'output_video': output_video,
+    }
+
+    summary_path = summary_path or os.path.splitext(input_video)[0] + '_summary.json'
+    with open(summary_path, 'w') as file:
+        json.dump(summary, file, indent=2)
+
+    print(f"\nProcessing complete in {elapsed:.1f}s ({summary['realtime_factor'] or 0:.1f}x real time)")
+    print(f"Summary saved as: {summary_path}")
+    print(f"Final counts - Entry: {entry_count}, Exit: {exit_count}")
+    print(f"Total frames processed: {frames_processed}")
+    print(f"Net flow: {entry_count - exit_count}")
+    return summary
+
+
 if __name__ == "__main__":
-    entry_exit_video_processing() 
\ No newline at end of file
+    parser = argparse.ArgumentParser(description="Count entries/exits in a video")
+    parser.add_argument('--batch', metavar='VIDEO', help="Process a recorded video in parallel segments, without a window")
+    parser.add_argument('--summary', help="Path of the JSON summary (batch mode)")
+    parser.add_argument('--output', help="Also write the annotated video (batch mode)")
+    parser.add_argument('--workers', type=int, help="Worker processes (default: all cores)")
+    parser.add_argument('--segment-seconds', type=float, help="Segment length (default: four segments per worker)")
+    parser.add_argument('--warmup-frames', type=int, default=2, help="Frames decoded before each segment")
+    parser.add_argument('--backend', default='torch', choices=('torch', 'onnx', 'openvino'))
+    parser.add_argument('--lines', help="Counting lines as JSON (default: vertical center line)")
+    args = parser.parse_args()
+
+    if args.batch:
+        batch_video_processing(args.batch, args.summary, args.output, args.workers,
+                               args.segment_seconds, args.warmup_frames, backend=args.backend, lines=args.lines)
+    else:
+        entry_exit_video_processing()
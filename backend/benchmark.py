@@ -0,0 +1,306 @@
+"""
+Replay recorded or generated clips through the live counting pipeline and measure it.
+
+Each stream runs in a StreamWorker sharing one InferenceBatcher, exactly as
+PersonCounterService runs cameras, but frames come from a file instead of a
+camera. With --pace max every frame is processed as fast as the pipeline
+allows; with --pace realtime frames arrive at the clip's frame rate and the
+pipeline drops what it can't keep up with, like it does live.
+
+The result is one JSON document: throughput, capture-to-count latency
+percentiles, per-stage percentiles, CPU time and peak RSS, together with
+the configuration and machine, so runs can be compared. Detector and
+pipeline settings come from the same PERSON_COUNTER_* environment
+variables as the service, plus the flags below.
+
+    python benchmark.py clip.mp4 --streams 4 --output results.json
+    python benchmark.py --generate 600 --pace realtime
+"""
+import argparse
+import json
+import os
+import platform
+import resource
+import sys
+import tempfile
+import threading
+import time
+from typing import Any, Dict, List, Optional
+
+import cv2
+import numpy as np
+
+import person_counter_service as pcs
+from frame_source import LatestFrameCapture
+from metrics import Histogram
+from person_counter_service import PersonCounterService, StreamWorker
+
+PACES = ('max', 'realtime')
+
+
+class RecordingHistogram(Histogram):
+    """Histogram that also keeps every observation, for exact percentiles"""
+
+    def __init__(self):
+        super().__init__()
+        self.values: List[float] = []
+
+    def observe(self, seconds: float):
+        super().observe(seconds)
+        self.values.append(seconds)
+
+
+class ReplayCapture(LatestFrameCapture):
+    """
+    Frame source that replays a video file.
+
+    With pace 'max' the next frame is only decoded once the previous one was
+    read, so no frame is dropped and the pipeline sets the speed. With pace
+    'realtime' frames are published at the clip's frame rate and unread ones
+    are dropped, as with a camera.
+    """
+
+    def __init__(self, path: str, pace: str = 'max', loops: int = 1, name: Optional[str] = None):
+        super().__init__(path, name=name)
+        self.pace = pace
+        self.loops = loops
+        self.finished = threading.Event()
+        self.decode_time = RecordingHistogram()
+
+    def _capture_loop(self):
+        interval = 1.0 / self.fps if self.fps else 0.0
+        started = time.perf_counter()
+        published = 0
+        for loop in range(self.loops):
+            if loop:
+                self.cap.set(cv2.CAP_PROP_POS_FRAMES, 0)
+            while self.is_running:
+                if self.pace == 'max':
+                    with self.cond:
+                        while self.is_running and self.frame_index > self.consumed_index:
+                            self.cond.wait(timeout=0.1)
+                else:
+                    delay = started + published * interval - time.perf_counter()
+                    if delay > 0:
+                        time.sleep(delay)
+
+                decode_started = time.perf_counter()
+                ret, frame = self._read_frame()
+                if not ret:
+                    break
+                self.decode_time.observe(time.perf_counter() - decode_started)
+                with self.cond:
+                    if self.frame_index > self.consumed_index:
+                        self.frames_dropped += 1
+                    self.frame = frame
+                    self.captured_at = time.time()
+                    self.frame_index += 1
+                    self.frames_captured += 1
+                    self.cond.notify_all()
+                published += 1
+        self.finished.set()
+
+    def read(self, timeout: float = 1.0):
+        result = super().read(timeout)
+        if result is not None and self.pace == 'max':
+            # Let the decoder go on to the next frame
+            with self.cond:
+                self.cond.notify_all()
+        return result
+
+
+class ReplayWorker(StreamWorker):
+    """StreamWorker fed from a ReplayCapture, with exact latency recording"""
+
+    def __init__(self, zone: str, path: str, batcher, pace: str, loops: int, **kwargs):
+        super().__init__(zone, path, batcher, **kwargs)
+        self.pace = pace
+        self.loops = loops
+        self.latency = RecordingHistogram()
+        for stage in self.stages.histograms:
+            self.stages.histograms[stage] = RecordingHistogram()
+        self.previews.encode_time = self.stages.histograms['encode']
+
+    def _create_capture(self):
+        return ReplayCapture(self.stream_url, pace=self.pace, loops=self.loops, name=self.zone)
+
+
+def generate_clip(path: str, frames: int, width: int = 1280, height: int = 720, fps: int = 30,
+                  people: int = 12, seed: int = 0) -> str:
+    """
+    Write a synthetic clip of person-sized figures walking across a textured background.
+
+    The detector won't recognize most of them, but every frame costs the
+    same decoding, inference and tracking as real footage of that size.
+    """
+    rng = np.random.default_rng(seed)
+    background = cv2.GaussianBlur(rng.integers(0, 255, (height, width, 3), dtype=np.uint8), (0, 0), 8)
+    positions = rng.uniform([0, height * 0.3], [width, height * 0.9], size=(people, 2))
+    velocities = rng.uniform(-4, 4, size=(people, 2)) * [1, 0.3]
+    colors = rng.integers(0, 255, size=(people, 3))
+
+    writer = cv2.VideoWriter(path, cv2.VideoWriter_fourcc(*'mp4v'), fps, (width, height))
+    for _ in range(frames):
+        frame = background.copy()
+        for (x, y), color in zip(positions.astype(int), colors.tolist()):
+            cv2.ellipse(frame, (x, y - 95), (14, 18), 0, 0, 360, color, -1)
+            cv2.rectangle(frame, (x - 22, y - 78), (x + 22, y), color, -1)
+        writer.write(frame)
+        positions += velocities
+        positions[:, 0] %= width
+        positions[:, 1] = np.clip(positions[:, 1], height * 0.3, height * 0.9)
+    writer.release()
+    return path
+
+
+def _percentiles(values: List[float], skip: int = 0) -> Optional[Dict[str, float]]:
+    data = np.asarray(values[skip:], dtype=np.float64) * 1000
+    if not len(data):
+        return None
+    p50, p95, p99 = np.percentile(data, [50, 95, 99])
+    return {'p50_ms': float(p50), 'p95_ms': float(p95), 'p99_ms': float(p99), 'mean_ms': float(data.mean()),
+            'max_ms': float(data.max()), 'samples': int(len(data))}
+
+
+def run_benchmark(path: str, streams: int = 1, pace: str = 'max', loops: int = 1, warmup_frames: int = 30,
+                  batch_size: int = pcs.INFERENCE_BATCH_SIZE, **worker_options) -> Dict[str, Any]:
+    """Replay the clip on every stream at once and measure the pipeline"""
+    service = PersonCounterService(batch_size=batch_size, execution_mode='thread')
+    if not service.initialize_model():
+        raise RuntimeError(f"Failed to initialize the detector: {service.init_error}")
+
+    workers = [ReplayWorker(f'bench-{i + 1}', path, service.batcher, pace, loops, **worker_options)
+               for i in range(streams)]
+    usage_before = resource.getrusage(resource.RUSAGE_SELF)
+    started = time.perf_counter()
+    for worker in workers:
+        worker.start()
+
+    # Done when every clip has been read to the end and its last frame was counted. A frame that
+    # failed is never counted, so a stream that made no progress for a few seconds is done too.
+    progress, finished_at = None, time.perf_counter()
+    while any(worker.processing_thread.is_alive() for worker in workers):
+        completed = [worker.latency.count for worker in workers]
+        if completed != progress:
+            progress, finished_at = completed, time.perf_counter()
+        read_all = all(worker.capture and worker.capture.finished.is_set()
+                       and worker.capture.consumed_index >= worker.capture.frame_index for worker in workers)
+        if read_all and (all(worker.latency.count >= worker.frame_count for worker in workers)
+                         or time.perf_counter() - finished_at > 5):
+            break
+        time.sleep(0.01)
+    elapsed = finished_at - started
+    usage_after = resource.getrusage(resource.RUSAGE_SELF)
+    for worker in workers:
+        worker.stop()
+    service.batcher.stop()
+
+    frames = sum(worker.frame_count for worker in workers)
+    latencies = [value for worker in workers for value in worker.latency.values[warmup_frames:]]
+    stages = {}
+    for stage in workers[0].stages.histograms:
+        values = [value for worker in workers for value in getattr(worker.stages.histograms[stage], 'values', [])]
+        stats = _percentiles(values)
+        if stats:
+            stages[stage] = stats
+
+    user = usage_after.ru_utime - usage_before.ru_utime
+    system = usage_after.ru_stime - usage_before.ru_stime
+    return {
+        'frames': frames,
+        'frames_dropped': sum(worker.capture.frames_dropped for worker in workers),
+        'wall_s': elapsed,
+        'fps': frames / elapsed if elapsed else 0.0,
+        'fps_per_stream': frames / elapsed / streams if elapsed else 0.0,
+        'latency': _percentiles(latencies),
+        'stages': stages,
+        'cpu': {'user_s': user, 'system_s': system, 'cores_used': (user + system) / elapsed if elapsed else 0.0},
+        # ru_maxrss is kilobytes on Linux and bytes on macOS
+        'peak_rss_mb': usage_after.ru_maxrss / (1024 * 1024 if sys.platform == 'darwin' else 1024),
+        'counts': {worker.zone: worker.get_counts() for worker in workers},
+        'inference': service.batcher.get_stats(),
+    }
+
+
+def _configuration(args, path: str) -> Dict[str, Any]:
+    """Everything that affects the numbers, so runs can be told apart"""
+    capture = cv2.VideoCapture(path)
+    clip = {
+        'path': path,
+        'width': int(capture.get(cv2.CAP_PROP_FRAME_WIDTH)),
+        'height': int(capture.get(cv2.CAP_PROP_FRAME_HEIGHT)),
+        'fps': capture.get(cv2.CAP_PROP_FPS),
+        'frames': int(capture.get(cv2.CAP_PROP_FRAME_COUNT)),
+    }
+    capture.release()
+    return {
+        'clip': clip,
+        'streams': args.streams,
+        'pace': args.pace,
+        'loops': args.loops,
+        'warmup_frames': args.warmup_frames,
+        'batch_size': args.batch_size,
+        'detector': {'backend': pcs.DETECTOR_BACKEND, 'model': pcs.DETECTOR_MODEL, 'int8': pcs.DETECTOR_INT8},
+        'imgsz': args.imgsz,
+        'detect_every': args.detect_every,
+        'tile_size': args.tile_size,
+        'motion_gate': args.motion_gate,
+        'target_fps': args.target_fps,
+        'env': {key: value for key, value in sorted(os.environ.items()) if key.startswith('PERSON_COUNTER_')},
+    }
+
+
+def _machine() -> Dict[str, Any]:
+    return {
+        'platform': platform.platform(),
+        'processor': platform.processor() or platform.machine(),
+        'cpu_count': os.cpu_count(),
+        'python': platform.python_version(),
+        'opencv': cv2.__version__,
+        'opencv_threads': cv2.getNumThreads(),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark the live counting pipeline on recorded or generated video")
+    parser.add_argument('video', nargs='?', help="Clip to replay")
+    parser.add_argument('--generate', type=int, metavar='FRAMES', help="Replay a generated clip of this many frames")
+    parser.add_argument('--streams', type=int, default=1, help="Streams replaying the clip at the same time")
+    parser.add_argument('--pace', default='max', choices=PACES, help="As fast as possible, or at the clip's frame rate")
+    parser.add_argument('--loops', type=int, default=1, help="Times to play the clip per stream")
+    parser.add_argument('--warmup-frames', type=int, default=30, help="Frames per stream left out of the latency")
+    parser.add_argument('--batch-size', type=int, default=pcs.INFERENCE_BATCH_SIZE)
+    parser.add_argument('--imgsz', type=int, default=pcs.DETECTOR_IMGSZ)
+    parser.add_argument('--detect-every', type=int, default=pcs.DETECT_EVERY)
+    parser.add_argument('--tile-size', type=int, default=pcs.TILE_SIZE)
+    parser.add_argument('--motion-gate', action='store_true', default=pcs.MOTION_GATE)
+    parser.add_argument('--target-fps', type=float, default=pcs.TARGET_FPS,
+                        help="Adapt the detector input size to this frame rate (0 keeps it fixed)")
+    parser.add_argument('--output', help="Path of the JSON results (default: print them)")
+    args = parser.parse_args()
+
+    if not args.video and not args.generate:
+        parser.error("give a video to replay or --generate FRAMES")
+
+    # A generated clip only lives for the run
+    with tempfile.TemporaryDirectory(prefix='crowdshield-bench-') as scratch:
+        path = args.video or generate_clip(os.path.join(scratch, 'generated.mp4'), args.generate)
+        results = run_benchmark(path, streams=args.streams, pace=args.pace, loops=args.loops,
+                                warmup_frames=args.warmup_frames, batch_size=args.batch_size,
+                                imgsz=args.imgsz, detect_every=args.detect_every, tile_size=args.tile_size,
+                                motion_gate=args.motion_gate, target_fps=args.target_fps)
+        report = {
+            'timestamp': time.time(),
+            'configuration': _configuration(args, path),
+            'machine': _machine(),
+            'results': results,
+        }
+
+    text = json.dumps(report, indent=2, default=str)
+    if args.output:
+        with open(args.output, 'w') as f:
+            f.write(text + '\n')
+        print(f"FPS: {results['fps']:.1f} ({results['frames']} frames in {results['wall_s']:.1f}s), "
+              f"results written to {args.output}")
+    else:
+        print(text)
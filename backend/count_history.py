@@ -0,0 +1,134 @@
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence, Tuple
+
+import numpy as np
+
+# (bucket length in seconds, number of buckets kept): 1 hour of seconds, 1 day of minutes, 30 days of hours
+LEVELS = ((1, 3600), (60, 1440), (3600, 720))
+
+COLUMNS = ('timestamp', 'min_density', 'max_density', 'mean_density', 'entries', 'exits', 'samples')
+
+
+class _Level:
+    """One resolution of the history: a ring of fixed-length time buckets in flat arrays"""
+
+    def __init__(self, resolution: int, size: int):
+        self.resolution = resolution
+        self.size = size
+        self.bucket = np.full(size, -1, dtype=np.int64)
+        self.samples = np.zeros(size, dtype=np.int64)
+        self.min = np.zeros(size, dtype=np.int32)
+        self.max = np.zeros(size, dtype=np.int32)
+        self.sum = np.zeros(size, dtype=np.float64)
+        self.entries = np.zeros(size, dtype=np.int64)
+        self.exits = np.zeros(size, dtype=np.int64)
+
+    def add(self, now: float, density: int, entries: int, exits: int):
+        bucket = int(now // self.resolution)
+        slot = bucket % self.size
+        if self.bucket[slot] != bucket:
+            # The slot still holds a bucket from one lap ago; start it over
+            self.bucket[slot] = bucket
+            self.samples[slot] = 0
+            self.min[slot] = density
+            self.max[slot] = density
+            self.sum[slot] = 0.0
+            self.entries[slot] = 0
+            self.exits[slot] = 0
+        elif density < self.min[slot]:
+            self.min[slot] = density
+        elif density > self.max[slot]:
+            self.max[slot] = density
+        self.samples[slot] += 1
+        self.sum[slot] += density
+        self.entries[slot] += entries
+        self.exits[slot] += exits
+
+    def covers(self, start: float, now: float) -> bool:
+        """Whether the window start is still retained at this resolution"""
+        return int(start // self.resolution) > int(now // self.resolution) - self.size
+
+    def window(self, start: float, end: float) -> np.ndarray:
+        """Rows of COLUMNS for the filled buckets in [start, end], oldest first"""
+        first, last = int(start // self.resolution), int(end // self.resolution)
+        buckets = np.arange(max(first, last - self.size + 1), last + 1)
+        slots = buckets % self.size
+        filled = self.bucket[slots] == buckets
+        slots = slots[filled]
+        samples = self.samples[slots]
+        return np.column_stack([
+            buckets[filled] * self.resolution,
+            self.min[slots],
+            self.max[slots],
+            self.sum[slots] / np.maximum(samples, 1),
+            self.entries[slots],
+            self.exits[slots],
+            samples,
+        ])
+
+
+class CountHistory:
+    """
+    Fixed-memory history of a zone's density and crossings.
+
+    Every processed frame is added to a 1 s, a 1 min and a 1 h ring of
+    buckets at once, so the coarser rollups are always up to date and
+    nothing has to be aggregated at query time. Each bucket keeps the
+    min, max and mean density and the entries and exits in it. Memory is
+    fixed by LEVELS: old buckets are overwritten as time moves on.
+    """
+
+    def __init__(self, levels: Sequence[Tuple[int, int]] = LEVELS):
+        self.levels = [_Level(resolution, size) for resolution, size in levels]
+        self.lock = threading.Lock()
+
+    def record(self, density: int, entries: int = 0, exits: int = 0, now: Optional[float] = None):
+        """Add one frame's density and the crossings counted in it"""
+        now = time.time() if now is None else now
+        with self.lock:
+            for level in self.levels:
+                level.add(now, density, entries, exits)
+
+    def bucket(self, at: float, resolution: int = 1) -> Optional[Dict[str, float]]:
+        """The bucket containing the time at the given resolution as a COLUMNS dict, or None if it is empty"""
+        level = next(level for level in self.levels if level.resolution == resolution)
+        with self.lock:
+            rows = level.window(at, at)
+        return dict(zip(COLUMNS, rows[0].tolist())) if len(rows) else None
+
+    def query(self, start: Optional[float] = None, end: Optional[float] = None,
+              resolution: Optional[int] = None, max_points: int = 1000) -> Dict[str, Any]:
+        """
+        Buckets between start and end (epoch seconds; default the last hour).
+
+        Without a resolution, the finest one that still covers the window
+        in at most max_points buckets is used. Buckets without frames are
+        left out. Rows follow COLUMNS.
+
+        Raises:
+            ValueError: if the resolution is not one of the kept ones
+        """
+        now = time.time()
+        end = now if end is None else min(end, now)
+        start = end - 3600 if start is None else start
+
+        if resolution is not None:
+            level = next((level for level in self.levels if level.resolution == resolution), None)
+            if level is None:
+                raise ValueError(f"Unknown resolution {resolution}s, expected one of "
+                                 f"{', '.join(str(level.resolution) for level in self.levels)}")
+        else:
+            level = next((level for level in self.levels
+                          if level.covers(start, now) and (end - start) / level.resolution <= max_points),
+                         self.levels[-1])
+
+        with self.lock:
+            rows = level.window(start, end)
+        return {
+            'resolution_s': level.resolution,
+            'start': start,
+            'end': end,
+            'columns': list(COLUMNS),
+            'data': rows.tolist(),
+        }
@@ -0,0 +1,146 @@
+import asyncio
+import threading
+import time
+import logging
+from collections import deque
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+
+async def ensure_timeseries_collection(database, name: str, retention_days: Optional[int] = None):
+    """Create the time-series collection for count samples if it doesn't exist yet"""
+    options = {'timeseries': {'timeField': 'timestamp', 'metaField': 'zone', 'granularity': 'seconds'}}
+    if retention_days:
+        options['expireAfterSeconds'] = retention_days * 86400
+    try:
+        if name not in await database.list_collection_names():
+            await database.create_collection(name, **options)
+    except Exception as e:
+        # Another process may have created it in the meantime, or the database is down; writes retry later
+        logger.warning(f"Could not create time-series collection {name}: {e}")
+    return database.get_collection(name)
+
+
+class CountWriter:
+    """
+    Buffers per-zone count samples and writes them to MongoDB in batches.
+
+    submit() is called from the counting threads. It only appends to an
+    in-memory deque under a lock, so it never waits on the database. The
+    deque is bounded: when the database falls behind, the oldest samples
+    are dropped and counted instead of growing memory or stalling counting.
+
+    run() is an asyncio task on the server's event loop. It flushes with
+    one insert_many whenever batch_size samples are waiting or every
+    flush_interval seconds. Only one insert is in flight at a time, and a
+    failed batch goes back to the front of the queue for the next flush.
+    """
+
+    def __init__(self, collection, batch_size: int = 500, flush_interval: float = 5.0, max_queue: int = 20000):
+        self.collection = collection
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self.max_queue = max_queue
+        self.queue = deque()
+        self.lock = threading.Lock()
+
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.wake: Optional[asyncio.Event] = None
+        self.running = False
+        self.task = None
+
+        self.written = 0
+        self.dropped = 0
+        self.failures = 0
+        self.last_flush = None
+        self.last_error = None
+
+    def submit(self, sample: Dict[str, Any]) -> bool:
+        """Queue a sample without blocking; returns False if the queue was full and an old sample was dropped"""
+        with self.lock:
+            dropped = len(self.queue) >= self.max_queue
+            if dropped:
+                self.queue.popleft()
+                self.dropped += 1
+            self.queue.append(sample)
+            full = len(self.queue) >= self.batch_size
+        if full and self.loop and self.wake and not self.wake.is_set():
+            self.loop.call_soon_threadsafe(self.wake.set)
+        return not dropped
+
+    async def run(self):
+        """Flush batches until stop() is called"""
+        self.loop = asyncio.get_running_loop()
+        self.wake = asyncio.Event()
+        self.running = True
+        while self.running:
+            try:
+                await asyncio.wait_for(self.wake.wait(), timeout=self.flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self.wake.clear()
+            await self.flush()
+
+    def start(self):
+        """Start the flush task on the running event loop"""
+        self.task = asyncio.get_running_loop().create_task(self.run())
+        return self.task
+
+    async def stop(self):
+        """Stop the flush task and write what is still queued"""
+        self.running = False
+        if self.wake:
+            self.wake.set()
+        if self.task:
+            await self.task
+        await self.flush()
+
+    def _take(self) -> list:
+        with self.lock:
+            count = min(self.batch_size, len(self.queue))
+            return [self.queue.popleft() for _ in range(count)]
+
+    def _requeue(self, batch: list):
+        """Put a failed batch back in front, dropping the oldest samples if the queue is full"""
+        with self.lock:
+            room = self.max_queue - len(self.queue)
+            if room < len(batch):
+                self.dropped += len(batch) - max(room, 0)
+                batch = batch[len(batch) - max(room, 0):]
+            self.queue.extendleft(reversed(batch))
+
+    async def flush(self):
+        """Write everything queued, one batch at a time; stops at the first failed batch"""
+        while True:
+            batch = self._take()
+            if not batch:
+                return
+            documents = [
+                {**sample, 'timestamp': datetime.fromtimestamp(sample['timestamp'], tz=timezone.utc)}
+                for sample in batch
+            ]
+            try:
+                await self.collection.insert_many(documents, ordered=False)
+            except Exception as e:
+                self.failures += 1
+                self.last_error = str(e)
+                logger.error(f"Failed to write {len(batch)} count samples: {e}")
+                self._requeue(batch)
+                return
+            self.written += len(batch)
+            self.last_flush = time.time()
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Queue depth and write totals"""
+        with self.lock:
+            queued = len(self.queue)
+        return {
+            'queued': queued,
+            'written': self.written,
+            'dropped': self.dropped,
+            'failures': self.failures,
+            'last_flush': self.last_flush,
+            'last_error': self.last_error,
+        }
@@ -0,0 +1,161 @@
+import cv2
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from geometry import scale_points
+
+LineSpec = Dict[str, Any]
+
+
+def default_lines() -> List[LineSpec]:
+    """The original counting line: vertical through the middle of the frame, left to right is an entry"""
+    return [{'name': 'center', 'points': [[0.5, 0.0], [0.5, 1.0]]}]
+
+
+def parse_lines(spec: Union[None, str, Sequence[LineSpec]]) -> List[LineSpec]:
+    """
+    Validate a line configuration.
+
+    Each line is {"name": ..., "points": [[x, y], ...], "invert": false}
+    with two or more points (a polyline), in pixels or fractions of the
+    frame (see geometry.scale_points). A crossing counts as an entry when it matches the default line's
+    direction: for a line drawn top to bottom, left-to-right movement is
+    an entry. Rotating the line rotates the direction with it, and
+    "invert" swaps entry and exit.
+
+    Raises:
+        ValueError: if the configuration is malformed
+    """
+    if spec is None or spec == '':
+        return default_lines()
+    if isinstance(spec, str):
+        spec = json.loads(spec)
+    if not isinstance(spec, (list, tuple)) or not spec:
+        raise ValueError("Counting lines must be a non-empty list")
+
+    lines = []
+    names = set()
+    for i, line in enumerate(spec):
+        if not isinstance(line, dict):
+            raise ValueError(f"Counting line {i} must be an object with 'points'")
+        points = np.asarray(line.get('points', []), dtype=np.float64)
+        if points.ndim != 2 or points.shape[1] != 2 or len(points) < 2:
+            raise ValueError(f"Counting line {i} needs at least two [x, y] points")
+        name = str(line.get('name') or f'line{i + 1}')
+        if name in names:
+            raise ValueError(f"Duplicate counting line name '{name}'")
+        names.add(name)
+        lines.append({'name': name, 'points': points.tolist(), 'invert': bool(line.get('invert', False))})
+    return lines
+
+
+class LineCounter:
+    """
+    Counts crossings of every track over every counting line in one pass.
+
+    All polyline segments of all lines are flattened into arrays. Each
+    frame, every track's movement since the previous frame is tested
+    against every segment with vectorized orientation tests. The signed
+    crossings are then summed per (track, line), so a movement through a
+    polyline vertex counts once, and one that goes in and back out
+    between two frames cancels out.
+    """
+
+    def __init__(self, lines: Sequence[LineSpec], width: int, height: int,
+                 source_size: Optional[Tuple[int, int]] = None):
+        self.names = [line['name'] for line in lines]
+        self.width = width
+        self.height = height
+
+        starts, ends, owners, polylines = [], [], [], []
+        for index, line in enumerate(lines):
+            points = scale_points(line['points'], width, height, source_size)
+            if line.get('invert'):
+                points = points[::-1]
+            polylines.append(points.round().astype(np.int32))
+            starts.append(points[:-1])
+            ends.append(points[1:])
+            owners.append(np.full(len(points) - 1, index))
+
+        self.polylines = polylines
+        self.seg_start = np.concatenate(starts)
+        self.seg_dir = np.concatenate(ends) - self.seg_start
+        owner = np.concatenate(owners)
+        # Segment-to-line incidence, to sum segment crossings per line with one matmul
+        self.seg_line = np.zeros((len(owner), len(lines)), dtype=np.int64)
+        self.seg_line[np.arange(len(owner)), owner] = 1
+
+        self.entries = np.zeros(len(lines), dtype=np.int64)
+        self.exits = np.zeros(len(lines), dtype=np.int64)
+        self.prev_ids = np.empty(0, dtype=np.int64)
+        self.prev_centers = np.empty((0, 2), dtype=np.float64)
+
+    @staticmethod
+    def _cross(u: np.ndarray, v: np.ndarray) -> np.ndarray:
+        return u[..., 0] * v[..., 1] - u[..., 1] * v[..., 0]
+
+    def update(self, tracks: Sequence[Sequence[int]]) -> List[Tuple[str, str, int, int, int]]:
+        """
+        Count crossings between the previous frame's tracks and these ones.
+
+        Args:
+            tracks: [x1, y1, x2, y2, id] rows as returned by the trackers
+
+        Returns:
+            (kind, line name, person id, cx, cy) for every crossing this frame
+        """
+        data = np.asarray(tracks, dtype=np.int64).reshape(-1, 5)
+        ids = data[:, 4]
+        centers = np.column_stack([(data[:, 0] + data[:, 2]) // 2, (data[:, 1] + data[:, 3]) // 2])
+
+        _, cur, prev = np.intersect1d(ids, self.prev_ids, assume_unique=True, return_indices=True)
+        prev_centers = self.prev_centers
+        self.prev_ids = ids
+        self.prev_centers = centers.astype(np.float64)
+        if len(cur) == 0:
+            return []
+
+        p = prev_centers[prev][:, None, :]
+        q = centers[cur].astype(np.float64)[:, None, :]
+        a = self.seg_start[None]
+        d = self.seg_dir[None]
+
+        # Side of each segment the track was on before and is on now
+        side_p = self._cross(d, p - a)
+        side_q = self._cross(d, q - a)
+        # Segment ends on opposite sides of the movement (or touching it)
+        motion = q - p
+        within = self._cross(motion, a - p) * self._cross(motion, a + d - p) <= 0
+
+        entry = (side_p > 0) & (side_q <= 0) & within
+        exit_ = (side_p < 0) & (side_q >= 0) & within
+        net = (entry.astype(np.int64) - exit_.astype(np.int64)) @ self.seg_line
+
+        rows, lines = np.nonzero(net)
+        crossings = []
+        for row, line in zip(rows.tolist(), lines.tolist()):
+            kind = 'entry' if net[row, line] > 0 else 'exit'
+            if kind == 'entry':
+                self.entries[line] += 1
+            else:
+                self.exits[line] += 1
+            cx, cy = centers[cur[row]].tolist()
+            crossings.append((kind, self.names[line], int(ids[cur[row]]), cx, cy))
+        return crossings
+
+    def get_counts(self) -> Dict[str, Dict[str, int]]:
+        """Entry/exit counts per line"""
+        return {name: {'entry': int(self.entries[i]), 'exit': int(self.exits[i])}
+                for i, name in enumerate(self.names)}
+
+    def draw(self, frame: np.ndarray, color=(255, 255, 255), thickness: int = 3) -> np.ndarray:
+        """Draw every line with its name onto the frame in place"""
+        cv2.polylines(frame, self.polylines, False, color, thickness)
+        if len(self.polylines) > 1:
+            for name, points in zip(self.names, self.polylines):
+                x, y = points[0]
+                cv2.putText(frame, name, (int(x) + 5, max(15, int(y) + 15)),
+                            cv2.FONT_HERSHEY_SIMPLEX, 0.5, color, 1)
+        return frame
@@ -0,0 +1,81 @@
+import os
+import logging
+from functools import lru_cache
+from typing import Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+CLASS_NAMES_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'object_class.names')
+
+
+@lru_cache(maxsize=None)
+def load_class_names(path: str = CLASS_NAMES_FILE) -> Tuple[str, ...]:
+    """Load class names for YOLO detection once per file"""
+    try:
+        with open(path, 'r') as file:
+            return tuple(file.read().split('\n'))
+    except Exception as e:
+        # Default COCO classes (person is index 0)
+        logger.warning(f"Could not load class names from {path}: {e}")
+        return ('person',)
+
+
+@lru_cache(maxsize=None)
+def person_class_ids(path: str = CLASS_NAMES_FILE) -> Tuple[int, ...]:
+    """Indices of the classes that count as a person"""
+    return tuple(i for i, name in enumerate(load_class_names(path)) if 'person' in name.lower())
+
+
+def decode_detections(result, conf: float = 0.5,
+                      classes: Sequence[int] = None) -> np.ndarray:
+    """
+    Filter a single YOLO result by confidence and class in one vectorized pass.
+
+    Returns:
+        (N, 5) float32 array of [x1, y1, x2, y2, score]
+    """
+    if result is None or result.boxes is None:
+        return np.empty((0, 5), dtype=np.float32)
+
+    data = result.boxes.data
+    if hasattr(data, 'cpu'):
+        data = data.cpu().numpy()
+    data = np.asarray(data, dtype=np.float32)
+    if data.size == 0:
+        return np.empty((0, 5), dtype=np.float32)
+
+    if classes is None:
+        classes = person_class_ids()
+    mask = (data[:, 4] > conf) & np.isin(data[:, 5].astype(np.int64), classes)
+    return data[mask, :5]
+
+
+def decode_person_boxes(result, conf: float = 0.5,
+                        classes: Sequence[int] = None) -> np.ndarray:
+    """
+    Extract person boxes from a single YOLO result in one vectorized pass.
+
+    Args:
+        result: One entry of the list returned by model.predict
+        conf: Minimum confidence to keep a box
+        classes: Class ids to keep, defaults to the person classes
+
+    Returns:
+        (N, 4) int32 array of [x1, y1, x2, y2], ready for Tracker.update
+    """
+    return decode_detections(result, conf, classes)[:, :4].astype(np.int32)
+
+
+def box_iou(a: np.ndarray, b: np.ndarray) -> np.ndarray:
+    """Pairwise IoU between (N, 4) and (M, 4) arrays of [x1, y1, x2, y2]"""
+    a = np.asarray(a, dtype=np.float32).reshape(-1, 4)
+    b = np.asarray(b, dtype=np.float32).reshape(-1, 4)
+    top_left = np.maximum(a[:, None, :2], b[None, :, :2])
+    bottom_right = np.minimum(a[:, None, 2:], b[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    area_a = (a[:, 2:] - a[:, :2]).prod(axis=1)
+    area_b = (b[:, 2:] - b[:, :2]).prod(axis=1)
+    union = area_a[:, None] + area_b[None, :] - intersection
+    return np.where(union > 0, intersection / np.maximum(union, 1e-9), 0.0)
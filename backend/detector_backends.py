@@ -0,0 +1,294 @@
+"""
+Pluggable CPU detector backends.
+
+The PyTorch model can be exported once to ONNX Runtime or OpenVINO, optionally
+quantized to INT8 with calibration frames taken from our own footage, and the
+exported artifact is cached. Every backend is loaded through ultralytics'
+YOLO wrapper, so callers keep using model.predict() unchanged.
+
+Usage:
+    python detector_backends.py --source zone4.mp4 --backends torch onnx openvino --int8
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import time
+from typing import Any, Dict, List, Optional, Sequence
+
+import cv2
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from ultralytics import YOLO
+
+from detections import box_iou, decode_person_boxes, person_class_ids
+
+logger = logging.getLogger(__name__)
+
+BACKENDS = ('torch', 'onnx', 'openvino')
+MODEL_CACHE_DIR = os.getenv("MODEL_CACHE_DIR",
+                            os.path.join(os.path.dirname(os.path.abspath(__file__)), 'model_cache'))
+CALIBRATION_FRAMES = 300
+
+
+def load_calibration_frames(source: str, count: int = CALIBRATION_FRAMES) -> List[np.ndarray]:
+    """Sample frames evenly from a video file or a directory of images"""
+    if os.path.isdir(source):
+        names = sorted(n for n in os.listdir(source)
+                       if n.lower().endswith(('.jpg', '.jpeg', '.png', '.bmp')))
+        step = max(1, len(names) // count)
+        frames = [cv2.imread(os.path.join(source, n)) for n in names[::step][:count]]
+        return [f for f in frames if f is not None]
+
+    cap = cv2.VideoCapture(source)
+    total = int(cap.get(cv2.CAP_PROP_FRAME_COUNT)) or count
+    step = max(1, total // count)
+    frames = []
+    index = 0
+    while len(frames) < count:
+        ret = cap.grab()
+        if not ret:
+            break
+        if index % step == 0:
+            ret, frame = cap.retrieve()
+            if ret:
+                frames.append(frame)
+        index += 1
+    cap.release()
+    return frames
+
+
+def letterbox_tensor(frame: np.ndarray, imgsz: int) -> np.ndarray:
+    """Preprocess a BGR frame the way YOLO does: letterbox, RGB, CHW, 0-1 float, batch of one"""
+    h, w = frame.shape[:2]
+    scale = min(imgsz / h, imgsz / w)
+    nh, nw = int(round(h * scale)), int(round(w * scale))
+    canvas = np.full((imgsz, imgsz, 3), 114, dtype=np.uint8)
+    top, left = (imgsz - nh) // 2, (imgsz - nw) // 2
+    canvas[top:top + nh, left:left + nw] = cv2.resize(frame, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    tensor = canvas[:, :, ::-1].transpose(2, 0, 1).astype(np.float32) / 255.0
+    return np.ascontiguousarray(tensor[None])
+
+
+def _cache_path(model_path: str, backend: str, imgsz: int, int8: bool) -> str:
+    """Location of the cached export for a model/backend/size/precision combination"""
+    stem = os.path.splitext(os.path.basename(model_path))[0]
+    suffix = f"{stem}_{imgsz}{'_int8' if int8 else ''}"
+    if backend == 'onnx':
+        return os.path.join(MODEL_CACHE_DIR, f"{suffix}.onnx")
+    return os.path.join(MODEL_CACHE_DIR, f"{suffix}_openvino_model")
+
+
+def _export(model_path: str, backend: str, imgsz: int) -> str:
+    """Export the FP32 model with ultralytics and move it into the cache"""
+    target = _cache_path(model_path, backend, imgsz, False)
+    if os.path.exists(target):
+        return target
+
+    os.makedirs(MODEL_CACHE_DIR, exist_ok=True)
+    logger.info(f"Exporting {model_path} to {backend} at {imgsz}px...")
+    # Dynamic axes so batched predict and other input sizes keep working
+    exported = YOLO(model_path).export(format=backend, imgsz=imgsz, half=False, int8=False, dynamic=True)
+    shutil.move(str(exported), target)
+    return target
+
+
+def _quantize_onnx(fp32_path: str, target: str, frames: Sequence[np.ndarray], imgsz: int):
+    """Static INT8 quantization with ONNX Runtime, calibrated on our frames"""
+    import onnx
+    import onnxruntime
+    from onnxruntime.quantization import CalibrationDataReader, QuantType, quantize_static
+
+    input_name = onnxruntime.InferenceSession(fp32_path, providers=['CPUExecutionProvider']).get_inputs()[0].name
+
+    class FrameReader(CalibrationDataReader):
+        def __init__(self):
+            self.frames = iter(frames)
+
+        def get_next(self):
+            frame = next(self.frames, None)
+            return None if frame is None else {input_name: letterbox_tensor(frame, imgsz)}
+
+    quantize_static(fp32_path, target, FrameReader(),
+                    weight_type=QuantType.QInt8, activation_type=QuantType.QUInt8, per_channel=True)
+
+    # Keep the ultralytics metadata (stride, names, imgsz) so YOLO can load the quantized model
+    source_model = onnx.load(fp32_path)
+    quantized = onnx.load(target)
+    del quantized.metadata_props[:]
+    quantized.metadata_props.extend(source_model.metadata_props)
+    onnx.save(quantized, target)
+
+
+def _quantize_openvino(fp32_dir: str, target: str, frames: Sequence[np.ndarray], imgsz: int):
+    """Post-training INT8 quantization with NNCF, calibrated on our frames"""
+    import nncf
+    import openvino as ov
+
+    xml = next(n for n in os.listdir(fp32_dir) if n.endswith('.xml'))
+    core = ov.Core()
+    model = core.read_model(os.path.join(fp32_dir, xml))
+    dataset = nncf.Dataset(list(frames), lambda frame: letterbox_tensor(frame, imgsz))
+    quantized = nncf.quantize(model, dataset, preset=nncf.QuantizationPreset.MIXED, subset_size=len(frames))
+
+    os.makedirs(target, exist_ok=True)
+    ov.save_model(quantized, os.path.join(target, xml))
+    # YOLO reads stride, names and imgsz from the export's metadata.yaml
+    metadata = os.path.join(fp32_dir, 'metadata.yaml')
+    if os.path.exists(metadata):
+        shutil.copy(metadata, target)
+
+
+def prepare_model_path(backend: str = 'torch', model_path: str = 'yolov8s.pt', imgsz: int = 640,
+                       int8: bool = False, calibration_source: Optional[str] = None) -> str:
+    """
+    Path of a model artifact for the backend, exporting and quantizing on first use.
+
+    Args:
+        backend: 'torch', 'onnx' or 'openvino'
+        model_path: PyTorch weights to export from
+        imgsz: Export input size
+        int8: Quantize to INT8 (onnx/openvino only)
+        calibration_source: Video file or image directory with our own footage for INT8 calibration
+
+    Returns:
+        Path that YOLO() can load
+    """
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown detector backend '{backend}', expected one of {', '.join(BACKENDS)}")
+    if backend == 'torch':
+        return model_path
+
+    fp32_path = _export(model_path, backend, imgsz)
+    if not int8:
+        return fp32_path
+
+    target = _cache_path(model_path, backend, imgsz, True)
+    if os.path.exists(target):
+        return target
+    if not calibration_source:
+        raise ValueError("INT8 quantization needs a calibration_source with footage from our cameras")
+
+    frames = load_calibration_frames(calibration_source)
+    if not frames:
+        raise ValueError(f"No calibration frames could be read from {calibration_source}")
+    logger.info(f"Quantizing {backend} model to INT8 with {len(frames)} calibration frames...")
+    if backend == 'onnx':
+        _quantize_onnx(fp32_path, target, frames, imgsz)
+    else:
+        _quantize_openvino(fp32_path, target, frames, imgsz)
+    return target
+
+
+def load_detector(backend: str = 'torch', model_path: str = 'yolov8s.pt', imgsz: int = 640,
+                  int8: bool = False, calibration_source: Optional[str] = None) -> YOLO:
+    """Load the person detector for a backend; the result is used through model.predict()"""
+    path = prepare_model_path(backend, model_path, imgsz, int8, calibration_source)
+    logger.info(f"Loading {backend}{' INT8' if int8 else ''} detector from {path}")
+    return YOLO(path, task='detect')
+
+
+def _agreement(baseline: List[np.ndarray], candidate: List[np.ndarray], iou_threshold: float = 0.5) -> Dict[str, float]:
+    """Box agreement of a candidate backend with the baseline, matched by IoU"""
+    matched = baseline_total = candidate_total = 0
+    ious = []
+    for base, cand in zip(baseline, candidate):
+        baseline_total += len(base)
+        candidate_total += len(cand)
+        if len(base) == 0 or len(cand) == 0:
+            continue
+        iou = box_iou(base, cand)
+        rows, cols = linear_sum_assignment(-iou)
+        good = iou[rows, cols] >= iou_threshold
+        matched += int(good.sum())
+        ious.extend(iou[rows, cols][good].tolist())
+
+    recall = matched / baseline_total if baseline_total else 1.0
+    precision = matched / candidate_total if candidate_total else 1.0
+    return {
+        'recall': recall,
+        'precision': precision,
+        'f1': 2 * precision * recall / (precision + recall) if precision + recall else 0.0,
+        'mean_iou': float(np.mean(ious)) if ious else 0.0,
+        'baseline_boxes': baseline_total,
+        'candidate_boxes': candidate_total,
+    }
+
+
+def compare_backends(frames: Sequence[np.ndarray], backends: Sequence[str] = BACKENDS,
+                     model_path: str = 'yolov8s.pt', imgsz: int = 640, int8: bool = False,
+                     calibration_source: Optional[str] = None, conf: float = 0.5,
+                     warmup: int = 3) -> Dict[str, Any]:
+    """
+    Run the same frames through each backend and compare against PyTorch.
+
+    Returns:
+        Per-backend latency percentiles and box agreement with the torch baseline
+    """
+    classes = list(person_class_ids())
+    boxes_by_backend = {}
+    report = {}
+
+    # The PyTorch baseline always runs first
+    ordered = ['torch'] + [b for b in backends if b != 'torch']
+    for backend in ordered:
+        quantize = int8 and backend != 'torch'
+        try:
+            model = load_detector(backend, model_path, imgsz, quantize, calibration_source)
+        except Exception as e:
+            logger.error(f"Could not load {backend} backend: {e}")
+            report[backend] = {'error': str(e)}
+            continue
+
+        for frame in frames[:warmup]:
+            model.predict(frame, conf=conf, imgsz=imgsz, device='cpu', classes=classes, verbose=False)
+
+        latencies = []
+        boxes = []
+        for frame in frames:
+            started = time.perf_counter()
+            results = model.predict(frame, conf=conf, imgsz=imgsz, device='cpu', classes=classes, verbose=False)
+            latencies.append((time.perf_counter() - started) * 1000)
+            boxes.append(decode_person_boxes(results[0] if results else None, conf=conf, classes=classes))
+        boxes_by_backend[backend] = boxes
+
+        latencies = np.array(latencies)
+        report[backend] = {
+            'int8': quantize,
+            'frames': len(frames),
+            'mean_ms': float(latencies.mean()),
+            'p50_ms': float(np.percentile(latencies, 50)),
+            'p95_ms': float(np.percentile(latencies, 95)),
+            'fps': float(1000.0 / latencies.mean()),
+        }
+
+    baseline = boxes_by_backend.get('torch')
+    if baseline is not None:
+        for backend, boxes in boxes_by_backend.items():
+            if backend != 'torch':
+                report[backend]['agreement'] = _agreement(baseline, boxes)
+                report[backend]['speedup'] = report['torch']['mean_ms'] / report[backend]['mean_ms']
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare CPU detector backends against the PyTorch baseline")
+    parser.add_argument('--source', required=True, help="Video file or image directory to run on")
+    parser.add_argument('--backends', nargs='+', default=list(BACKENDS), choices=BACKENDS)
+    parser.add_argument('--model', default='yolov8s.pt')
+    parser.add_argument('--imgsz', type=int, default=640)
+    parser.add_argument('--frames', type=int, default=100, help="Number of frames to compare on")
+    parser.add_argument('--int8', action='store_true', help="Quantize the exported backends to INT8")
+    parser.add_argument('--calibration-source', help="Footage for INT8 calibration (defaults to --source)")
+    args = parser.parse_args()
+
+    logging.basicConfig(level=logging.INFO)
+    frames = load_calibration_frames(args.source, args.frames)
+    report = compare_backends(frames, args.backends, args.model, args.imgsz, args.int8,
+                              args.calibration_source or args.source)
+    print(json.dumps(report, indent=2))
+
+
+if __name__ == "__main__":
+    main()
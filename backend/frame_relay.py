@@ -0,0 +1,81 @@
+import cv2
+import threading
+import time
+import logging
+from typing import Any, Callable, Dict, Optional, Tuple
+
+import numpy as np
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+# JPEG quality per preview level; a closed set so there is at most one encoding per level per frame
+QUALITY_LEVELS = {'low': 50, 'medium': 70, 'high': 90}
+
+
+class JpegCache:
+    """
+    JPEG encodings of a zone's latest frame, shared by every viewer.
+
+    The backend is the only client of the camera. Viewers get the frames
+    the counting worker already decoded, and each frame is encoded at most
+    once per quality level and overlay setting, however many snapshot or
+    MJPEG viewers ask for it. Viewers that ask at the same time wait for
+    the one encoding in progress instead of starting their own.
+    """
+
+    def __init__(self, frame_seq: Callable[[], Optional[int]],
+                 render: Callable[[bool], Optional[Tuple[int, np.ndarray]]],
+                 encode_time: Optional[Histogram] = None):
+        # frame_seq() is the sequence number of the latest frame; render(annotated) returns (seq, image)
+        self.frame_seq = frame_seq
+        self.render = render
+        self.encode_time = encode_time if encode_time is not None else Histogram()
+        self.lock = threading.Lock()
+        self.entries: Dict[Tuple[str, bool], Tuple[int, bytes]] = {}
+        self.key_locks: Dict[Tuple[str, bool], threading.Lock] = {}
+        self.encodes = 0
+        self.hits = 0
+
+    def get(self, quality: str = 'medium', annotated: bool = False) -> Optional[Tuple[int, bytes]]:
+        """(frame sequence, JPEG bytes) of the latest frame, or None before the first frame"""
+        if quality not in QUALITY_LEVELS:
+            raise ValueError(f"Unknown quality '{quality}', expected one of {', '.join(QUALITY_LEVELS)}")
+        key = (quality, annotated)
+        seq = self.frame_seq()
+        if seq is None:
+            return None
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry and entry[0] == seq:
+                self.hits += 1
+                return entry
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self.lock:
+                entry = self.entries.get(key)
+            if entry and entry[0] >= seq:
+                with self.lock:
+                    self.hits += 1
+                return entry
+            rendered = self.render(annotated)
+            if rendered is None:
+                return None
+            seq, image = rendered
+            started = time.perf_counter()
+            ok, jpeg = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, QUALITY_LEVELS[quality]])
+            self.encode_time.observe(time.perf_counter() - started)
+            if not ok:
+                logger.error(f"Failed to encode preview frame {seq}")
+                return None
+            entry = (seq, jpeg.tobytes())
+            with self.lock:
+                self.entries[key] = entry
+                self.encodes += 1
+            return entry
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self.lock:
+            return {'encodes': self.encodes, 'hits': self.hits}
@@ -0,0 +1,353 @@
+import cv2
+import json
+import shutil
+import subprocess
+import threading
+import time
+import logging
+from collections import deque
+from typing import Any, Dict, Optional, Tuple, Union
+
+import numpy as np
+
+from metrics import Histogram
+
+logger = logging.getLogger(__name__)
+
+
+class LatestFrameCapture:
+    """
+    Reads a stream on its own thread and keeps only the newest decoded frame.
+
+    Consumers call read() at their own pace and always get the most recent
+    frame together with its capture timestamp. Frames that were overwritten
+    before anyone read them are counted as dropped instead of piling up in
+    the decoder's internal buffer.
+    """
+
+    def __init__(self, source: Union[str, int], name: Optional[str] = None,
+                 reconnect_delay: float = 1.0):
+        self.source = source
+        self.name = name or str(source)
+        self.reconnect_delay = reconnect_delay
+
+        self.cap = None
+        self.width = 0
+        self.height = 0
+        # Size of the stream itself; width and height are the decoded frames, which may be scaled down
+        self.source_width = 0
+        self.source_height = 0
+        self.fps = 0
+
+        self.is_running = False
+        self.thread = None
+        self.cond = threading.Condition()
+
+        # Latest-frame slot
+        self.frame = None
+        self.captured_at = 0.0
+        self.frame_index = 0
+        self.consumed_index = 0
+
+        self.frames_captured = 0
+        self.frames_dropped = 0
+        self.read_failures = 0
+        # Time to get each decoded frame from the source
+        self.decode_time = Histogram()
+
+    def open(self) -> bool:
+        """Open the underlying capture and read the stream properties"""
+        self.cap = cv2.VideoCapture(self.source)
+        if not self.cap.isOpened():
+            logger.error(f"Failed to open stream: {self.source}")
+            return False
+
+        # Keep the decoder's own queue as short as the backend allows
+        self.cap.set(cv2.CAP_PROP_BUFFERSIZE, 1)
+
+        self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or 640
+        self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or 480
+        self.source_width, self.source_height = self.width, self.height
+        self.fps = int(self.cap.get(cv2.CAP_PROP_FPS)) or 30
+        return True
+
+    def _read_frame(self) -> Tuple[bool, Optional[np.ndarray]]:
+        """Decode the next frame from the source"""
+        return self.cap.read()
+
+    def _release(self):
+        """Release the underlying capture"""
+        if self.cap:
+            self.cap.release()
+
+    def start(self) -> bool:
+        """Open the source if needed and start the capture thread"""
+        if self.cap is None and not self.open():
+            return False
+        self.is_running = True
+        self.thread = threading.Thread(target=self._capture_loop, name=f"capture-{self.name}", daemon=True)
+        self.thread.start()
+        return True
+
+    def stop(self, timeout: float = 5):
+        """Stop the capture thread and release the source"""
+        with self.cond:
+            self.is_running = False
+            self.cond.notify_all()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=timeout)
+        self._release()
+
+    def _capture_loop(self):
+        """Decode frames as fast as the source delivers them"""
+        while self.is_running:
+            started = time.perf_counter()
+            ret, frame = self._read_frame()
+            if not ret:
+                self.read_failures += 1
+                logger.warning(f"[{self.name}] Failed to read frame, retrying...")
+                with self.cond:
+                    self.cond.wait(timeout=self.reconnect_delay)
+                continue
+
+            self.decode_time.observe(time.perf_counter() - started)
+            with self.cond:
+                if self.frame_index > self.consumed_index:
+                    self.frames_dropped += 1
+                self.frame = frame
+                self.captured_at = time.time()
+                self.frame_index += 1
+                self.frames_captured += 1
+                self.cond.notify_all()
+
+    def read(self, timeout: float = 1.0) -> Optional[Tuple[np.ndarray, float, int]]:
+        """
+        Wait for a frame newer than the last one read.
+
+        Returns:
+            (frame, captured_at, frame_index), or None if no new frame arrived in time
+        """
+        deadline = time.time() + timeout
+        with self.cond:
+            while self.is_running and self.frame_index <= self.consumed_index:
+                remaining = deadline - time.time()
+                if remaining <= 0:
+                    return None
+                self.cond.wait(timeout=remaining)
+            if self.frame_index <= self.consumed_index:
+                return None
+            self.consumed_index = self.frame_index
+            return self.frame, self.captured_at, self.frame_index
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Capture counters"""
+        with self.cond:
+            return {
+                'decoder': 'opencv',
+                'frames_captured': self.frames_captured,
+                'frames_dropped': self.frames_dropped,
+                'read_failures': self.read_failures,
+                'last_capture_at': self.captured_at or None,
+            }
+
+
+class FFmpegFrameCapture(LatestFrameCapture):
+    """
+    Latest-frame capture that decodes with an ffmpeg subprocess.
+
+    ffmpeg scales the stream to the detector's input size, drops frames
+    down to the requested rate, and writes raw BGR frames to a pipe.
+    Frames are read with readinto() into a small pool of preallocated
+    arrays. A buffer is never reused while it holds the unread latest frame
+    or one of the last hold_frames frames handed out by read(). Consumers
+    that keep frames longer than that must copy them.
+
+    skip_frame='nonref' (or 'nokey') makes the decoder skip non-reference
+    frames (or everything but keyframes) before decoding them.
+    """
+
+    def __init__(self, source: Union[str, int], name: Optional[str] = None,
+                 reconnect_delay: float = 1.0, max_size: Optional[int] = 640,
+                 width: Optional[int] = None, height: Optional[int] = None,
+                 fps: Optional[float] = None, threads: int = 2, skip_frame: Optional[str] = None,
+                 hold_frames: int = 2, ffmpeg: str = 'ffmpeg', ffprobe: str = 'ffprobe'):
+        super().__init__(source, name, reconnect_delay)
+        self.max_size = max_size
+        self.out_width = width
+        self.out_height = height
+        self.out_fps = fps
+        self.threads = threads
+        self.skip_frame = skip_frame
+        self.hold_frames = hold_frames
+        self.ffmpeg = ffmpeg
+        self.ffprobe = ffprobe
+
+        self.process = None
+        self.buffers = []
+        self.views = []
+        self.held = deque(maxlen=max(1, hold_frames))
+        self.stderr_tail = deque(maxlen=20)
+        self.restarts = 0
+        self.closed = False
+
+    def _probe(self) -> Optional[Dict[str, Any]]:
+        """Width, height and frame rate of the source's first video stream"""
+        cmd = [self.ffprobe, '-v', 'error', '-select_streams', 'v:0',
+               '-show_entries', 'stream=width,height,avg_frame_rate', '-of', 'json', str(self.source)]
+        try:
+            output = subprocess.run(cmd, capture_output=True, timeout=15, check=True).stdout
+            stream = json.loads(output)['streams'][0]
+        except (subprocess.SubprocessError, OSError, KeyError, IndexError, ValueError) as e:
+            logger.error(f"[{self.name}] ffprobe failed for {self.source}: {e}")
+            return None
+        num, _, den = stream.get('avg_frame_rate', '0/1').partition('/')
+        fps = float(num) / float(den) if den and float(den) else 0.0
+        return {'width': int(stream['width']), 'height': int(stream['height']), 'fps': fps}
+
+    def _output_size(self, width: int, height: int) -> Tuple[int, int]:
+        """Output size: explicit, or the source scaled down to max_size on its longest side"""
+        if self.out_width and self.out_height:
+            return self.out_width, self.out_height
+        scale = min(1.0, self.max_size / max(width, height)) if self.max_size else 1.0
+        # Even dimensions keep every pixel format and scaler happy
+        return max(2, int(width * scale) // 2 * 2), max(2, int(height * scale) // 2 * 2)
+
+    def _command(self):
+        cmd = [self.ffmpeg, '-nostdin', '-hide_banner', '-loglevel', 'error',
+               '-fflags', 'nobuffer', '-flags', 'low_delay', '-threads', str(self.threads)]
+        if self.skip_frame:
+            cmd += ['-skip_frame', self.skip_frame]
+        if str(self.source).startswith('rtsp'):
+            cmd += ['-rtsp_transport', 'tcp']
+        filters = [f'scale={self.width}:{self.height}']
+        if self.out_fps:
+            filters.insert(0, f'fps={self.out_fps}')
+        cmd += ['-i', str(self.source), '-an', '-sn', '-vf', ','.join(filters),
+                '-pix_fmt', 'bgr24', '-f', 'rawvideo', 'pipe:1']
+        return cmd
+
+    def _drain_stderr(self, process):
+        """Keep the last few ffmpeg error lines without letting the pipe fill up"""
+        for line in iter(process.stderr.readline, b''):
+            self.stderr_tail.append(line.decode(errors='replace').rstrip())
+
+    def _spawn(self) -> bool:
+        """Start (or restart) the ffmpeg process"""
+        try:
+            self.process = subprocess.Popen(self._command(), stdout=subprocess.PIPE, stderr=subprocess.PIPE,
+                                            bufsize=self.buffers[0].nbytes)
+        except OSError as e:
+            logger.error(f"[{self.name}] Failed to start ffmpeg: {e}")
+            self.process = None
+            return False
+        threading.Thread(target=self._drain_stderr, args=(self.process,),
+                         name=f"ffmpeg-stderr-{self.name}", daemon=True).start()
+        return True
+
+    def open(self) -> bool:
+        """Probe the source, allocate the frame buffers and start ffmpeg"""
+        if isinstance(self.source, int) or not shutil.which(self.ffmpeg):
+            logger.error(f"[{self.name}] ffmpeg decoding needs a URL or file and the ffmpeg binary")
+            return False
+
+        # Probed even with an explicit output size: pixel coordinates in the configuration refer to the source
+        info = self._probe()
+        if info is None and not (self.out_width and self.out_height):
+            logger.error(f"Failed to open stream: {self.source}")
+            return False
+
+        self.width, self.height = self._output_size(info['width'], info['height']) if info else \
+            (self.out_width, self.out_height)
+        self.source_width, self.source_height = (info['width'], info['height']) if info else (self.width, self.height)
+        self.fps = int(self.out_fps or (info and info['fps']) or 30)
+
+        # Frames being processed or kept for previews, the unread latest frame, and one to decode into
+        count = self.hold_frames + 2
+        self.buffers = [np.empty((self.height, self.width, 3), dtype=np.uint8) for _ in range(count)]
+        self.views = [memoryview(buffer).cast('B') for buffer in self.buffers]
+        self.cap = self.process if self._spawn() else None
+        return self.cap is not None
+
+    def _slot(self, frame: np.ndarray) -> Optional[int]:
+        return next((i for i, buffer in enumerate(self.buffers) if buffer is frame), None)
+
+    def _read_frame(self) -> Tuple[bool, Optional[np.ndarray]]:
+        """Read one raw frame from the pipe into a buffer nobody is using"""
+        if self.process is None or self.process.poll() is not None:
+            if self.closed:
+                return False, None
+            if self.process is not None:
+                logger.warning(f"[{self.name}] ffmpeg exited ({self.process.returncode}): "
+                               f"{self.stderr_tail[-1] if self.stderr_tail else 'no error output'}")
+                self.restarts += 1
+            if not self._spawn():
+                return False, None
+
+        with self.cond:
+            busy = set(self.held)
+            busy.add(self._slot(self.frame) if self.frame is not None else None)
+        slot = next(i for i in range(len(self.buffers)) if i not in busy)
+
+        view = self.views[slot]
+        filled = 0
+        while filled < len(view):
+            count = self.process.stdout.readinto(view[filled:])
+            if not count:
+                return False, None
+            filled += count
+        return True, self.buffers[slot]
+
+    def read(self, timeout: float = 1.0) -> Optional[Tuple[np.ndarray, float, int]]:
+        latest = super().read(timeout)
+        if latest is not None:
+            with self.cond:
+                self.held.append(self._slot(latest[0]))
+        return latest
+
+    def stop(self, timeout: float = 5):
+        """Stop ffmpeg first so a capture thread blocked on the pipe wakes up, then the thread"""
+        self.closed = True
+        self._release()
+        super().stop(timeout)
+
+    def _release(self):
+        """Stop the ffmpeg process"""
+        process, self.process = self.process, None
+        if process and process.poll() is None:
+            process.terminate()
+            try:
+                process.wait(timeout=5)
+            except subprocess.TimeoutExpired:
+                process.kill()
+
+    def get_stats(self) -> Dict[str, Any]:
+        stats = super().get_stats()
+        stats.update({
+            'decoder': 'ffmpeg',
+            'source_size': [self.source_width, self.source_height],
+            'output_size': [self.width, self.height],
+            'ffmpeg_restarts': self.restarts,
+            'last_error': self.stderr_tail[-1] if self.stderr_tail else None,
+        })
+        return stats
+
+
+DECODERS = ('opencv', 'ffmpeg')
+
+
+def create_capture(source: Union[str, int], decoder: str = 'opencv', name: Optional[str] = None,
+                   **ffmpeg_options) -> LatestFrameCapture:
+    """
+    Latest-frame capture for a source with the chosen decoder.
+
+    Args:
+        source: Stream URL, file path or camera index
+        decoder: 'opencv' (cv2.VideoCapture) or 'ffmpeg' (FFmpegFrameCapture)
+        name: Name used in logs and thread names
+        ffmpeg_options: FFmpegFrameCapture options such as max_size, fps or skip_frame
+    """
+    if decoder not in DECODERS:
+        raise ValueError(f"Unknown decoder '{decoder}', expected one of {', '.join(DECODERS)}")
+    if decoder == 'ffmpeg':
+        return FFmpegFrameCapture(source, name=name, **ffmpeg_options)
+    return LatestFrameCapture(source, name=name)
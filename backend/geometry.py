@@ -0,0 +1,26 @@
+from typing import Optional, Tuple
+
+import numpy as np
+
+
+def pixel_scale(width: int, height: int, source_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    """Factors from the stream's own pixels to the pixels of width x height frames"""
+    if not source_size:
+        return np.ones(2)
+    return np.array([width / source_size[0], height / source_size[1]])
+
+
+def scale_points(points, width: int, height: int, source_size: Optional[Tuple[int, int]] = None) -> np.ndarray:
+    """
+    Configured image points in pixels of the frames being processed.
+
+    Counting lines, regions and calibration image points are given either
+    as fractions of the frame size, when every coordinate is within 0-1,
+    or as pixels of the camera's own resolution. Decoders may scale frames
+    down, so pixel points are scaled from source_size, the (width, height)
+    of the stream, to width x height. Without source_size they are used as is.
+    """
+    points = np.asarray(points, dtype=np.float64)
+    if np.all((points >= 0) & (points <= 1)):
+        return points * [width, height]
+    return points * pixel_scale(width, height, source_size)
@@ -0,0 +1,193 @@
+import cv2
+import json
+import math
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+from scipy.spatial import cKDTree
+
+from geometry import pixel_scale, scale_points
+
+CalibrationSpec = Dict[str, Any]
+
+# World coordinates are either [lon, lat] (for the map) or [x, y] metres on a venue plan
+UNITS = ('lonlat', 'metres')
+
+# Metres per degree of latitude, and of longitude at the equator
+METRES_PER_DEG_LAT = 110540.0
+METRES_PER_DEG_LON = 111320.0
+
+
+def metres_per_unit(units: str, latitude: float = 0.0) -> np.ndarray:
+    """Scale from world units to metres along x and y, locally flat around the latitude"""
+    if units == 'lonlat':
+        return np.array([METRES_PER_DEG_LON * math.cos(math.radians(latitude)), METRES_PER_DEG_LAT])
+    return np.ones(2)
+
+
+def parse_calibration(spec: Union[None, str, CalibrationSpec]) -> Optional[CalibrationSpec]:
+    """
+    Validate a camera calibration.
+
+    Either {"image_points": [[x, y], ...], "world_points": [[lon, lat], ...]}
+    with four or more corresponding ground points, or {"homography": 3x3}
+    mapping pixels to world coordinates directly. Image points are pixels
+    or fractions of the frame (see geometry.scale_points); the homography
+    takes pixels of the camera's own resolution.
+    "units" is "lonlat" (default) or "metres". An optional "area" polygon
+    in world coordinates is the ground the camera covers, for densities.
+
+    Raises:
+        ValueError: if the calibration is malformed
+    """
+    if spec is None or spec == '':
+        return None
+    if isinstance(spec, str):
+        spec = json.loads(spec)
+    if not isinstance(spec, dict):
+        raise ValueError("Calibration must be an object")
+
+    units = spec.get('units', 'lonlat')
+    if units not in UNITS:
+        raise ValueError(f"Unknown calibration units '{units}', expected one of {', '.join(UNITS)}")
+    calibration = {'units': units}
+
+    if 'homography' in spec:
+        homography = np.asarray(spec['homography'], dtype=np.float64)
+        if homography.shape != (3, 3) or not np.all(np.isfinite(homography)):
+            raise ValueError("Homography must be a 3x3 matrix")
+        calibration['homography'] = homography.tolist()
+    else:
+        image_points = np.asarray(spec.get('image_points', []), dtype=np.float64)
+        world_points = np.asarray(spec.get('world_points', []), dtype=np.float64)
+        if image_points.ndim != 2 or image_points.shape[1] != 2 or len(image_points) < 4:
+            raise ValueError("Calibration needs at least four [x, y] image points")
+        if world_points.shape != image_points.shape:
+            raise ValueError("Calibration needs one world point per image point")
+        calibration['image_points'] = image_points.tolist()
+        calibration['world_points'] = world_points.tolist()
+
+    if spec.get('area') is not None:
+        area = np.asarray(spec['area'], dtype=np.float64)
+        if area.ndim != 2 or area.shape[1] != 2 or len(area) < 3:
+            raise ValueError("Calibration area needs at least three [x, y] world points")
+        calibration['area'] = area.tolist()
+    return calibration
+
+
+def parse_calibrations(spec: Union[None, str, Dict[str, Any]]) -> Dict[str, CalibrationSpec]:
+    """Calibrations keyed by zone, as JSON or as the path of a JSON file"""
+    if spec is None or spec == '':
+        return {}
+    if isinstance(spec, str):
+        if spec.lstrip().startswith('{'):
+            spec = json.loads(spec)
+        else:
+            with open(spec) as f:
+                spec = json.load(f)
+    if not isinstance(spec, dict):
+        raise ValueError("Calibrations must be an object keyed by zone")
+    return {zone: parse_calibration(calibration) for zone, calibration in spec.items()}
+
+
+class GroundProjector:
+    """
+    Maps people from camera pixels to the ground plane with a homography.
+
+    Every track is placed by the bottom center of its box, where the
+    person stands, and all of them are projected with one matrix product
+    per frame. For distances and areas, lon/lat results are also expressed
+    in metres on a local flat plane around the calibration.
+    """
+
+    def __init__(self, calibration: CalibrationSpec, width: int, height: int,
+                 source_size: Optional[Tuple[int, int]] = None):
+        self.units = calibration['units']
+        if 'homography' in calibration:
+            # Decoded pixels back to source pixels, then the calibrated mapping
+            unscale = np.diag([*(1 / pixel_scale(width, height, source_size)), 1.0])
+            self.homography = np.asarray(calibration['homography'], dtype=np.float64) @ unscale
+            origin = None
+        else:
+            image_points = scale_points(calibration['image_points'], width, height, source_size)
+            world_points = np.asarray(calibration['world_points'], dtype=np.float64)
+            origin = world_points.mean(axis=0)
+            # Fit in coordinates relative to the calibration centre so lon/lat keep their precision
+            homography, _ = cv2.findHomography(image_points, world_points - origin)
+            if homography is None:
+                raise ValueError("Calibration points are degenerate")
+            shift = np.array([[1, 0, origin[0]], [0, 1, origin[1]], [0, 0, 1]], dtype=np.float64)
+            self.homography = shift @ homography
+
+        if origin is None:
+            centre = self.homography @ np.array([width / 2, height, 1.0])
+            origin = centre[:2] / centre[2]
+        self.origin = origin
+        self.metres_per_unit = metres_per_unit(self.units, origin[1])
+
+        self.area = np.asarray(calibration['area'], dtype=np.float64) if calibration.get('area') else None
+        self.area_m2 = self._polygon_area(self.to_metres(self.area)) if self.area is not None else None
+
+    def project(self, tracks: Sequence[Sequence[int]]) -> np.ndarray:
+        """World coordinates of every track's feet, one row per track (NaN above the horizon)"""
+        data = np.asarray(tracks, dtype=np.float64).reshape(-1, 5)
+        feet = np.column_stack([(data[:, 0] + data[:, 2]) / 2, data[:, 3], np.ones(len(data))])
+        world = feet @ self.homography.T
+        scale = np.where(world[:, 2:3] > 0, world[:, 2:3], np.nan)
+        return world[:, :2] / scale
+
+    def to_metres(self, points: np.ndarray) -> np.ndarray:
+        """Points in metres on a flat plane around the calibration"""
+        return (points - self.origin) * self.metres_per_unit
+
+    def in_area(self, points: np.ndarray) -> np.ndarray:
+        """Which points lie inside the covered area (all of them when no area is configured)"""
+        if self.area is None:
+            return np.ones(len(points), dtype=bool)
+        x, y = points[:, 0:1], points[:, 1:2]
+        ax, ay = self.area[:, 0], self.area[:, 1]
+        bx, by = np.roll(ax, -1), np.roll(ay, -1)
+        # Even-odd rule: count polygon edges crossed by a ray to the right of each point
+        straddles = (ay > y) != (by > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            crossing_x = ax + (y - ay) * (bx - ax) / (by - ay)
+        return np.count_nonzero(straddles & (x < crossing_x), axis=1) % 2 == 1
+
+    @staticmethod
+    def _polygon_area(points: np.ndarray) -> float:
+        x, y = points[:, 0], points[:, 1]
+        return float(abs(np.dot(x, np.roll(y, -1)) - np.dot(y, np.roll(x, -1))) / 2)
+
+
+def merge_points(groups: List[Dict[str, Any]], units: str = 'lonlat', radius_m: float = 0.5) -> List[Dict[str, Any]]:
+    """
+    Merge ground points from several cameras, dropping duplicates.
+
+    Where camera views overlap, one person is seen by more than one camera.
+    A point is dropped when an earlier point from a different camera that
+    was kept is within radius_m of it. Close pairs come from a k-d tree, so
+    the cost grows with the number of near neighbours, not N^2. Each group is {"camera", "points", "ids"}, all
+    in the same world units.
+    """
+    groups = [group for group in groups if len(group['points'])]
+    if not groups:
+        return []
+    points = np.concatenate([group['points'] for group in groups])
+    metres = points * metres_per_unit(units, float(points[:, 1].mean()))
+    ids = np.concatenate([group['ids'] for group in groups])
+    cameras = np.concatenate([np.full(len(group['points']), i) for i, group in enumerate(groups)])
+
+    keep = np.ones(len(points), dtype=bool)
+    if len(groups) > 1:
+        pairs = cKDTree(metres).query_pairs(radius_m, output_type='ndarray')
+        pairs = pairs[cameras[pairs[:, 0]] != cameras[pairs[:, 1]]]
+        # Each pair is (earlier, later); decide the later points in order so only kept points count
+        pairs = pairs[np.argsort(pairs[:, 1], kind='stable')]
+        later, starts = np.unique(pairs[:, 1], return_index=True)
+        for point, earlier in zip(later, np.split(pairs[:, 0], starts[1:])):
+            keep[point] = not keep[earlier].any()
+
+    return [
+        {'camera': groups[camera]['camera'], 'id': int(person_id), 'position': point.tolist()}
+        for point, person_id, camera in zip(points[keep], ids[keep], cameras[keep])
+    ]
@@ -0,0 +1,210 @@
+import threading
+import time
+import logging
+from collections import deque
+from concurrent.futures import Future
+from typing import Dict, Any, List, Optional, Sequence, Tuple
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class InferenceBatcher:
+    """
+    Collects the latest frame from every active stream and runs them through
+    the model in a single batched predict call.
+
+    Each stream keeps at most one pending entry: submitting a newer frame
+    before the previous one was picked up replaces it. An entry is usually a
+    single frame, but can carry several images (e.g. the tiles of one frame)
+    that are batched together with the other streams. A batch is dispatched
+    once batch_size frames are pending, every registered stream has a frame
+    waiting, or max_wait seconds have passed since the oldest pending frame.
+    Entries may ask for a specific input size; a batch only holds entries of
+    the oldest entry's size, and the rest wait for the next round.
+    """
+
+    def __init__(self, model, batch_size: int = 8, max_wait: float = 0.02,
+                 conf: float = 0.5, device: str = 'cpu', classes: Optional[Sequence[int]] = None,
+                 stats_window: int = 100):
+        self.model = model
+        self.batch_size = max(1, batch_size)
+        self.max_wait = max_wait
+        self.conf = conf
+        self.device = device
+        self.classes = list(classes) if classes is not None else None
+
+        self.streams = set()
+        self.pending: Dict[str, Tuple[List[np.ndarray], Future, float, bool, Optional[int]]] = {}
+        self.cond = threading.Condition()
+        self.is_running = False
+        self.thread = None
+
+        # Stats over the last stats_window batches: (size, latency, finished_at)
+        self.batches = deque(maxlen=stats_window)
+        self.total_batches = 0
+        self.total_frames = 0
+        self.superseded_frames = 0
+
+    def start(self):
+        """Start the batching thread"""
+        with self.cond:
+            if self.is_running:
+                return
+            self.is_running = True
+        self.thread = threading.Thread(target=self._run, name="inference-batcher", daemon=True)
+        self.thread.start()
+
+    def stop(self, timeout: float = 5):
+        """Stop the batching thread and cancel pending frames"""
+        with self.cond:
+            self.is_running = False
+            for entry in self.pending.values():
+                entry[1].cancel()
+            self.pending.clear()
+            self.cond.notify_all()
+        if self.thread and self.thread.is_alive():
+            self.thread.join(timeout=timeout)
+
+    def register(self, stream_id: str):
+        """Register an active stream so full rounds can be dispatched without waiting"""
+        with self.cond:
+            self.streams.add(stream_id)
+
+    def unregister(self, stream_id: str):
+        """Remove a stream and cancel its pending frame"""
+        with self.cond:
+            self.streams.discard(stream_id)
+            entry = self.pending.pop(stream_id, None)
+            if entry:
+                entry[1].cancel()
+            self.cond.notify_all()
+
+    def submit(self, stream_id: str, frame: np.ndarray, imgsz: Optional[int] = None) -> Future:
+        """Queue the latest frame for a stream and return a future for its result"""
+        return self._enqueue(stream_id, [frame], single=True, imgsz=imgsz)
+
+    def submit_many(self, stream_id: str, frames: List[np.ndarray], imgsz: Optional[int] = None) -> Future:
+        """Queue several images for a stream and return a future for the list of results"""
+        return self._enqueue(stream_id, list(frames), single=False, imgsz=imgsz)
+
+    def _enqueue(self, stream_id: str, frames: List[np.ndarray], single: bool,
+                 imgsz: Optional[int] = None) -> Future:
+        """Replace the stream's pending entry"""
+        future = Future()
+        with self.cond:
+            if not self.is_running:
+                future.set_exception(RuntimeError("Inference batcher is not running"))
+                return future
+            previous = self.pending.get(stream_id)
+            if previous:
+                previous[1].cancel()
+                self.superseded_frames += 1
+            self.pending[stream_id] = (frames, future, time.time(), single, imgsz)
+            self.cond.notify_all()
+        return future
+
+    def infer(self, stream_id: str, frame: np.ndarray, timeout: float = 10, imgsz: Optional[int] = None):
+        """Submit a frame and block until its detection result is ready"""
+        return self.submit(stream_id, frame, imgsz=imgsz).result(timeout=timeout)
+
+    def infer_many(self, stream_id: str, frames: List[np.ndarray], timeout: float = 10,
+                   imgsz: Optional[int] = None) -> list:
+        """Submit several images and block until all their results are ready"""
+        return self.submit_many(stream_id, frames, imgsz=imgsz).result(timeout=timeout)
+
+    def _take_batch(self) -> Tuple[Optional[int], List[Tuple[str, List[np.ndarray], Future, bool]]]:
+        """Wait for a dispatchable batch and remove it from the pending slots"""
+        with self.cond:
+            while self.is_running and not self.pending:
+                self.cond.wait(timeout=0.5)
+            if not self.is_running:
+                return None, []
+
+            deadline = min(entry[2] for entry in self.pending.values()) + self.max_wait
+            while self.is_running:
+                full = sum(len(entry[0]) for entry in self.pending.values()) >= self.batch_size
+                all_streams = self.streams and self.streams.issubset(self.pending.keys())
+                remaining = deadline - time.time()
+                if full or all_streams or remaining <= 0:
+                    break
+                self.cond.wait(timeout=remaining)
+
+            # Oldest frames first so no stream starves when there are more streams than slots
+            batch = []
+            size = 0
+            ordered = sorted(self.pending.items(), key=lambda item: item[1][2])
+            if not ordered:
+                return None, []
+            imgsz = ordered[0][1][4]
+            for stream_id, (frames, future, _, single, entry_imgsz) in ordered:
+                if entry_imgsz != imgsz:
+                    continue
+                if batch and size + len(frames) > self.batch_size:
+                    break
+                del self.pending[stream_id]
+                if future.set_running_or_notify_cancel():
+                    batch.append((stream_id, frames, future, single))
+                    size += len(frames)
+            return imgsz, batch
+
+    def _run(self):
+        """Batching loop"""
+        logger.info(f"Inference batcher started (batch size {self.batch_size}, max wait {self.max_wait * 1000:.0f}ms)")
+        while self.is_running:
+            imgsz, batch = self._take_batch()
+            if not batch:
+                continue
+
+            frames = [frame for _, entry_frames, _, _ in batch for frame in entry_frames]
+            options = {'imgsz': imgsz} if imgsz else {}
+            started = time.time()
+            try:
+                results = self.model.predict(frames, conf=self.conf, device=self.device,
+                                             classes=self.classes, verbose=False, **options)
+            except Exception as e:
+                logger.error(f"Batched inference failed for {len(frames)} frames: {e}")
+                for _, _, future, _ in batch:
+                    future.set_exception(e)
+                continue
+            finished = time.time()
+
+            with self.cond:
+                self.batches.append((len(frames), finished - started, finished))
+                self.total_batches += 1
+                self.total_frames += len(frames)
+
+            offset = 0
+            for _, entry_frames, future, single in batch:
+                entry_results = results[offset:offset + len(entry_frames)]
+                offset += len(entry_frames)
+                future.set_result(entry_results[0] if single else list(entry_results))
+        logger.info("Inference batcher stopped")
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Per-batch latency and throughput over the recent window"""
+        with self.cond:
+            batches = list(self.batches)
+            stats = {
+                'batch_size': self.batch_size,
+                'max_wait_ms': self.max_wait * 1000,
+                'active_streams': len(self.streams),
+                'total_batches': self.total_batches,
+                'total_frames': self.total_frames,
+                'superseded_frames': self.superseded_frames,
+                'pending_frames': sum(len(entry[0]) for entry in self.pending.values()),
+            }
+
+        if batches:
+            sizes = np.array([b[0] for b in batches], dtype=np.float64)
+            latencies = np.array([b[1] for b in batches], dtype=np.float64) * 1000
+            span = batches[-1][2] - (batches[0][2] - batches[0][1])
+            stats.update({
+                'avg_batch_fill': float(sizes.mean()),
+                'last_latency_ms': float(latencies[-1]),
+                'avg_latency_ms': float(latencies.mean()),
+                'p95_latency_ms': float(np.percentile(latencies, 95)),
+                'frames_per_sec': float(sizes.sum() / span) if span > 0 else 0.0,
+            })
+        return stats
@@ -0,0 +1,208 @@
+import asyncio
+import json
+import time
+import logging
+from typing import Any, Callable, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+# Fields of a zone's status that are pushed to subscribers; the rest stays on the status endpoint
+ZONE_FIELDS = ('status', 'counts', 'lines', 'regions', 'density_map_version', 'ground')
+
+
+def diff(old: Dict[str, Any], new: Dict[str, Any]) -> Dict[str, Any]:
+    """Nested changes from old to new; removed keys map to None"""
+    changes = {}
+    for key, value in new.items():
+        before = old.get(key)
+        if isinstance(value, dict) and isinstance(before, dict):
+            nested = diff(before, value)
+            if nested:
+                changes[key] = nested
+        elif value != before or key not in old:
+            changes[key] = value
+    for key in old.keys() - new.keys():
+        changes[key] = None
+    return changes
+
+
+def merge(into: Dict[str, Any], delta: Dict[str, Any]) -> Dict[str, Any]:
+    """Apply a later delta on top of an earlier one, so two updates become one"""
+    for key, value in delta.items():
+        if isinstance(value, dict) and isinstance(into.get(key), dict):
+            merge(into[key], value)
+        else:
+            into[key] = value
+    return into
+
+
+class Subscriber:
+    """One connected client: the not-yet-sent update, coalesced, and when it was last sent"""
+
+    def __init__(self, zone: Optional[str], min_interval: float):
+        self.zone = zone
+        self.min_interval = min_interval
+        self.pending: Optional[Dict[str, Any]] = None
+        self.pending_text: Optional[str] = None
+        self.pending_since: Optional[float] = None
+        self.ready = asyncio.Event()
+        self.closed = False
+
+    def offer(self, delta: Dict[str, Any], text: str):
+        if self.pending is None:
+            # A single update goes out as the broadcaster serialized it
+            self.pending = delta
+            self.pending_text = text
+            self.pending_since = time.time()
+        else:
+            if self.pending_text is not None:
+                self.pending = json.loads(self.pending_text)
+                self.pending_text = None
+            # Alerts are events, not state: keep every one of them
+            alerts = self.pending.get('alerts', []) + delta.get('alerts', [])
+            merge(self.pending, delta)
+            if alerts:
+                self.pending['alerts'] = alerts
+        self.ready.set()
+
+    def discard_state(self):
+        """Drop queued state changes, which a snapshot supersedes, but keep queued alerts, which it doesn't hold"""
+        if self.pending is None:
+            return
+        pending = json.loads(self.pending_text) if self.pending_text is not None else self.pending
+        self.pending = self.pending_text = self.pending_since = None
+        if pending.get('alerts'):
+            message = {'type': 'delta', 'version': pending.get('version'), 'alerts': pending['alerts']}
+            self.offer(message, json.dumps(message, default=str))
+
+    def take(self) -> Optional[str]:
+        if self.pending is None:
+            return None
+        text = self.pending_text if self.pending_text is not None else json.dumps(self.pending, default=str)
+        self.pending = self.pending_text = self.pending_since = None
+        return text
+
+    def close(self):
+        self.closed = True
+        self.ready.set()
+
+
+class CountBroadcaster:
+    """
+    Pushes live counts and alerts to every connected dashboard.
+
+    One task reads the counting status every interval seconds and diffs it
+    against the previous read, so the work per update is the same for one
+    screen or a hundred. Subscribers only receive what changed. Updates
+    that arrive while a client is still inside its rate limit are merged
+    into one message, so memory per client is bounded by the size of the
+    state. A client that has had an update waiting for longer than
+    slow_timeout is disconnected instead of buffered.
+    """
+
+    def __init__(self, read_status: Callable[[], Dict[str, Any]], interval: float = 0.2,
+                 max_rate: float = 5.0, slow_timeout: float = 10.0):
+        self.read_status = read_status
+        self.interval = interval
+        self.max_rate = max_rate
+        self.slow_timeout = slow_timeout
+        self.subscribers: List[Subscriber] = []
+        self.state: Dict[str, Any] = {}
+        self.version = 0
+        self.task = None
+        self.updates = 0
+        self.dropped = 0
+
+    def _snapshot(self) -> Dict[str, Any]:
+        status = self.read_status()
+        return {
+            zone: {field: zone_status.get(field) for field in ZONE_FIELDS}
+            for zone, zone_status in status.get('zones', {}).items()
+        }
+
+    def subscribe(self, zone: Optional[str] = None, max_rate: Optional[float] = None) -> Subscriber:
+        """Register a client; max_rate (messages per second) is capped at the broadcaster's"""
+        rate = min(max_rate or self.max_rate, self.max_rate)
+        subscriber = Subscriber(zone, 1.0 / rate)
+        self.subscribers.append(subscriber)
+        if self.task is None or self.task.done():
+            self.task = asyncio.get_running_loop().create_task(self._run())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber):
+        subscriber.close()
+        if subscriber in self.subscribers:
+            self.subscribers.remove(subscriber)
+
+    def publish_alert(self, alert: Dict[str, Any]):
+        """Send an alert to every subscriber with the next message"""
+        for subscriber in list(self.subscribers):
+            if subscriber.zone is None or alert.get('zone') in (None, subscriber.zone):
+                message = {'type': 'delta', 'version': self.version, 'alerts': [alert]}
+                subscriber.offer(message, json.dumps(message, default=str))
+
+    async def _run(self):
+        """Read, diff and fan out while anyone is subscribed"""
+        while self.subscribers:
+            try:
+                self._update(self._snapshot())
+            except Exception as e:
+                logger.error(f"Live count update failed: {e}")
+            await asyncio.sleep(self.interval)
+
+    def _update(self, snapshot: Dict[str, Any]):
+        changes = diff(self.state, snapshot)
+        self.state = snapshot
+        if not changes:
+            return
+        self.version += 1
+        self.updates += 1
+        now = time.time()
+        # Serialized once per distinct zone filter, not once per subscriber
+        texts: Dict[Optional[str], Optional[tuple]] = {}
+        for subscriber in list(self.subscribers):
+            if subscriber.pending_since is not None and now - subscriber.pending_since > self.slow_timeout:
+                logger.warning(f"Dropping live count subscriber that is {now - subscriber.pending_since:.0f}s behind")
+                self.dropped += 1
+                self.unsubscribe(subscriber)
+                continue
+            if subscriber.zone not in texts:
+                zones = changes if subscriber.zone is None else {
+                    zone: delta for zone, delta in changes.items() if zone == subscriber.zone}
+                message = {'type': 'delta', 'version': self.version, 'zones': zones}
+                texts[subscriber.zone] = (message, json.dumps(message, default=str)) if zones else None
+            if texts[subscriber.zone]:
+                message, text = texts[subscriber.zone]
+                subscriber.offer(message, text)
+
+    def snapshot_message(self, subscriber: Subscriber) -> str:
+        """The full current state, sent to a client when it connects"""
+        zones = self.state if subscriber.zone is None else {
+            zone: state for zone, state in self.state.items() if zone == subscriber.zone}
+        return json.dumps({'type': 'snapshot', 'version': self.version, 'zones': zones}, default=str)
+
+    async def messages(self, subscriber: Subscriber):
+        """Messages for one client, at most one per its minimum interval, until it is dropped"""
+        if not self.state:
+            try:
+                self.state = self._snapshot()
+            except Exception as e:
+                logger.error(f"Live count snapshot failed: {e}")
+        # State changes queued so far are already part of the snapshot; alerts are sent after it
+        subscriber.discard_state()
+        yield self.snapshot_message(subscriber)
+        while not subscriber.closed:
+            await subscriber.ready.wait()
+            subscriber.ready.clear()
+            text = subscriber.take()
+            if text is not None:
+                yield text
+                await asyncio.sleep(subscriber.min_interval)
+
+    def get_stats(self) -> Dict[str, Any]:
+        return {
+            'subscribers': len(self.subscribers),
+            'version': self.version,
+            'updates': self.updates,
+            'dropped': self.dropped,
+        }
@@ -1,27 +1,52 @@
 import cv2
-import pandas as pd
 import numpy as np
-from ultralytics import YOLO
-from tracker import Tracker
+from tracker import KalmanTracker
+from counting_lines import LineCounter, parse_lines
+from regions import RegionCounter, parse_regions
+from detections import decode_person_boxes, person_class_ids
+from model_registry import model_registry
+from frame_source import create_capture
 import cvzone
-import os
-import torch
 import threading
 import time
 from typing import Dict, Any, Optional
 
 class LivePersonCounter:
-    def __init__(self, stream_url: str = "http://10.110.174.215:8080/video"):
+    def __init__(self, stream_url: str = "http://10.110.174.215:8080/video",
+                 detect_every: int = 1, detect_interval: Optional[float] = None,
+                 headless: bool = False, output_path: Optional[str] = None,
+                 detector_backend: str = 'torch', decoder: str = 'opencv',
+                 decoder_options: Optional[Dict[str, Any]] = None, lines: Optional[list] = None,
+                 regions: Optional[list] = None):
         """
         Initialize the live person counter with a stream URL
         
         Args:
             stream_url: URL of the live camera stream (IP Webcam, RTSP, etc.)
+            detect_every: Run the detector every N frames and predict tracks in between
+            detect_interval: Run the detector at most every this many seconds instead
+            headless: Skip all GUI calls (no window, no per-frame drawing)
+            output_path: Optional path to record the annotated video to
+            detector_backend: 'torch', 'onnx' or 'openvino'
+            decoder: 'opencv', or 'ffmpeg' to decode with an ffmpeg subprocess at the model's input size
+            decoder_options: FFmpegFrameCapture options (max_size, fps, skip_frame, threads)
+            lines: Counting lines (see counting_lines.parse_lines); defaults to the vertical center line
+            regions: Named polygon regions to count occupancy in (see regions.parse_regions)
         """
         self.stream_url = stream_url
+        self.detect_every = detect_every
+        self.detect_interval = detect_interval
+        self.headless = headless
+        self.detector_backend = detector_backend
+        self.decoder = decoder
+        self.decoder_options = decoder_options or {}
+        self.output_path = output_path
+        self.writer = None
         self.model = None
         self.tracker = None
-        self.cap = None
+        self.capture = None
+        # (width, height) of the stream itself; pixel lines and regions refer to it, not to the decoded frames
+        self.source_size = None
         self.is_running = False
         self.is_processing = False
         
@@ -29,10 +54,19 @@ class LivePersonCounter:
         self.entry_count = 0
         self.exit_count = 0
         self.density_count = 0
+        self.region_counts = {}
         
-        # Tracking
-        self.previous_positions = {}
-        self.center_line_x = 0
+        # Counting lines, set up once the frame size is known
+        self.lines = parse_lines(lines)
+        self.line_counter = None
+        self.regions = parse_regions(regions)
+        self.region_counter = None
+        
+        # Latest results, for on-demand annotation
+        self.latest_frame = None
+        self.tracks = []
+        self.last_crossings = []
+        self.frame_lock = threading.Lock()
         
         # Threading
         self.processing_thread = None
@@ -44,9 +78,10 @@ class LivePersonCounter:
     def _initialize_model(self):
         """Initialize YOLO model for person detection"""
         try:
-            print("Initializing YOLO model...")
-            torch.cuda.is_available = lambda: False  # Force CPU usage
-            self.model = YOLO('yolov8s.pt')
+            print(f"Initializing YOLO model ({self.detector_backend} backend)...")
+            # Inference is pinned to the CPU through device='cpu' in predict; the model is
+            # shared with every other counter in this process
+            self.model = model_registry.get(self.detector_backend)
             print("✅ YOLO model initialized successfully")
         except Exception as e:
             print(f"❌ Failed to initialize YOLO model: {e}")
@@ -55,7 +90,8 @@ class LivePersonCounter:
     def _initialize_tracker(self):
         """Initialize the object tracker"""
         try:
-            self.tracker = Tracker()
+            self.tracker = KalmanTracker(detect_every=self.detect_every,
+                                         detect_interval=self.detect_interval)
             print("✅ Tracker initialized successfully")
         except Exception as e:
             print(f"❌ Failed to initialize tracker: {e}")
@@ -69,136 +105,141 @@ class LivePersonCounter:
             # Try different connection methods
             if self.stream_url.startswith('http'):
                 # HTTP stream (IP Webcam)
-                self.cap = cv2.VideoCapture(self.stream_url)
+                source = self.stream_url
             elif self.stream_url.startswith('rtsp'):
                 # RTSP stream
-                self.cap = cv2.VideoCapture(self.stream_url)
+                source = self.stream_url
             else:
                 # Local camera index
-                self.cap = cv2.VideoCapture(int(self.stream_url))
+                source = int(self.stream_url)
             
-            if not self.cap.isOpened():
+            # Frames are decoded on a separate thread that keeps only the newest one
+            self.capture = create_capture(source, self.decoder, **self.decoder_options)
+            if not self.capture.open():
                 print(f"❌ Failed to connect to stream: {self.stream_url}")
                 return False
             
             # Get video properties
-            self.width = int(self.cap.get(cv2.CAP_PROP_FRAME_WIDTH))
-            self.height = int(self.cap.get(cv2.CAP_PROP_FRAME_HEIGHT))
-            self.fps = int(self.cap.get(cv2.CAP_PROP_FPS))
+            self.width = self.capture.width
+            self.height = self.capture.height
+            self.fps = self.capture.fps
+            self.source_size = (self.capture.source_width or self.width, self.capture.source_height or self.height)
             
-            # Set center line for entry/exit detection
-            self.center_line_x = self.width // 2
+            # Set up the entry/exit lines for this frame size
+            self.line_counter = LineCounter(self.lines, self.width, self.height, source_size=self.source_size)
+            if self.regions:
+                self.region_counter = RegionCounter(self.regions, self.width, self.height,
+                                                    source_size=self.source_size)
             
             print(f"✅ Connected to stream: {self.width}x{self.height} @ {self.fps}fps")
-            print(f"Center line at x = {self.center_line_x}")
+            print(f"Counting lines: {', '.join(self.line_counter.names)}")
             return True
             
         except Exception as e:
             print(f"❌ Stream connection error: {e}")
             return False
     
-    def _load_class_names(self) -> list:
-        """Load class names for YOLO detection"""
-        try:
-            # Try to load from file
-            if os.path.exists('object_class.names'):
-                with open('object_class.names', 'r') as file:
-                    return file.read().split('\n')
-            else:
-                # Default COCO classes (person is index 0)
-                return ['person']
-        except Exception as e:
-            print(f"Warning: Could not load class names: {e}")
-            return ['person']
-    
     def _process_frame(self, frame):
         """Process a single frame for person detection and counting"""
         try:
-            # Run YOLO detection
-            results = self.model.predict(frame, conf=0.5, device='cpu')
-            
-            if not results or len(results) == 0:
-                # Still draw counters even if no detections
-                self._draw_counters(frame)
-                return frame
-            
-            a = results[0].boxes.data
-            px = pd.DataFrame(a).astype("float")
-            
-            # Extract person detections
-            person_list = []
-            for index, row in px.iterrows():
-                x1, y1, x2, y2, conf, d = row
-                if conf > 0.5:
-                    class_name = self._load_class_names()[int(d)] if int(d) < len(self._load_class_names()) else 'person'
-                    if 'person' in class_name.lower():
-                        person_list.append([int(x1), int(y1), int(x2), int(y2)])
-            
-            # Update tracker
-            bbox_id = self.tracker.update(person_list)
-            
-            current_positions = {}
-            
-            # Process each detected person
-            for bbox in bbox_id:
-                x3, y3, x4, y4, person_id = bbox
-                cx = int((x3 + x4) // 2)
-                cy = int((y3 + y4) // 2)
-                
-                current_positions[person_id] = (cx, cy)
+            if self.tracker.should_detect():
+                # Run YOLO detection for the person classes only
+                results = self.model.predict(frame, conf=0.5, device='cpu', classes=list(person_class_ids()))
                 
-                # Draw bounding box (green)
-                cv2.rectangle(frame, (x3, y3), (x4, y4), (0, 255, 0), 2)
+                # Extract person detections
+                person_boxes = decode_person_boxes(results[0] if results else None, conf=0.5)
                 
-                # Draw center point (magenta)
-                cv2.circle(frame, (cx, cy), 4, (255, 0, 255), -1)
-                
-                # Draw person ID (like original)
-                cvzone.putTextRect(frame, f'{person_id}', (x3, y3), 1, 2)
-                
-                # Check for entry/exit
-                if person_id in self.previous_positions:
-                    prev_x, prev_y = self.previous_positions[person_id]
-                    
-                    # Entry detection (left to right)
-                    if (prev_x < self.center_line_x and cx >= self.center_line_x):
-                        self.entry_count += 1
-                        print(f"Person {person_id} ENTERED (left to right) - Entry count: {self.entry_count}")
-                        
-                        # Draw entry indicator (green circle)
-                        cv2.circle(frame, (cx, cy), 15, (0, 255, 0), 3)
-                        cvzone.putTextRect(frame, 'ENTRY', (cx-30, cy-30), 1, 2, colorR=(0, 255, 0))
-                        
-                    # Exit detection (right to left)
-                    elif (prev_x > self.center_line_x and cx <= self.center_line_x):
-                        self.exit_count += 1
-                        print(f"Person {person_id} EXITED (right to left) - Exit count: {self.exit_count}")
-                        
-                        # Draw exit indicator (red circle)
-                        cv2.circle(frame, (cx, cy), 15, (0, 0, 255), 3)
-                        cvzone.putTextRect(frame, 'EXIT', (cx-30, cy-30), 1, 2, colorR=(0, 0, 255))
+                # Update tracker
+                bbox_id = self.tracker.update(person_boxes)
+            else:
+                # Between detector runs, count on the Kalman-predicted positions
+                bbox_id = self.tracker.predict()
             
-            # Update previous positions
-            self.previous_positions = current_positions.copy()
+            # Check every track against every counting line at once
+            crossings = self.line_counter.update(bbox_id)
+            for kind, line, person_id, cx, cy in crossings:
+                if kind == 'entry':
+                    self.entry_count += 1
+                    print(f"Person {person_id} ENTERED at {line} - Entry count: {self.entry_count}")
+                else:
+                    self.exit_count += 1
+                    print(f"Person {person_id} EXITED at {line} - Exit count: {self.exit_count}")
             
             # Calculate current density
-            self.density_count = len(current_positions)
+            self.density_count = len(bbox_id)
+            if self.region_counter:
+                self.region_counts = self.region_counter.count(bbox_id)
             
-            # Draw all overlays
-            self._draw_overlays(frame)
+            # Keep the results as data; overlays are only drawn when someone asks for them
+            with self.frame_lock:
+                self.latest_frame = frame
+                self.tracks = bbox_id
+                self.last_crossings = crossings
             
-            return frame
+            return bbox_id
             
         except Exception as e:
             print(f"Error processing frame: {e}")
-            # Still draw overlays even if processing fails
-            self._draw_overlays(frame)
-            return frame
+            return []
+    
+    def annotate_frame(self, frame, tracks=None, crossings=None):
+        """Draw tracks, crossings and counters onto the frame in place"""
+        tracks = self.tracks if tracks is None else tracks
+        crossings = self.last_crossings if crossings is None else crossings
+        
+        for x3, y3, x4, y4, person_id in tracks:
+            cx = int((x3 + x4) // 2)
+            cy = int((y3 + y4) // 2)
+            
+            # Draw bounding box (green)
+            cv2.rectangle(frame, (x3, y3), (x4, y4), (0, 255, 0), 2)
+            
+            # Draw center point (magenta)
+            cv2.circle(frame, (cx, cy), 4, (255, 0, 255), -1)
+            
+            # Draw person ID (like original)
+            cvzone.putTextRect(frame, f'{person_id}', (x3, y3), 1, 2)
+        
+        for kind, _, _, cx, cy in crossings:
+            if kind == 'entry':
+                # Draw entry indicator (green circle)
+                cv2.circle(frame, (cx, cy), 15, (0, 255, 0), 3)
+                cvzone.putTextRect(frame, 'ENTRY', (cx-30, cy-30), 1, 2, colorR=(0, 255, 0))
+            else:
+                # Draw exit indicator (red circle)
+                cv2.circle(frame, (cx, cy), 15, (0, 0, 255), 3)
+                cvzone.putTextRect(frame, 'EXIT', (cx-30, cy-30), 1, 2, colorR=(0, 0, 255))
+        
+        # Draw all overlays
+        self._draw_overlays(frame)
+        return frame
+    
+    def get_annotated_frame(self) -> Optional[np.ndarray]:
+        """Annotated copy of the most recently processed frame, for previews"""
+        with self.frame_lock:
+            if self.latest_frame is None:
+                return None
+            frame = self.latest_frame.copy()
+            tracks = list(self.tracks)
+            crossings = list(self.last_crossings)
+        return self.annotate_frame(frame, tracks, crossings)
+    
+    def get_tracks(self) -> list:
+        """Current tracks as data"""
+        with self.frame_lock:
+            tracks = list(self.tracks)
+        return [
+            {'id': person_id, 'box': [x1, y1, x2, y2], 'center': [(x1 + x2) // 2, (y1 + y2) // 2]}
+            for x1, y1, x2, y2, person_id in tracks
+        ]
     
     def _draw_overlays(self, frame):
         """Draw all visual overlays on the frame"""
-        # Draw center line (white)
-        cv2.line(frame, (self.center_line_x, 0), (self.center_line_x, self.height), (255, 255, 255), 3)
+        # Draw counting lines (white)
+        if self.line_counter:
+            self.line_counter.draw(frame)
+        if self.region_counter:
+            self.region_counter.draw(frame, self.region_counts)
         
         # Draw counters
         self._draw_counters(frame)
@@ -216,7 +257,7 @@ class LivePersonCounter:
         cvzone.putTextRect(frame, f'Exit: {self.exit_count}', (25, 25), 2, 2, colorR=(0, 0, 255))
         
         # Frame counter (below exit)
-        cvzone.putTextRect(frame, f'Frame: {getattr(self, 'frame_count', 0)}', (15, 80), 1, 1)
+        cvzone.putTextRect(frame, f"Frame: {getattr(self, 'frame_count', 0)}", (15, 80), 1, 1)
         
         # Density counter (below frame)
         cvzone.putTextRect(frame, f'Density: {self.density_count}', (15, 130), 1, 1)
@@ -229,32 +270,42 @@ class LivePersonCounter:
         frame_count = 0
         start_time = time.time()
         
-        # Create named window for better display
-        cv2.namedWindow('Live Person Counter', cv2.WINDOW_NORMAL)
-        cv2.resizeWindow('Live Person Counter', 800, 600)
+        if not self.headless:
+            # Create named window for better display
+            cv2.namedWindow('Live Person Counter', cv2.WINDOW_NORMAL)
+            cv2.resizeWindow('Live Person Counter', 800, 600)
         
-        while self.is_running and self.cap and self.cap.isOpened():
+        while self.is_running and self.capture and self.capture.is_running:
             try:
-                ret, frame = self.cap.read()
-                if not ret:
-                    print("❌ Failed to read frame from stream")
-                    time.sleep(1)
+                latest = self.capture.read(timeout=1.0)
+                if latest is None:
                     continue
                 
+                frame = latest[0]
                 frame_count += 1
                 self.frame_count = frame_count  # Store for display
                 
                 # Process the frame
-                processed_frame = self._process_frame(frame)
+                self._process_frame(frame)
                 
-                # Display the frame with proper window management
-                cv2.imshow('Live Person Counter', processed_frame)
+                # Only draw when the frame is displayed or recorded
+                if not self.headless or self.writer:
+                    annotated_frame = self.annotate_frame(frame.copy())
+                    if self.writer:
+                        self.writer.write(annotated_frame)
+                    if not self.headless:
+                        # Display the frame with proper window management
+                        cv2.imshow('Live Person Counter', annotated_frame)
                 
                 # Print status every 30 frames
                 if frame_count % 30 == 0:
                     elapsed_time = time.time() - start_time
                     actual_fps = frame_count / elapsed_time if elapsed_time > 0 else 0
-                    print(f"Processed {frame_count} frames - Entry: {self.entry_count}, Exit: {self.exit_count}, Density: {self.density_count}, FPS: {actual_fps:.1f}")
+                    dropped = self.capture.get_stats()['frames_dropped']
+                    print(f"Processed {frame_count} frames - Entry: {self.entry_count}, Exit: {self.exit_count}, Density: {self.density_count}, FPS: {actual_fps:.1f}, Dropped: {dropped}")
+                
+                if self.headless:
+                    continue
                 
                 # Check for exit key (ESC) or window close
                 key = cv2.waitKey(1) & 0xff
@@ -265,9 +316,6 @@ class LivePersonCounter:
                     print("Q pressed - stopping processing")
                     break
                 
-                # Small delay to control processing rate
-                time.sleep(0.01)
-                
             except Exception as e:
                 print(f"Error in processing loop: {e}")
                 time.sleep(1)
@@ -293,7 +341,12 @@ class LivePersonCounter:
             if not self._connect_to_stream():
                 return False
             
-            # Start processing
+            if self.output_path:
+                fourcc = cv2.VideoWriter_fourcc(*'mp4v')
+                self.writer = cv2.VideoWriter(self.output_path, fourcc, self.fps or 30, (self.width, self.height))
+            
+            # Start capturing and processing
+            self.capture.start()
             self.is_running = True
             self.processing_thread = threading.Thread(target=self._processing_loop, daemon=True)
             self.processing_thread.start()
@@ -316,10 +369,15 @@ class LivePersonCounter:
                 self.processing_thread.join(timeout=5)
             
             # Release resources
-            if self.cap:
-                self.cap.release()
+            if self.capture:
+                self.capture.stop()
+            
+            if self.writer:
+                self.writer.release()
+                self.writer = None
             
-            cv2.destroyAllWindows()
+            if not self.headless:
+                cv2.destroyAllWindows()
             
             print("✅ Live person counting stopped")
             
@@ -339,7 +397,12 @@ class LivePersonCounter:
         self.entry_count = 0
         self.exit_count = 0
         self.density_count = 0
-        self.previous_positions = {}
+        self.region_counts = {}
+        if self.line_counter:
+            self.line_counter = LineCounter(self.lines, self.width, self.height, source_size=self.source_size)
+        with self.frame_lock:
+            self.tracks = []
+            self.last_crossings = []
         print("🔄 Counters reset")
     
     def get_status(self) -> Dict[str, Any]:
@@ -349,6 +412,10 @@ class LivePersonCounter:
             'is_processing': self.is_processing,
             'stream_url': self.stream_url,
             'counts': self.get_counts(),
+            'lines': self.line_counter.get_counts() if self.line_counter else {},
+            'regions': dict(self.region_counts),
+            'tracks': self.get_tracks(),
+            'capture': self.capture.get_stats() if self.capture else {},
             'video_properties': {
                 'width': getattr(self, 'width', 0),
                 'height': getattr(self, 'height', 0),
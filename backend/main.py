@@ -1,5 +1,6 @@
-from fastapi import FastAPI, HTTPException, Depends, status, Request
+from fastapi import FastAPI, HTTPException, Depends, status, Request, WebSocket, WebSocketDisconnect
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import Response, StreamingResponse
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from pydantic import BaseModel, EmailStr
 from passlib.context import CryptContext
@@ -19,11 +20,16 @@ from dotenv import load_dotenv
 import certifi
 import logging
 import re
+import threading
+import asyncio
 import motor.motor_asyncio
 from bson import ObjectId
 
 # Import person counting service
-from person_counter_service import person_counter_service
+from person_counter_service import person_counter_service, PRELOAD_MODEL
+from count_store import CountWriter, ensure_timeseries_collection
+from live_broadcast import CountBroadcaster
+from metrics import MetricsWriter
 
 load_dotenv()
 
@@ -59,6 +65,21 @@ database = client[DATABASE_NAME]
 users_collection = database.get_collection("users")
 otp_collection = database.get_collection("otps")
 
+# Per-second person counts go to a time-series collection in batches
+PERSIST_COUNTS = os.getenv("PERSIST_COUNTS", "true").lower() == "true"
+COUNTS_COLLECTION = os.getenv("COUNTS_COLLECTION", "person_counts")
+COUNTS_RETENTION_DAYS = int(os.getenv("COUNTS_RETENTION_DAYS", "90"))
+COUNTS_BATCH_SIZE = int(os.getenv("COUNTS_BATCH_SIZE", "500"))
+COUNTS_FLUSH_INTERVAL_S = float(os.getenv("COUNTS_FLUSH_INTERVAL_S", "5"))
+count_writer: Optional[CountWriter] = None
+
+# Live count push: one status read per interval for all subscribers, at most max-rate messages per client
+LIVE_UPDATE_INTERVAL_S = float(os.getenv("LIVE_UPDATE_INTERVAL_S", "0.2"))
+LIVE_MAX_RATE = float(os.getenv("LIVE_MAX_RATE", "5"))
+LIVE_SLOW_TIMEOUT_S = float(os.getenv("LIVE_SLOW_TIMEOUT_S", "10"))
+broadcaster = CountBroadcaster(person_counter_service.get_status, interval=LIVE_UPDATE_INTERVAL_S,
+                               max_rate=LIVE_MAX_RATE, slow_timeout=LIVE_SLOW_TIMEOUT_S)
+
 # Create indexes for data integrity
 async def create_indexes():
     try:
@@ -469,6 +490,8 @@ async def get_all_user_emails():
 @app.post("/api/send-alert-to-all-users")
 async def send_alert_to_all_users(alert_data: dict):
     """Send alert email to all verified users in the database"""
+    # Open dashboards get the alert right away, whatever happens with the emails
+    broadcaster.publish_alert(alert_data)
     try:
         # Get all verified user emails - explicitly exclude _id field
         users = await users_collection.find(
@@ -605,6 +628,10 @@ async def start_person_counting(request: Request):
         data = await request.json()
         stream_url = data.get("streamUrl")
         zone = data.get("zone")
+        decoder = data.get("decoder")
+        lines = data.get("lines")
+        regions = data.get("regions")
+        calibration = data.get("calibration")
         
         if not stream_url or not zone:
             raise HTTPException(
@@ -612,7 +639,9 @@ async def start_person_counting(request: Request):
                 detail="Stream URL and zone are required"
             )
         
-        result = person_counter_service.start_counting(stream_url, zone)
+        # May wait for the detector to load; keep the event loop free for status and live updates
+        result = await asyncio.to_thread(person_counter_service.start_counting, stream_url, zone, decoder,
+                                         lines, regions, calibration)
         return result
         
     except Exception as e:
@@ -620,10 +649,16 @@ async def start_person_counting(request: Request):
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.post("/api/stop-person-counting")
-async def stop_person_counting():
-    """Stop AI person counting"""
+async def stop_person_counting(request: Request, zone: Optional[str] = None):
+    """Stop AI person counting for a zone, or for all zones when no zone is given"""
     try:
-        result = person_counter_service.stop_counting()
+        if zone is None:
+            body = await request.body()
+            if body:
+                zone = (await request.json()).get("zone")
+        
+        # Joins the worker threads
+        result = await asyncio.to_thread(person_counter_service.stop_counting, zone)
         return result
         
     except Exception as e:
@@ -631,25 +666,231 @@ async def stop_person_counting():
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
 @app.get("/api/person-counting-status")
-async def get_person_counting_status():
-    """Get current person counting status and counts"""
+async def get_person_counting_status(zone: Optional[str] = None):
+    """Get person counting status and counts for a zone, or for all zones"""
     try:
-        result = person_counter_service.get_status()
+        result = person_counter_service.get_status(zone)
         return result
         
     except Exception as e:
         logging.error(f"Failed to get person counting status: {str(e)}")
         raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
 
+@app.get("/api/person-counting-tracks")
+async def get_person_counting_tracks(zone: str):
+    """Get the current person tracks for a zone"""
+    try:
+        result = person_counter_service.get_tracks(zone)
+        return result
+        
+    except Exception as e:
+        logging.error(f"Failed to get person tracks: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.websocket("/ws/person-counting")
+async def person_counting_websocket(websocket: WebSocket, zone: Optional[str] = None,
+                                    max_rate: Optional[float] = None):
+    """Live counts and alerts: a snapshot first, then only the changes"""
+    await websocket.accept()
+    subscriber = broadcaster.subscribe(zone, max_rate)
+    try:
+        async for message in broadcaster.messages(subscriber):
+            # A client that can't take a message in time is dropped rather than buffered
+            await asyncio.wait_for(websocket.send_text(message), timeout=LIVE_SLOW_TIMEOUT_S)
+    except (WebSocketDisconnect, asyncio.TimeoutError):
+        pass
+    finally:
+        broadcaster.unsubscribe(subscriber)
+        try:
+            await websocket.close()
+        except Exception:
+            pass
+
+@app.get("/api/person-counting-stream")
+async def person_counting_stream(request: Request, zone: Optional[str] = None, max_rate: Optional[float] = None):
+    """Live counts and alerts as server-sent events, for clients without WebSockets"""
+    subscriber = broadcaster.subscribe(zone, max_rate)
+    
+    async def events():
+        try:
+            async for message in broadcaster.messages(subscriber):
+                if await request.is_disconnected():
+                    break
+                yield f"data: {message}\n\n"
+        finally:
+            broadcaster.unsubscribe(subscriber)
+    
+    return StreamingResponse(events(), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/api/person-counting-totals")
+async def get_person_counting_totals(zone: Optional[str] = None, since: Optional[float] = None):
+    """Stored entries/exits per zone since a time (epoch seconds, default midnight UTC); survives restarts"""
+    try:
+        if since is None:
+            start = datetime.utcnow().replace(hour=0, minute=0, second=0, microsecond=0)
+        else:
+            start = datetime.utcfromtimestamp(since)
+        match = {"timestamp": {"$gte": start}}
+        if zone:
+            match["zone"] = zone
+        
+        pipeline = [
+            {"$match": match},
+            {"$group": {"_id": "$zone", "entry": {"$sum": "$entries"}, "exit": {"$sum": "$exits"},
+                        "max_density": {"$max": "$max_density"}}}
+        ]
+        totals = {}
+        async for row in database.get_collection(COUNTS_COLLECTION).aggregate(pipeline):
+            totals[row["_id"]] = {"entry": int(row["entry"]), "exit": int(row["exit"]),
+                                  "max_density": int(row["max_density"])}
+        return {"success": True, "since": start, "zones": totals}
+        
+    except Exception as e:
+        logging.error(f"Failed to get person counting totals: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.get("/api/person-counting-history")
+async def get_person_counting_history(zone: str, start: Optional[float] = None, end: Optional[float] = None,
+                                      resolution: Optional[int] = None):
+    """Density and crossings over a time window (epoch seconds, default the last hour) for a zone"""
+    try:
+        result = person_counter_service.get_history(zone, start, end, resolution)
+        return result
+
+    except Exception as e:
+        logging.error(f"Failed to get person counting history: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.get("/api/person-counting-density")
+async def get_person_counting_density(zone: str, version: Optional[int] = None):
+    """Quantized occupancy grid for a zone; pass the version you have to only get changes"""
+    try:
+        result = person_counter_service.get_density_map(zone, version)
+        return result
+
+    except Exception as e:
+        logging.error(f"Failed to get density map: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.get("/api/person-counting-ground")
+async def get_person_counting_ground(zone: Optional[str] = None):
+    """Ground-plane positions of people for a zone, or merged across all calibrated cameras"""
+    try:
+        result = person_counter_service.get_ground_points(zone)
+        return result
+
+    except Exception as e:
+        logging.error(f"Failed to get ground points: {str(e)}")
+        raise HTTPException(status_code=500, detail=f"Internal server error: {str(e)}")
+
+@app.get("/api/person-counting-preview")
+async def get_person_counting_preview(request: Request, zone: str, quality: str = "high"):
+    """Annotated JPEG of the latest processed frame for a zone"""
+    return await camera_snapshot(request, zone, quality, annotate=True)
+
+async def _preview_jpeg(zone: str, quality: str, annotate: bool):
+    """Shared JPEG of the zone's latest frame; encoding runs off the event loop"""
+    try:
+        return await asyncio.to_thread(person_counter_service.get_preview_jpeg, zone, quality, annotate)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.get("/api/camera-snapshot")
+async def camera_snapshot(request: Request, zone: str, quality: str = "medium", annotate: bool = False):
+    """Latest camera frame for a zone, relayed from the counting worker so the camera has one client"""
+    preview = await _preview_jpeg(zone, quality, annotate)
+    if preview is None:
+        raise HTTPException(status_code=404, detail=f"No frame available for {zone}")
+    
+    seq, jpeg = preview
+    etag = f'"{zone}-{seq}-{quality}-{int(annotate)}"'
+    headers = {"ETag": etag, "Cache-Control": "no-cache"}
+    if request.headers.get("if-none-match") == etag:
+        return Response(status_code=304, headers=headers)
+    return Response(content=jpeg, media_type="image/jpeg", headers=headers)
+
+@app.get("/api/camera-mjpeg")
+async def camera_mjpeg(request: Request, zone: str, quality: str = "medium", annotate: bool = False,
+                       fps: float = 5):
+    """MJPEG stream of a zone's frames; every viewer shares the same encoded frames"""
+    preview = await _preview_jpeg(zone, quality, annotate)
+    if preview is None:
+        raise HTTPException(status_code=404, detail=f"No frame available for {zone}")
+    interval = 1.0 / min(max(fps, 0.5), 30)
+    
+    async def parts():
+        last_seq, jpeg = preview
+        while True:
+            yield (b"--frame\r\nContent-Type: image/jpeg\r\nContent-Length: " + str(len(jpeg)).encode()
+                   + b"\r\n\r\n" + jpeg + b"\r\n")
+            # Wait for a newer frame than the one just sent
+            while True:
+                await asyncio.sleep(interval)
+                if await request.is_disconnected():
+                    return
+                latest = await asyncio.to_thread(person_counter_service.get_preview_jpeg, zone, quality, annotate)
+                if latest is None:
+                    return
+                if latest[0] != last_seq:
+                    last_seq, jpeg = latest
+                    break
+    
+    return StreamingResponse(parts(), media_type="multipart/x-mixed-replace; boundary=frame",
+                             headers={"Cache-Control": "no-cache"})
+
+# Prometheus metrics
+@app.get("/metrics")
+async def metrics():
+    """Per-stream stage timings, queue depths and counters in Prometheus text format"""
+    writer = MetricsWriter()
+    person_counter_service.collect_metrics(writer)
+    if count_writer:
+        stats = count_writer.get_stats()
+        writer.sample("count_writer_queue", "gauge", "Count samples waiting to be written", stats["queued"])
+        writer.sample("count_writer_written_total", "counter", "Count samples written to MongoDB", stats["written"])
+        writer.sample("count_writer_dropped_total", "counter", "Count samples dropped on a full queue", stats["dropped"])
+        writer.sample("count_writer_failures_total", "counter", "Failed MongoDB batch writes", stats["failures"])
+    live = broadcaster.get_stats()
+    writer.sample("live_subscribers", "gauge", "Connected live count subscribers", live["subscribers"])
+    writer.sample("live_dropped_subscribers_total", "counter", "Live subscribers dropped for being slow",
+                  live["dropped"])
+    return Response(content=writer.render(), media_type="text/plain; version=0.0.4; charset=utf-8")
+
 # Health check endpoint
 @app.get("/health")
 async def health_check():
-    return {"status": "healthy", "timestamp": datetime.utcnow()}
+    readiness = person_counter_service.get_readiness()
+    return {
+        "status": "healthy",
+        "timestamp": datetime.utcnow(),
+        "ready": readiness["ready"],
+        "person_counter": readiness,
+        "count_writer": count_writer.get_stats() if count_writer else None,
+        "live": broadcaster.get_stats()
+    }
 
 # Startup event to create indexes
 @app.on_event("startup")
 async def startup_event():
+    global count_writer
     await create_indexes()
+    if PERSIST_COUNTS:
+        collection = await ensure_timeseries_collection(database, COUNTS_COLLECTION, COUNTS_RETENTION_DAYS)
+        count_writer = CountWriter(collection, batch_size=COUNTS_BATCH_SIZE, flush_interval=COUNTS_FLUSH_INTERVAL_S)
+        # The counting threads only append to the writer's queue; writes happen on this event loop
+        person_counter_service.add_sample_listener(count_writer.submit)
+        count_writer.start()
+    # Load and warm up the detector in the background; /health reports when it is ready
+    if PRELOAD_MODEL:
+        threading.Thread(target=person_counter_service.initialize_model,
+                         name="model-preload", daemon=True).start()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Write out whatever is still queued
+    if count_writer:
+        await count_writer.stop()
 
 if __name__ == "__main__":
     import uvicorn
@@ -0,0 +1,120 @@
+import bisect
+import threading
+import time
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+# Upper bounds in seconds, from sub-millisecond counting steps to multi-second stalls
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Pipeline stages timed per stream
+STAGES = ('capture_wait', 'decode', 'inference', 'postprocess', 'tracking', 'counting', 'drawing', 'encode')
+
+
+class Histogram:
+    """Cumulative latency histogram in the Prometheus layout; cheap enough to observe every frame"""
+
+    def __init__(self, buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds: float):
+        index = bisect.bisect_left(self.buckets, seconds)
+        with self.lock:
+            self.counts[index] += 1
+            self.sum += seconds
+            self.count += 1
+
+    def snapshot(self) -> Tuple[List[int], float, int]:
+        """Cumulative bucket counts (the last one is +Inf), sum and count"""
+        with self.lock:
+            counts, total, count = list(self.counts), self.sum, self.count
+        cumulative, running = [], 0
+        for c in counts:
+            running += c
+            cumulative.append(running)
+        return cumulative, total, count
+
+
+class StageTimer:
+    """Per-stage histograms for one stream"""
+
+    def __init__(self, stages: Iterable[str] = STAGES):
+        self.histograms: Dict[str, Histogram] = {stage: Histogram() for stage in stages}
+
+    def observe(self, stage: str, seconds: float):
+        self.histograms[stage].observe(seconds)
+
+    def time(self, stage: str) -> '_Timed':
+        """Context manager that observes the time spent inside it"""
+        return _Timed(self.histograms[stage])
+
+
+class _Timed:
+    __slots__ = ('histogram', 'started')
+
+    def __init__(self, histogram: Histogram):
+        self.histogram = histogram
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.histogram.observe(time.perf_counter() - self.started)
+        return False
+
+
+def _escape(value) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(labels: Dict[str, str]) -> str:
+    if not labels:
+        return ''
+    return '{' + ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items()) + '}'
+
+
+def _number(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class MetricsWriter:
+    """Builds a Prometheus text-format exposition, one HELP/TYPE header per metric family"""
+
+    def __init__(self, prefix: str = 'crowdshield'):
+        self.prefix = prefix
+        self.families: Dict[str, Tuple[str, str, List[str]]] = {}
+
+    def _family(self, name: str, kind: str, help_text: str) -> List[str]:
+        name = f'{self.prefix}_{name}'
+        if name not in self.families:
+            self.families[name] = (kind, help_text, [])
+        return self.families[name][2]
+
+    def sample(self, name: str, kind: str, help_text: str, value: Optional[float], **labels):
+        """Add a counter or gauge sample; None values are skipped"""
+        if value is None:
+            return
+        self._family(name, kind, help_text).append(f'{self.prefix}_{name}{_labels(labels)} {_number(value)}')
+
+    def histogram(self, name: str, help_text: str, histogram: Histogram, **labels):
+        lines = self._family(name, 'histogram', help_text)
+        cumulative, total, count = histogram.snapshot()
+        full = f'{self.prefix}_{name}'
+        for bound, value in zip(histogram.buckets + (float('inf'),), cumulative):
+            lines.append(f'{full}_bucket{_labels({**labels, "le": _number(bound)})} {value}')
+        lines.append(f'{full}_sum{_labels(labels)} {_number(total)}')
+        lines.append(f'{full}_count{_labels(labels)} {count}')
+
+    def render(self) -> str:
+        out = []
+        for name, (kind, help_text, lines) in self.families.items():
+            out.append(f'# HELP {name} {help_text}')
+            out.append(f'# TYPE {name} {kind}')
+            out.extend(lines)
+        return '\n'.join(out) + '\n'
@@ -0,0 +1,112 @@
+import threading
+import time
+import logging
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+
+from detector_backends import load_detector
+
+logger = logging.getLogger(__name__)
+
+
+class SharedModel:
+    """
+    A loaded detector shared by every counter in the process.
+
+    ultralytics predictors keep per-call state, so predict() calls on the
+    shared instance are serialized. On the CPU a single predict already uses
+    all cores, so this costs little compared with loading one copy per counter.
+    """
+
+    def __init__(self, model, name: str):
+        self.model = model
+        self.name = name
+        self.lock = threading.Lock()
+
+    def predict(self, *args, **kwargs):
+        with self.lock:
+            return self.model.predict(*args, **kwargs)
+
+    def __getattr__(self, attr):
+        # Everything other than predict (names, task, ...) comes from the wrapped model
+        return getattr(self.model, attr)
+
+
+class ModelRegistry:
+    """
+    Process-wide cache of loaded and warmed-up detectors.
+
+    Models are keyed by backend, weights, input size and precision. The
+    first get() for a key loads it and runs a few dummy inferences so the
+    first real frame does not pay for lazy initialization. Concurrent
+    callers for the same key wait for that one load.
+    """
+
+    def __init__(self, warmup_runs: int = 2):
+        self.warmup_runs = warmup_runs
+        self.lock = threading.Lock()
+        self.models: Dict[Tuple, SharedModel] = {}
+        self.key_locks: Dict[Tuple, threading.Lock] = {}
+        self.info: Dict[Tuple, Dict[str, Any]] = {}
+
+    @staticmethod
+    def _key(backend: str, model_path: str, imgsz: int, int8: bool) -> Tuple:
+        return backend, model_path, imgsz, int8
+
+    def get(self, backend: str = 'torch', model_path: str = 'yolov8s.pt', imgsz: int = 640,
+            int8: bool = False, calibration_source: Optional[str] = None,
+            warmup_batch: int = 1) -> SharedModel:
+        """Shared detector for the configuration, loading and warming it up on first use"""
+        key = self._key(backend, model_path, imgsz, int8)
+        with self.lock:
+            model = self.models.get(key)
+            if model is not None:
+                return model
+            key_lock = self.key_locks.setdefault(key, threading.Lock())
+
+        with key_lock:
+            with self.lock:
+                model = self.models.get(key)
+                if model is not None:
+                    return model
+                self.info[key] = {'backend': backend, 'model': model_path, 'imgsz': imgsz, 'int8': int8,
+                                  'state': 'loading'}
+
+            try:
+                started = time.time()
+                detector = load_detector(backend, model_path, imgsz, int8, calibration_source)
+                loaded = time.time()
+                self._warmup(detector, imgsz, warmup_batch)
+                warmed = time.time()
+            except Exception as e:
+                with self.lock:
+                    self.info[key].update({'state': 'failed', 'error': str(e)})
+                raise
+
+            model = SharedModel(detector, f"{backend}:{model_path}@{imgsz}{':int8' if int8 else ''}")
+            with self.lock:
+                self.models[key] = model
+                self.info[key].update({
+                    'state': 'ready',
+                    'load_time_s': loaded - started,
+                    'warmup_time_s': warmed - loaded,
+                    'ready_at': warmed,
+                })
+            logger.info(f"Model {model.name} ready (load {loaded - started:.1f}s, warm-up {warmed - loaded:.1f}s)")
+            return model
+
+    def _warmup(self, detector, imgsz: int, batch: int):
+        """Dummy inferences so weights, kernels and buffers are initialized before real frames"""
+        frames = [np.zeros((imgsz, imgsz, 3), dtype=np.uint8)] * max(1, batch)
+        for _ in range(self.warmup_runs):
+            detector.predict(frames, imgsz=imgsz, device='cpu', verbose=False)
+
+    def get_status(self) -> List[Dict[str, Any]]:
+        """Load state and timings of every model"""
+        with self.lock:
+            return [dict(info) for info in self.info.values()]
+
+
+# Global instance
+model_registry = ModelRegistry()
@@ -0,0 +1,74 @@
+import cv2
+import time
+from typing import Any, Dict, Optional
+
+import numpy as np
+
+
+class MotionGate:
+    """
+    Cheap check for whether a frame changed enough to be worth a detector run.
+
+    Frames are downscaled to a small blurred grayscale image and compared
+    with the image from the last frame that was sent to the detector. The
+    comparison is against the last detected frame rather than the previous
+    frame, so slow movement still adds up and opens the gate eventually.
+    When the fraction of changed pixels stays under the sensitivity, the
+    caller reuses its last detections. A refresh is forced every
+    refresh_interval seconds no matter what.
+    """
+
+    def __init__(self, sensitivity: float = 0.002, pixel_threshold: int = 25,
+                 refresh_interval: float = 5.0, width: int = 160):
+        self.sensitivity = sensitivity
+        self.pixel_threshold = pixel_threshold
+        self.refresh_interval = refresh_interval
+        self.width = width
+
+        self.reference: Optional[np.ndarray] = None
+        self.last_refresh = 0.0
+        self.last_changed = None
+        self.frames_checked = 0
+        self.frames_skipped = 0
+
+    def _downscale(self, frame: np.ndarray) -> np.ndarray:
+        """Small blurred grayscale copy of the frame"""
+        h, w = frame.shape[:2]
+        size = (self.width, max(1, round(h * self.width / w)))
+        small = cv2.resize(frame, size, interpolation=cv2.INTER_AREA)
+        if small.ndim == 3:
+            small = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY)
+        return cv2.GaussianBlur(small, (5, 5), 0)
+
+    def should_detect(self, frame: np.ndarray, now: Optional[float] = None) -> bool:
+        """Whether the detector should run; a frame that passes becomes the new reference"""
+        now = time.time() if now is None else now
+        self.frames_checked += 1
+        small = self._downscale(frame)
+
+        if (self.reference is None or self.reference.shape != small.shape
+                or now - self.last_refresh >= self.refresh_interval):
+            motion = True
+        else:
+            diff = cv2.absdiff(small, self.reference)
+            _, changed = cv2.threshold(diff, self.pixel_threshold, 255, cv2.THRESH_BINARY)
+            self.last_changed = cv2.countNonZero(changed) / changed.size
+            motion = self.last_changed > self.sensitivity
+
+        if not motion:
+            self.frames_skipped += 1
+            return False
+        self.reference = small
+        self.last_refresh = now
+        return True
+
+    def get_stats(self) -> Dict[str, Any]:
+        """How many frames the gate looked at and how many it skipped"""
+        return {
+            'frames_checked': self.frames_checked,
+            'frames_skipped': self.frames_skipped,
+            'skip_ratio': self.frames_skipped / self.frames_checked if self.frames_checked else 0.0,
+            'last_changed_fraction': self.last_changed,
+            'sensitivity': self.sensitivity,
+            'refresh_interval_s': self.refresh_interval,
+        }
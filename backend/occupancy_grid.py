@@ -0,0 +1,92 @@
+import base64
+import math
+import threading
+import time
+from typing import Any, Dict, Optional, Sequence
+
+import numpy as np
+
+
+class OccupancyGrid:
+    """
+    Decaying per-camera occupancy map built from tracked people.
+
+    The frame is divided into cols x rows cells. Every update bins the
+    bottom center of each track box into its cell with one bincount and
+    blends the result into the grid with an exponential moving average,
+    so a cell holds the average number of people standing in it over
+    roughly the last half_life seconds, independent of the frame rate.
+
+    Clients get the grid quantized to 8 bits against a power-of-two scale.
+    The version only changes when the quantized grid does, so a client
+    that sends the version it has back receives nothing until the picture
+    actually changes.
+    """
+
+    def __init__(self, width: int, height: int, cols: int = 32, rows: int = 18, half_life: float = 10.0):
+        self.width = width
+        self.height = height
+        self.cols = cols
+        self.rows = rows
+        self.half_life = half_life
+        self.lock = threading.Lock()
+
+        self.grid = np.zeros(rows * cols, dtype=np.float32)
+        self.quantized = np.zeros(rows * cols, dtype=np.uint8)
+        self.scale = 1.0
+        self.version = 0
+        self.last_update = None
+        self.encoded = None
+
+    def update(self, tracks: Sequence[Sequence[int]], now: Optional[float] = None) -> bool:
+        """Blend in the people of one frame; returns True if the served grid changed"""
+        now = time.time() if now is None else now
+        data = np.asarray(tracks, dtype=np.int64).reshape(-1, 5)
+        xs = np.clip((data[:, 0] + data[:, 2]) // 2 * self.cols // self.width, 0, self.cols - 1)
+        ys = np.clip(data[:, 3] * self.rows // self.height, 0, self.rows - 1)
+        counts = np.bincount(ys * self.cols + xs, minlength=self.rows * self.cols).astype(np.float32)
+
+        # Weight of the history after the time since the last frame; the first frame fills the grid
+        if self.last_update is None:
+            keep = 0.0
+        else:
+            keep = 0.5 ** (max(0.0, now - self.last_update) / self.half_life)
+        self.last_update = now
+        grid = self.grid * keep + counts * (1.0 - keep)
+
+        # Power-of-two scale, so it stays put while the densest cell drifts
+        peak = float(grid.max())
+        scale = float(2 ** math.ceil(math.log2(peak))) if peak > 1.0 else 1.0
+        quantized = np.rint(grid * (255.0 / scale)).astype(np.uint8)
+
+        with self.lock:
+            self.grid = grid
+            if self.version and scale == self.scale and np.array_equal(quantized, self.quantized):
+                return False
+            self.quantized = quantized
+            self.scale = scale
+            self.version += 1
+            self.encoded = None
+            return True
+
+    def get_grid(self, since: Optional[int] = None) -> Dict[str, Any]:
+        """
+        The quantized grid as base64 row-major bytes; people per cell is value / 255 * scale.
+
+        When since equals the current version only the version is returned.
+        """
+        with self.lock:
+            if since is not None and since == self.version:
+                return {'version': self.version, 'changed': False}
+            if self.encoded is None:
+                self.encoded = base64.b64encode(self.quantized.tobytes()).decode('ascii')
+            return {
+                'version': self.version,
+                'changed': True,
+                'cols': self.cols,
+                'rows': self.rows,
+                'scale': self.scale,
+                'half_life_s': self.half_life,
+                'updated_at': self.last_update,
+                'data': self.encoded,
+            }
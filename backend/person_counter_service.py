@@ -1,235 +1,886 @@
 import cv2
 import numpy as np
-from ultralytics import YOLO
 import threading
 import time
 import os
-from typing import Dict, Any, Optional
+from collections import deque
+from concurrent.futures import CancelledError
+from typing import Callable, Dict, Any, List, Optional, Tuple
 import logging
 
+from count_history import CountHistory
+from counting_lines import LineCounter, parse_lines
+from detections import decode_person_boxes, person_class_ids
+from detector_backends import prepare_model_path
+from frame_relay import JpegCache
+from frame_source import DECODERS, create_capture
+from ground_plane import GroundProjector, merge_points, parse_calibration, parse_calibrations
+from inference_batcher import InferenceBatcher
+from metrics import Histogram, MetricsWriter, StageTimer
+from model_registry import model_registry
+from motion_gate import MotionGate
+from occupancy_grid import OccupancyGrid
+from process_workers import ProcessInferencePool, SharedRingCapture
+from regions import RegionCounter, parse_regions
+from resolution_controller import ResolutionController
+from tiling import TiledDetector
+from tracker import KalmanTracker
+
 # Configure logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-class PersonCounterService:
-    def __init__(self):
-        self.model = None
+# Registry limits
+MAX_ZONES = int(os.getenv("PERSON_COUNTER_MAX_ZONES", "32"))
+MAX_TRACKED_PER_ZONE = int(os.getenv("PERSON_COUNTER_MAX_TRACKED", "512"))
+MAX_EVENTS_PER_ZONE = int(os.getenv("PERSON_COUNTER_MAX_EVENTS", "100"))
+
+# Batched inference across zones
+INFERENCE_BATCH_SIZE = int(os.getenv("PERSON_COUNTER_BATCH_SIZE", "8"))
+INFERENCE_BATCH_WAIT_MS = float(os.getenv("PERSON_COUNTER_BATCH_WAIT_MS", "20"))
+
+# Run the detector every N frames (or every interval) and predict tracks in between
+DETECT_EVERY = int(os.getenv("PERSON_COUNTER_DETECT_EVERY", "1"))
+DETECT_INTERVAL_MS = float(os.getenv("PERSON_COUNTER_DETECT_INTERVAL_MS", "0"))
+
+# 'thread' runs capture and inference in threads of this process; 'process' moves them
+# into worker processes that exchange frames through shared memory
+EXECUTION_MODE = os.getenv("PERSON_COUNTER_EXECUTION_MODE", "thread")
+PROCESS_WORKERS = int(os.getenv("PERSON_COUNTER_PROCESS_WORKERS", str(os.cpu_count() or 2)))
+
+# Load and warm up the detector at API startup instead of on the first start request
+PRELOAD_MODEL = os.getenv("PERSON_COUNTER_PRELOAD", "true").lower() == "true"
+
+# Detector backend: 'torch', 'onnx' or 'openvino', optionally INT8-quantized on our own footage
+DETECTOR_BACKEND = os.getenv("PERSON_COUNTER_DETECTOR_BACKEND", "torch")
+DETECTOR_MODEL = os.getenv("PERSON_COUNTER_MODEL", "yolov8s.pt")
+DETECTOR_INT8 = os.getenv("PERSON_COUNTER_DETECTOR_INT8", "false").lower() == "true"
+DETECTOR_CALIBRATION_SOURCE = os.getenv("PERSON_COUNTER_CALIBRATION_SOURCE")
+
+# Tiled detection for high-resolution cameras; a tile size of 0 sends whole frames
+TILE_SIZE = int(os.getenv("PERSON_COUNTER_TILE_SIZE", "0"))
+TILE_OVERLAP = float(os.getenv("PERSON_COUNTER_TILE_OVERLAP", "0.2"))
+TILES_PER_BATCH = int(os.getenv("PERSON_COUNTER_TILES_PER_BATCH", "8"))
+
+# Detector input size. With a target FPS, each stream steps its input size between the
+# minimum and this size so detection keeps up with the target as host load changes
+DETECTOR_IMGSZ = int(os.getenv("PERSON_COUNTER_IMGSZ", "640"))
+TARGET_FPS = float(os.getenv("PERSON_COUNTER_TARGET_FPS", "0"))
+MIN_IMGSZ = int(os.getenv("PERSON_COUNTER_MIN_IMGSZ", "320"))
+
+# Stream decoder: 'opencv' or 'ffmpeg'. ffmpeg decodes straight to the detector's input size
+# (the longest side is scaled to the decode size; full resolution when tiling) at an optional
+# lower frame rate, and can skip non-reference frames before decoding them
+DECODER = os.getenv("PERSON_COUNTER_DECODER", "opencv")
+DECODE_MAX_SIZE = int(os.getenv("PERSON_COUNTER_DECODE_SIZE", "0" if TILE_SIZE else str(DETECTOR_IMGSZ)))
+DECODE_FPS = float(os.getenv("PERSON_COUNTER_DECODE_FPS", "0"))
+DECODE_SKIP_FRAME = os.getenv("PERSON_COUNTER_DECODE_SKIP_FRAME")
+DECODE_THREADS = int(os.getenv("PERSON_COUNTER_DECODE_THREADS", "2"))
+
+# Counting lines as JSON (see counting_lines.parse_lines); default is the vertical center line
+COUNTING_LINES = os.getenv("PERSON_COUNTER_LINES")
+
+# Named polygon regions per camera as JSON (see regions.parse_regions), counted from the
+# same detections; people are placed by the bottom center of their box
+REGIONS = os.getenv("PERSON_COUNTER_REGIONS")
+
+# Skip the detector while the scene is static; sensitivity is the fraction of changed pixels
+MOTION_GATE = os.getenv("PERSON_COUNTER_MOTION_GATE", "false").lower() == "true"
+MOTION_SENSITIVITY = float(os.getenv("PERSON_COUNTER_MOTION_SENSITIVITY", "0.002"))
+MOTION_REFRESH_S = float(os.getenv("PERSON_COUNTER_MOTION_REFRESH_S", "5"))
+
+# Occupancy grid per camera (columns x rows) and how fast old positions fade out of it
+DENSITY_GRID = os.getenv("PERSON_COUNTER_DENSITY_GRID", "32x18")
+DENSITY_HALF_LIFE_S = float(os.getenv("PERSON_COUNTER_DENSITY_HALF_LIFE_S", "10"))
+
+# Camera calibrations keyed by zone, as JSON or a JSON file path (see ground_plane.parse_calibration);
+# people seen by two cameras closer than the radius are merged into one ground point
+CALIBRATIONS = os.getenv("PERSON_COUNTER_CALIBRATIONS")
+GROUND_DEDUP_RADIUS_M = float(os.getenv("PERSON_COUNTER_GROUND_DEDUP_RADIUS_M", "0.5"))
+
+
+class StreamWorker:
+    """Counts people on a single camera stream for one zone"""
+
+    def __init__(self, zone: str, stream_url: str, batcher: Optional[InferenceBatcher],
+                 max_tracked: int = MAX_TRACKED_PER_ZONE, max_events: int = MAX_EVENTS_PER_ZONE,
+                 detect_every: int = DETECT_EVERY, detect_interval_ms: float = DETECT_INTERVAL_MS,
+                 tile_size: int = TILE_SIZE, tile_overlap: float = TILE_OVERLAP,
+                 tiles_per_batch: int = TILES_PER_BATCH, imgsz: int = DETECTOR_IMGSZ,
+                 target_fps: float = TARGET_FPS, min_imgsz: int = MIN_IMGSZ,
+                 motion_gate: bool = MOTION_GATE, motion_sensitivity: float = MOTION_SENSITIVITY,
+                 motion_refresh_s: float = MOTION_REFRESH_S, decoder: str = DECODER,
+                 lines: Optional[list] = None, regions: Optional[list] = None,
+                 calibration: Optional[dict] = None, history: Optional[CountHistory] = None,
+                 on_sample: Optional[Callable[[Dict[str, Any]], None]] = None):
+        self.zone = zone
+        self.stream_url = stream_url
+        self.decoder = decoder
+        self.lines = parse_lines(lines if lines is not None else COUNTING_LINES)
+        self.line_counter = None
+        self.line_counts = {line['name']: {'entry': 0, 'exit': 0} for line in self.lines}
+        self.regions = parse_regions(regions if regions is not None else REGIONS)
+        self.region_counter = None
+        self.region_counts = {region['name']: 0 for region in self.regions}
+        self.occupancy = None
+        self.calibration = parse_calibration(calibration)
+        self.ground = None
+        self.ground_points = np.empty((0, 2))
+        self.ground_ids = np.empty(0, dtype=np.int64)
+        # Kept by the service across restarts of the zone, so the history survives a new worker
+        self.history = history if history is not None else CountHistory()
+        # Called with every completed second of counts, from this worker's thread
+        self.on_sample = on_sample
+        self.sample_second = None
+        self.batcher = batcher
+        # Tiles go through the shared batcher, so they are batched with the other zones' frames
+        self.tiler = None
+        if tile_size and batcher:
+            self.tiler = TiledDetector(lambda crops: self.batcher.infer_many(self.zone, crops, imgsz=self.imgsz),
+                                       tile_size=tile_size, overlap=tile_overlap,
+                                       tiles_per_batch=tiles_per_batch, classes=batcher.classes)
+        self.tracker = KalmanTracker(detect_every=detect_every,
+                                     detect_interval=detect_interval_ms / 1000.0 if detect_interval_ms else None)
+        # The detector only runs every detect_every frames, so each detection gets that many frame budgets
+        self.fixed_imgsz = imgsz
+        self.resolution = None
+        if target_fps:
+            self.resolution = ResolutionController(target_fps / max(1, detect_every),
+                                                   min_imgsz=min_imgsz, max_imgsz=imgsz)
+        self.motion_gate = MotionGate(motion_sensitivity, refresh_interval=motion_refresh_s) if motion_gate else None
+        self.max_tracked = max_tracked
         self.is_running = False
         self.current_counts = {
             'entry': 0,
             'exit': 0,
             'density': 0
         }
+        # Most recent entry/exit events, bounded so long-running workers don't grow
+        self.recent_events = deque(maxlen=max_events)
+        self.frame_count = 0
+        self.started_at = None
+        self.last_frame_age = None
+        self.capture = None
+        # Latest results, kept so overlays can be drawn on demand
+        self.frame_size = (0, 0)
+        self.latest_frame = None
+        self.latest_frame_seq = 0
+        self.tracks = []
+        self.last_crossings = []
         self.processing_thread = None
-        self.stream_url = None
-        self.zone = None
         self.lock = threading.Lock()
-        
+        # Per-stage timings and capture-to-count latency, exported on /metrics
+        self.stages = StageTimer()
+        self.latency = Histogram()
+        # Preview JPEGs for every viewer, encoded once per frame and quality
+        self.previews = JpegCache(self._latest_frame_seq, self._render_preview, self.stages.histograms['encode'])
+
+    def start(self):
+        """Start processing the stream in a background thread"""
+        self.is_running = True
+        self.started_at = time.time()
+        if self.batcher:
+            self.batcher.register(self.zone)
+        self.processing_thread = threading.Thread(target=self._process_stream,
+                                                  name=f"person-counter-{self.zone}")
+        self.processing_thread.daemon = True
+        self.processing_thread.start()
+
+    def stop(self, timeout: float = 5):
+        """Signal the worker to stop and wait for its thread"""
+        self.is_running = False
+        if self.processing_thread and self.processing_thread.is_alive():
+            self.processing_thread.join(timeout=timeout)
+
+    @property
+    def imgsz(self) -> int:
+        """Detector input size for the next detection"""
+        return self.resolution.imgsz if self.resolution else self.fixed_imgsz
+
+    def get_counts(self) -> Dict[str, int]:
+        """Get a copy of the current counts"""
+        with self.lock:
+            return self.current_counts.copy()
+
+    def get_status(self) -> Dict[str, Any]:
+        """Get status and counts for this zone"""
+        with self.lock:
+            return {
+                'status': 'running' if self.is_running else 'stopped',
+                'counts': self.current_counts.copy(),
+                'lines': {name: counts.copy() for name, counts in self.line_counts.items()},
+                'regions': self.region_counts.copy(),
+                'density_map_version': self.occupancy.version if self.occupancy else None,
+                'ground': self._ground_summary(),
+                'stream_url': self.stream_url,
+                'zone': self.zone,
+                'frames_processed': self.frame_count,
+                'started_at': self.started_at,
+                'recent_events': list(self.recent_events),
+                'motion_gate': self.motion_gate.get_stats() if self.motion_gate else None,
+                'resolution': self.resolution.get_stats() if self.resolution else {'imgsz': self.fixed_imgsz, 'auto': False},
+                'capture': {
+                    **(self.capture.get_stats() if self.capture else {}),
+                    'last_frame_age_ms': self.last_frame_age * 1000 if self.last_frame_age is not None else None
+                },
+                'previews': self.previews.get_stats()
+            }
+
+    def collect_metrics(self, writer: MetricsWriter):
+        """Add this stream's stage timings, latency and counters to a Prometheus exposition"""
+        zone = self.zone
+        for stage, histogram in self.stages.histograms.items():
+            writer.histogram('stage_seconds', 'Time per frame spent in each pipeline stage', histogram,
+                             zone=zone, stage=stage)
+        writer.histogram('capture_to_count_seconds', 'Time from frame capture until its counts are updated',
+                         self.latency, zone=zone)
+
+        capture = self.capture.get_stats() if self.capture else {}
+        with self.lock:
+            counts = self.current_counts.copy()
+        writer.sample('stream_up', 'gauge', 'Whether the stream worker is running', int(self.is_running), zone=zone)
+        writer.sample('frames_processed_total', 'counter', 'Frames tracked and counted', self.frame_count, zone=zone)
+        writer.sample('frames_captured_total', 'counter', 'Frames decoded from the camera',
+                      capture.get('frames_captured'), zone=zone)
+        writer.sample('frames_dropped_total', 'counter', 'Decoded frames replaced before the worker read them',
+                      capture.get('frames_dropped'), zone=zone)
+        writer.sample('capture_read_failures_total', 'counter', 'Failed reads from the camera',
+                      capture.get('read_failures'), zone=zone)
+        if self.motion_gate:
+            writer.sample('motion_skipped_frames_total', 'counter', 'Detector runs skipped because nothing moved',
+                          self.motion_gate.frames_skipped, zone=zone)
+        writer.sample('entries_total', 'counter', 'Line crossings counted as entries', counts['entry'], zone=zone)
+        writer.sample('exits_total', 'counter', 'Line crossings counted as exits', counts['exit'], zone=zone)
+        writer.sample('people', 'gauge', 'People currently tracked', counts['density'], zone=zone)
+        writer.sample('detector_input_size', 'gauge', 'Detector input size for the next detection', self.imgsz,
+                      zone=zone)
+
+    def get_tracks(self) -> list:
+        """Current tracks as data"""
+        with self.lock:
+            tracks = list(self.tracks)
+        return [
+            {'id': person_id, 'box': [x1, y1, x2, y2], 'center': [(x1 + x2) // 2, (y1 + y2) // 2]}
+            for x1, y1, x2, y2, person_id in tracks
+        ]
+
+    def get_ground_points(self) -> Optional[Dict[str, Any]]:
+        """Where the tracked people stand in world coordinates, or None without a calibration"""
+        if not self.ground:
+            return None
+        with self.lock:
+            points, ids = self.ground_points, self.ground_ids
+        return {'camera': self.zone, 'units': self.ground.units, 'points': points, 'ids': ids}
+
+    def _ground_summary(self) -> Dict[str, Any]:
+        """People inside the calibrated area and their density (lock must be held)"""
+        if not self.ground:
+            return {'calibrated': self.calibration is not None}
+        inside = int(np.count_nonzero(self.ground.in_area(self.ground_points)))
+        area = self.ground.area_m2
+        return {
+            'calibrated': True,
+            'units': self.ground.units,
+            'people': inside,
+            'area_m2': area,
+            'people_per_m2': inside / area if area else None,
+        }
+
+    def _latest_frame_seq(self) -> Optional[int]:
+        with self.lock:
+            return self.latest_frame_seq if self.latest_frame is not None else None
+
+    def _render_preview(self, annotated: bool) -> Optional[Tuple[int, np.ndarray]]:
+        """Copy of the most recently processed frame and its sequence number, optionally with overlays"""
+        with self.lock:
+            if self.latest_frame is None:
+                return None
+            seq = self.latest_frame_seq
+            frame = self.latest_frame.copy()
+            tracks = list(self.tracks)
+            crossings = list(self.last_crossings)
+            counts = self.current_counts.copy()
+            region_counts = self.region_counts.copy()
+        if annotated:
+            with self.stages.time('drawing'):
+                frame = self._annotate(frame, tracks, crossings, counts)
+                if self.region_counter:
+                    self.region_counter.draw(frame, region_counts)
+        return seq, frame
+
+    def _annotate(self, frame: np.ndarray, tracks: list, crossings: list, counts: Dict[str, int]) -> np.ndarray:
+        """Draw tracks, the counting lines and counts onto the frame in place"""
+        width, height = self.frame_size
+
+        for x1, y1, x2, y2, person_id in tracks:
+            cx = int((x1 + x2) // 2)
+            cy = int((y1 + y2) // 2)
+            # Draw bounding box
+            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
+            cv2.circle(frame, (cx, cy), 4, (255, 0, 255), -1)
+
+        for kind, _, _, cx, cy in crossings:
+            color = (0, 255, 0) if kind == 'entry' else (0, 0, 255)
+            cv2.circle(frame, (cx, cy), 15, color, 3)
+
+        # Draw counting lines
+        if self.line_counter:
+            self.line_counter.draw(frame)
+
+        # Draw counts on frame
+        cv2.putText(frame, f'Entry: {counts["entry"]}', (10, 30),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
+        cv2.putText(frame, f'Exit: {counts["exit"]}', (10, 70),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
+        cv2.putText(frame, f'Density: {counts["density"]}', (10, 110),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
+        cv2.putText(frame, f'Zone: {self.zone}', (10, height - 20),
+                    cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
+        return frame
+
+    def _record_event(self, kind: str, line: str, person_id: int):
+        """Count an entry/exit and keep it in the bounded event log (lock must be held)"""
+        self.current_counts[kind] += 1
+        self.line_counts[line][kind] += 1
+        self.recent_events.append({'type': kind, 'line': line, 'id': person_id, 'timestamp': time.time()})
+
+    def _emit_sample(self, second: int):
+        """Hand the completed second of counts and the running totals to the listener"""
+        sample = self.history.bucket(second)
+        if sample is None:
+            return
+        with self.lock:
+            totals = self.current_counts.copy()
+        self.on_sample({'zone': self.zone, **sample, 'total_entry': totals['entry'], 'total_exit': totals['exit']})
+
+    def _decoder_options(self) -> Dict[str, Any]:
+        """FFmpeg decoder settings; the OpenCV decoder takes none"""
+        if self.decoder != 'ffmpeg':
+            return {}
+        return {'max_size': DECODE_MAX_SIZE or None, 'fps': DECODE_FPS or None,
+                'skip_frame': DECODE_SKIP_FRAME, 'threads': DECODE_THREADS}
+
+    def _create_capture(self):
+        """Frame source for the stream; decoding runs on its own thread and only the newest frame is kept"""
+        return create_capture(self.stream_url, self.decoder, name=self.zone, **self._decoder_options())
+
+    def _detect(self, frame: np.ndarray, frame_index: int) -> Optional[np.ndarray]:
+        """Person boxes for a frame, or None if the frame was skipped"""
+        # Run YOLO detection, batched with the other zones
+        try:
+            with self.stages.time('inference'):
+                if self.tiler:
+                    return self.tiler.detect(frame)
+                result = self.batcher.infer(self.zone, frame, imgsz=self.imgsz)
+        except CancelledError:
+            return None
+        with self.stages.time('postprocess'):
+            return decode_person_boxes(result, conf=0.5)
+
+    def _process_stream(self):
+        """Process the live stream and count people"""
+        try:
+            logger.info(f"Starting stream processing for {self.zone}")
+
+            # Open the stream
+            self.capture = self._create_capture()
+            if not self.capture.start():
+                return
+            if hasattr(self.capture, 'decode_time'):
+                # Decoding runs on the capture thread, which records its own timings
+                self.stages.histograms['decode'] = self.capture.decode_time
+
+            # Get video properties
+            fps = self.capture.fps
+            width = self.capture.width
+            height = self.capture.height
+
+            logger.info(f"[{self.zone}] Stream properties: {width}x{height} @ {fps}fps")
+            self.frame_size = (width, height)
+            # Lines, regions and calibrations in pixels refer to the stream, which may be decoded smaller
+            source_size = (self.capture.source_width or width, self.capture.source_height or height)
+
+            # All counting lines are tested against all tracks in one pass per frame
+            self.line_counter = LineCounter(self.lines, width, height, source_size=source_size)
+            # Region masks are rasterized once; each frame is one lookup and one bincount
+            self.region_counter = RegionCounter(self.regions, width, height,
+                                                source_size=source_size) if self.regions else None
+            cols, rows = (int(n) for n in DENSITY_GRID.lower().split('x'))
+            self.occupancy = OccupancyGrid(width, height, cols, rows, half_life=DENSITY_HALF_LIFE_S)
+            self.ground = GroundProjector(self.calibration, width, height,
+                                          source_size=source_size) if self.calibration else None
+
+            while self.is_running:
+                wait_started = time.perf_counter()
+                latest = self.capture.read(timeout=1.0)
+                if latest is None:
+                    continue
+                self.stages.observe('capture_wait', time.perf_counter() - wait_started)
+
+                frame, captured_at, frame_index = latest
+                self.frame_count += 1
+
+                try:
+                    detect = self.tracker.should_detect()
+                    if detect and self.motion_gate and not self.motion_gate.should_detect(frame):
+                        # Nothing moved since the last detection: reuse its tracks and density
+                        bbox_id = self.tracks
+                    elif detect:
+                        detect_started = time.time()
+                        person_boxes = self._detect(frame, frame_index)
+                        if person_boxes is None:
+                            continue
+                        if self.resolution:
+                            self.resolution.record(time.time() - detect_started)
+
+                        # Process detections
+                        with self.stages.time('tracking'):
+                            bbox_id = self.tracker.update(person_boxes[:self.max_tracked])
+                    else:
+                        # Between detector runs, count on the Kalman-predicted positions
+                        with self.stages.time('tracking'):
+                            bbox_id = self.tracker.predict()
+
+                    # Counting
+                    counting_started = time.perf_counter()
+                    crossings = self.line_counter.update(bbox_id)
+                    if crossings:
+                        with self.lock:
+                            for kind, line, person_id, _, _ in crossings:
+                                self._record_event(kind, line, person_id)
+                        for kind, line, person_id, _, _ in crossings:
+                            logger.info(f"[{self.zone}] Person {person_id} {'ENTERED' if kind == 'entry' else 'EXITED'} "
+                                        f"at {line}")
+
+                    region_counts = self.region_counter.count(bbox_id) if self.region_counter else {}
+                    self.occupancy.update(bbox_id)
+
+                    # Everyone's feet onto the ground plane in one transform
+                    if self.ground:
+                        ground_points = self.ground.project(bbox_id)
+                        visible = np.isfinite(ground_points).all(axis=1)
+                        ground_ids = np.asarray(bbox_id, dtype=np.int64).reshape(-1, 5)[visible, 4]
+                        ground_points = ground_points[visible]
+
+                    # Update density (current people in frame) and keep the results as data
+                    with self.lock:
+                        self.current_counts['density'] = len(bbox_id)
+                        self.region_counts = region_counts
+                        if self.ground:
+                            self.ground_points = ground_points
+                            self.ground_ids = ground_ids
+                        self.latest_frame = frame
+                        self.latest_frame_seq += 1
+                        self.tracks = bbox_id
+                        self.last_crossings = crossings
+
+                    entries = sum(1 for crossing in crossings if crossing[0] == 'entry')
+                    now = time.time()
+                    self.history.record(len(bbox_id), entries, len(crossings) - entries, now=now)
+                    self.stages.observe('counting', time.perf_counter() - counting_started)
+                    if int(now) != self.sample_second:
+                        if self.on_sample and self.sample_second is not None:
+                            self._emit_sample(self.sample_second)
+                        self.sample_second = int(now)
+
+                    self.last_frame_age = time.time() - captured_at
+                    self.latency.observe(self.last_frame_age)
+
+                    # Log progress every 30 frames
+                    if self.frame_count % 30 == 0:
+                        with self.lock:
+                            logger.info(f"[{self.zone}] Processed {self.frame_count} frames - Entry: {self.current_counts['entry']}, "
+                                       f"Exit: {self.current_counts['exit']}, Density: {self.current_counts['density']}")
+
+                except Exception as e:
+                    logger.error(f"[{self.zone}] Error processing frame {self.frame_count}: {e}")
+                    continue
+
+            logger.info(f"[{self.zone}] Stream processing stopped")
+
+        except Exception as e:
+            logger.error(f"[{self.zone}] Stream processing error: {e}")
+        finally:
+            # Cleanup
+            with self.lock:
+                self.latest_frame = None
+            if self.capture:
+                self.capture.stop()
+            self.is_running = False
+            if self.batcher:
+                self.batcher.unregister(self.zone)
+
+
+class ProcessStreamWorker(StreamWorker):
+    """
+    Stream worker whose capture and inference run in worker processes.
+
+    The capture process decodes into a shared-memory frame ring, and the
+    inference pool reads frames from it by sequence number, so images are
+    never pickled. Only the person boxes come back to this process, where
+    tracking and counting run as in StreamWorker.
+    """
+
+    def __init__(self, zone: str, stream_url: str, pool: ProcessInferencePool, **kwargs):
+        super().__init__(zone, stream_url, None, **kwargs)
+        self.pool = pool
+
+    def _create_capture(self):
+        return SharedRingCapture(self.stream_url, name=self.zone, decoder=self.decoder,
+                                 decoder_options=self._decoder_options())
+
+    def _detect(self, frame: np.ndarray, frame_index: int) -> Optional[np.ndarray]:
+        # Post-processing happens in the inference process, so it is part of the inference time here
+        with self.stages.time('inference'):
+            return self.pool.infer(self.capture.ring, frame_index, imgsz=self.imgsz)
+
+
+class PersonCounterService:
+    """Registry of per-zone stream workers sharing one YOLO model"""
+
+    def __init__(self, max_zones: int = MAX_ZONES, batch_size: int = INFERENCE_BATCH_SIZE,
+                 batch_wait_ms: float = INFERENCE_BATCH_WAIT_MS, execution_mode: str = EXECUTION_MODE,
+                 process_workers: int = PROCESS_WORKERS, detector_backend: str = DETECTOR_BACKEND,
+                 detector_int8: bool = DETECTOR_INT8):
+        self.model = None
+        self.detector_backend = detector_backend
+        self.detector_int8 = detector_int8
+        self.batcher = None
+        self.inference_pool = None
+        self.execution_mode = execution_mode
+        self.process_workers = process_workers
+        self.batch_size = batch_size
+        self.batch_wait = batch_wait_ms / 1000.0
+        self.max_zones = max_zones
+        self.workers: Dict[str, StreamWorker] = {}
+        self.histories: Dict[str, CountHistory] = {}
+        self.sample_listeners: List[Callable[[Dict[str, Any]], None]] = []
+        self.lock = threading.Lock()
+        # Separate from self.lock so a slow model load at startup doesn't block status requests
+        self.init_lock = threading.Lock()
+        self.init_error = None
+
+    def is_initialized(self) -> bool:
+        return self.batcher is not None or self.inference_pool is not None
+
     def initialize_model(self):
-        """Initialize the YOLO model for person detection"""
+        """Initialize the YOLO model for person detection (once; later calls return immediately)"""
+        with self.init_lock:
+            if self.is_initialized():
+                return True
+            return self._initialize_model()
+
+    def _initialize_model(self):
         try:
-            logger.info("Initializing YOLO model...")
-            self.model = YOLO('yolov8s.pt')
+            if self.execution_mode == 'process':
+                # Export once here; each inference process then loads its own copy of the model
+                model_path = prepare_model_path(self.detector_backend, DETECTOR_MODEL, DETECTOR_IMGSZ, int8=self.detector_int8,
+                                                calibration_source=DETECTOR_CALIBRATION_SOURCE)
+                logger.info(f"Starting {self.process_workers} inference processes...")
+                self.inference_pool = ProcessInferencePool(model_path, workers=self.process_workers,
+                                                           classes=person_class_ids(), tile_size=TILE_SIZE,
+                                                           tile_overlap=TILE_OVERLAP, tiles_per_batch=TILES_PER_BATCH)
+                self.inference_pool.start()
+                return True
+
+            logger.info(f"Initializing YOLO model ({self.detector_backend} backend)...")
+            # Shared with every other counter in this process, warmed up at the batch size we run
+            self.model = model_registry.get(self.detector_backend, DETECTOR_MODEL, DETECTOR_IMGSZ,
+                                            int8=self.detector_int8,
+                                            calibration_source=DETECTOR_CALIBRATION_SOURCE,
+                                            warmup_batch=self.batch_size)
+            # Only person boxes are needed, so let the model drop the other classes during NMS
+            self.batcher = InferenceBatcher(self.model, batch_size=self.batch_size, max_wait=self.batch_wait,
+                                            classes=person_class_ids())
+            self.batcher.start()
             logger.info("YOLO model initialized successfully")
+            self.init_error = None
             return True
         except Exception as e:
             logger.error(f"Failed to initialize YOLO model: {e}")
+            self.init_error = str(e)
             return False
-    
-    def start_counting(self, stream_url: str, zone: str) -> Dict[str, Any]:
-        """Start person counting on the live stream"""
+
+    def get_readiness(self) -> Dict[str, Any]:
+        """Whether the detector is loaded and warmed up, for health checks"""
+        if self.inference_pool:
+            stats = self.inference_pool.get_stats()
+            ready = stats['ready_workers'] >= stats['workers']
+        else:
+            ready = self.batcher is not None
+        return {
+            'ready': ready,
+            'execution_mode': self.execution_mode,
+            'detector': {'backend': self.detector_backend, 'int8': self.detector_int8},
+            'models': model_registry.get_status(),
+            'error': self.init_error,
+        }
+
+    def start_counting(self, stream_url: str, zone: str, decoder: Optional[str] = None,
+                       lines: Optional[list] = None, regions: Optional[list] = None,
+                       calibration: Optional[dict] = None) -> Dict[str, Any]:
+        """Start person counting on the live stream for a zone, with optional decoder, lines, regions and calibration"""
+        decoder = decoder or DECODER
+        if decoder not in DECODERS:
+            return {
+                'success': False,
+                'message': f"Unknown decoder '{decoder}', expected one of {', '.join(DECODERS)}"
+            }
         try:
-            if self.is_running:
+            lines = parse_lines(lines if lines is not None else COUNTING_LINES)
+        except ValueError as e:
+            return {
+                'success': False,
+                'message': f'Invalid counting lines: {e}'
+            }
+        try:
+            regions = parse_regions(regions if regions is not None else REGIONS)
+        except ValueError as e:
+            return {
+                'success': False,
+                'message': f'Invalid regions: {e}'
+            }
+        try:
+            if calibration is not None:
+                calibration = parse_calibration(calibration)
+            else:
+                calibration = parse_calibrations(CALIBRATIONS).get(zone)
+        except (ValueError, OSError) as e:
+            return {
+                'success': False,
+                'message': f'Invalid calibration: {e}'
+            }
+        try:
+            # Waits for a load in progress (e.g. the startup preload), so it must not hold self.lock,
+            # which every status read needs
+            if not self.is_initialized() and not self.initialize_model():
                 return {
                     'success': False,
-                    'message': 'Person counting is already running'
+                    'message': 'Failed to initialize AI model'
                 }
-            
-            if not self.model:
-                if not self.initialize_model():
+
+            with self.lock:
+                worker = self.workers.get(zone)
+                if worker and worker.is_running:
                     return {
                         'success': False,
-                        'message': 'Failed to initialize AI model'
+                        'message': f'Person counting is already running for {zone}'
                     }
-            
-            self.stream_url = stream_url
-            self.zone = zone
-            self.is_running = True
-            
-            # Reset counts
-            with self.lock:
-                self.current_counts = {'entry': 0, 'exit': 0, 'density': 0}
-            
-            # Start processing in a separate thread
-            self.processing_thread = threading.Thread(target=self._process_stream)
-            self.processing_thread.daemon = True
-            self.processing_thread.start()
-            
+
+                running = sum(1 for w in self.workers.values() if w.is_running)
+                if running >= self.max_zones:
+                    return {
+                        'success': False,
+                        'message': f'Maximum number of zones ({self.max_zones}) already running'
+                    }
+
+                # A fresh worker resets the counts for the zone; its history carries on
+                history = self.histories.setdefault(zone, CountHistory())
+                if self.inference_pool:
+                    worker = ProcessStreamWorker(zone, stream_url, self.inference_pool, decoder=decoder,
+                                                 lines=lines, regions=regions, calibration=calibration,
+                                                 history=history, on_sample=self._publish_sample)
+                else:
+                    worker = StreamWorker(zone, stream_url, self.batcher, decoder=decoder, lines=lines, regions=regions,
+                                          calibration=calibration, history=history, on_sample=self._publish_sample)
+                self.workers[zone] = worker
+                worker.start()
+
             logger.info(f"Started person counting for {zone} at {stream_url}")
-            
+
             return {
                 'success': True,
                 'message': f'Person counting started for {zone}',
                 'stream_url': stream_url,
-                'zone': zone
+                'zone': zone,
+                'decoder': decoder
             }
-            
+
         except Exception as e:
             logger.error(f"Failed to start person counting: {e}")
             return {
                 'success': False,
                 'message': f'Failed to start person counting: {str(e)}'
             }
-    
-    def stop_counting(self) -> Dict[str, Any]:
-        """Stop person counting"""
+
+    def stop_counting(self, zone: Optional[str] = None) -> Dict[str, Any]:
+        """Stop person counting for one zone, or for all zones when zone is None"""
         try:
-            self.is_running = False
-            
-            if self.processing_thread and self.processing_thread.is_alive():
-                self.processing_thread.join(timeout=5)
-            
-            logger.info("Person counting stopped")
-            
-            return {
+            with self.lock:
+                if zone is None:
+                    workers = list(self.workers.values())
+                elif zone in self.workers:
+                    workers = [self.workers[zone]]
+                else:
+                    return {
+                        'success': False,
+                        'message': f'No person counting found for {zone}'
+                    }
+
+            # Signal every worker first so they wind down in parallel
+            for worker in workers:
+                worker.is_running = False
+            for worker in workers:
+                worker.stop()
+
+            final_counts = {worker.zone: worker.get_counts() for worker in workers}
+            logger.info(f"Person counting stopped for {zone or 'all zones'}")
+
+            result = {
                 'success': True,
-                'message': 'Person counting stopped',
-                'final_counts': self.current_counts.copy()
+                'message': f'Person counting stopped for {zone}' if zone else 'Person counting stopped',
             }
-            
+            if zone is None:
+                result['final_counts'] = self._sum_counts(final_counts.values())
+                result['zones'] = final_counts
+            else:
+                result['final_counts'] = final_counts[zone]
+            return result
+
         except Exception as e:
             logger.error(f"Failed to stop person counting: {e}")
             return {
                 'success': False,
                 'message': f'Failed to stop person counting: {str(e)}'
             }
-    
-    def get_status(self) -> Dict[str, Any]:
-        """Get current counting status and counts"""
+
+    def get_status(self, zone: Optional[str] = None) -> Dict[str, Any]:
+        """Get current counting status and counts for one zone or all zones"""
         with self.lock:
-            return {
-                'success': True,
-                'status': 'running' if self.is_running else 'stopped',
-                'counts': self.current_counts.copy(),
-                'stream_url': self.stream_url,
-                'zone': self.zone
-            }
-    
-    def _process_stream(self):
-        """Process the live stream and count people"""
+            workers = dict(self.workers)
+
+        if zone is not None:
+            worker = workers.get(zone)
+            if worker is None:
+                return {
+                    'success': True,
+                    'status': 'stopped',
+                    'counts': {'entry': 0, 'exit': 0, 'density': 0},
+                    'stream_url': None,
+                    'zone': zone
+                }
+            return {'success': True, **worker.get_status()}
+
+        zones = {name: worker.get_status() for name, worker in workers.items()}
+        return {
+            'success': True,
+            'status': 'running' if any(z['status'] == 'running' for z in zones.values()) else 'stopped',
+            'counts': self._sum_counts(z['counts'] for z in zones.values()),
+            'zones': zones,
+            'inference': self._inference_stats(),
+            'detector': {'backend': self.detector_backend, 'int8': self.detector_int8}
+        }
+
+    def get_tracks(self, zone: str) -> Dict[str, Any]:
+        """Get the current tracks for a zone"""
+        with self.lock:
+            worker = self.workers.get(zone)
+        if worker is None:
+            return {'success': False, 'message': f'No person counting found for {zone}'}
+        return {'success': True, 'zone': zone, 'tracks': worker.get_tracks()}
+
+    def get_density_map(self, zone: str, since: Optional[int] = None) -> Dict[str, Any]:
+        """Occupancy grid of a zone; only the version when the caller already has it"""
+        with self.lock:
+            worker = self.workers.get(zone)
+        if worker is None or worker.occupancy is None:
+            return {'success': False, 'message': f'No density map available for {zone}'}
+        return {'success': True, 'zone': zone, **worker.occupancy.get_grid(since)}
+
+    def add_sample_listener(self, listener: Callable[[Dict[str, Any]], None]):
+        """Receive every zone's per-second count samples; listeners run on the counting threads and must not block"""
+        self.sample_listeners.append(listener)
+
+    def _publish_sample(self, sample: Dict[str, Any]):
+        for listener in self.sample_listeners:
+            try:
+                listener(sample)
+            except Exception as e:
+                logger.error(f"Sample listener failed: {e}")
+
+    def get_history(self, zone: str, start: Optional[float] = None, end: Optional[float] = None,
+                    resolution: Optional[int] = None) -> Dict[str, Any]:
+        """Density and crossings of a zone over a time window, at the best matching resolution"""
+        with self.lock:
+            history = self.histories.get(zone)
+        if history is None:
+            return {'success': False, 'message': f'No history recorded for {zone}'}
         try:
-            logger.info(f"Starting stream processing for {self.zone}")
-            
-            # Open the stream
-            cap = cv2.VideoCapture(self.stream_url)
-            
-            if not cap.isOpened():
-                logger.error(f"Failed to open stream: {self.stream_url}")
-                return
-            
-            # Get video properties
-            fps = int(cap.get(cv2.CAP_PROP_FPS)) or 30
-            width = int(cap.get(cv2.CAP_PROP_FRAME_WIDTH)) or 640
-            height = int(cap.get(cv2.CAP_PROP_FRAME_HEIGHT)) or 480
-            
-            logger.info(f"Stream properties: {width}x{height} @ {fps}fps")
-            
-            # Initialize tracking variables
-            center_line_x = width // 2
-            previous_positions = {}
-            frame_count = 0
-            
-            while self.is_running:
-                ret, frame = cap.read()
-                if not ret:
-                    logger.warning("Failed to read frame, retrying...")
-                    time.sleep(0.1)
-                    continue
-                
-                frame_count += 1
-                
-                try:
-                    # Run YOLO detection
-                    results = self.model.predict(frame, conf=0.5, device='cpu', verbose=False)
-                    
-                    if results and len(results) > 0:
-                        boxes = results[0].boxes
-                        if boxes is not None:
-                            # Process detections
-                            person_list = []
-                            for box in boxes:
-                                if box.conf > 0.5 and int(box.cls) == 0:  # person class
-                                    x1, y1, x2, y2 = map(int, box.xyxy[0])
-                                    person_list.append([x1, y1, x2, y2])
-                            
-                            # Simple tracking and counting
-                            current_positions = {}
-                            
-                            for i, (x1, y1, x2, y2) in enumerate(person_list):
-                                cx = int((x1 + x2) // 2)
-                                cy = int((y1 + y2) // 2)
-                                
-                                current_positions[i] = (cx, cy)
-                                
-                                # Draw bounding box
-                                cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 2)
-                                cv2.circle(frame, (cx, cy), 4, (255, 0, 255), -1)
-                                
-                                # Check for entry/exit
-                                if i in previous_positions:
-                                    prev_x, prev_y = previous_positions[i]
-                                    
-                                    if (prev_x < center_line_x and cx >= center_line_x):
-                                        with self.lock:
-                                            self.current_counts['entry'] += 1
-                                        logger.info(f"Person {i} ENTERED - Entry count: {self.current_counts['entry']}")
-                                        
-                                    elif (prev_x > center_line_x and cx <= center_line_x):
-                                        with self.lock:
-                                            self.current_counts['exit'] += 1
-                                        logger.info(f"Person {i} EXITED - Exit count: {self.current_counts['exit']}")
-                            
-                            previous_positions = current_positions.copy()
-                            
-                            # Update density (current people in frame)
-                            with self.lock:
-                                self.current_counts['density'] = len(person_list)
-                            
-                            # Draw center line
-                            cv2.line(frame, (center_line_x, 0), (center_line_x, height), (255, 255, 255), 3)
-                            
-                            # Draw counts on frame
-                            with self.lock:
-                                cv2.putText(frame, f'Entry: {self.current_counts["entry"]}', (10, 30),
-                                            cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 255, 0), 2)
-                                cv2.putText(frame, f'Exit: {self.current_counts["exit"]}', (10, 70),
-                                            cv2.FONT_HERSHEY_SIMPLEX, 0.8, (0, 0, 255), 2)
-                                cv2.putText(frame, f'Density: {self.current_counts["density"]}', (10, 110),
-                                            cv2.FONT_HERSHEY_SIMPLEX, 0.8, (255, 255, 255), 2)
-                                cv2.putText(frame, f'Zone: {self.zone}', (10, height - 20),
-                                            cv2.FONT_HERSHEY_SIMPLEX, 0.6, (255, 255, 255), 2)
-                    
-                    # Log progress every 30 frames
-                    if frame_count % 30 == 0:
-                        with self.lock:
-                            logger.info(f"Processed {frame_count} frames - Entry: {self.current_counts['entry']}, "
-                                       f"Exit: {self.current_counts['exit']}, Density: {self.current_counts['density']}")
-                    
-                    # Small delay to prevent overwhelming the system
-                    time.sleep(1.0 / fps)
-                    
-                except Exception as e:
-                    logger.error(f"Error processing frame {frame_count}: {e}")
-                    continue
-            
-            # Cleanup
-            cap.release()
-            logger.info("Stream processing stopped")
-            
-        except Exception as e:
-            logger.error(f"Stream processing error: {e}")
-        finally:
-            self.is_running = False
+            return {'success': True, 'zone': zone, **history.query(start, end, resolution)}
+        except ValueError as e:
+            return {'success': False, 'message': str(e)}
+
+    def get_ground_points(self, zone: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Ground positions of the people in one zone, or of every calibrated zone merged.
+
+        Merging drops people that two overlapping cameras both see, so every
+        person appears once per set of world units.
+        """
+        with self.lock:
+            workers = dict(self.workers) if zone is None else {zone: self.workers.get(zone)}
+        groups = [worker.get_ground_points() for worker in workers.values() if worker is not None]
+        groups = [group for group in groups if group is not None]
+        if zone is not None and not groups:
+            return {'success': False, 'message': f'No calibrated person counting found for {zone}'}
+
+        points = {}
+        for units in sorted({group['units'] for group in groups}):
+            points[units] = merge_points([group for group in groups if group['units'] == units],
+                                         units, radius_m=GROUND_DEDUP_RADIUS_M)
+        return {'success': True, 'zone': zone, 'timestamp': time.time(), 'points': points}
+
+    def get_preview_jpeg(self, zone: str, quality: str = 'medium',
+                         annotated: bool = False) -> Optional[Tuple[int, bytes]]:
+        """
+        (frame sequence, JPEG) of the zone's latest frame, shared with every other viewer.
+
+        Raises:
+            ValueError: if the quality level is unknown
+        """
+        with self.lock:
+            worker = self.workers.get(zone)
+        return worker.previews.get(quality, annotated) if worker else None
+
+    def collect_metrics(self, writer: MetricsWriter):
+        """Add every stream's metrics and the shared inference queue to a Prometheus exposition"""
+        with self.lock:
+            workers = list(self.workers.values())
+        for worker in workers:
+            worker.collect_metrics(writer)
+
+        writer.sample('detector_ready', 'gauge', 'Whether the detector is loaded and warmed up',
+                      int(self.get_readiness()['ready']))
+        stats = self._inference_stats()
+        if not stats:
+            return
+        queued = stats['pending_tasks'] if self.inference_pool else stats['pending_frames']
+        writer.sample('inference_queue_frames', 'gauge', 'Frames waiting for inference', queued)
+        writer.sample('inference_frames_total', 'counter', 'Frames run through the detector', stats['total_frames'])
+        if self.inference_pool:
+            writer.sample('inference_failed_frames_total', 'counter', 'Frames the inference processes failed on',
+                          stats['failed_frames'])
+        else:
+            writer.sample('inference_batches_total', 'counter', 'Detector batches run', stats['total_batches'])
+            writer.sample('inference_superseded_frames_total', 'counter',
+                          'Queued frames replaced by a newer frame of the same stream', stats['superseded_frames'])
+
+    def _inference_stats(self) -> Optional[Dict[str, Any]]:
+        """Statistics of whichever inference backend is active"""
+        if self.inference_pool:
+            return self.inference_pool.get_stats()
+        if self.batcher:
+            return self.batcher.get_stats()
+        return None
+
+    @staticmethod
+    def _sum_counts(counts) -> Dict[str, int]:
+        """Add up entry/exit/density across zones"""
+        total = {'entry': 0, 'exit': 0, 'density': 0}
+        for c in counts:
+            for key in total:
+                total[key] += c.get(key, 0)
+        return total
 
 # Global instance
-person_counter_service = PersonCounterService() 
\ No newline at end of file
+person_counter_service = PersonCounterService()
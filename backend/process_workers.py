@@ -0,0 +1,406 @@
+import cv2
+import itertools
+import multiprocessing as mp
+import queue
+import threading
+import time
+import logging
+from collections import OrderedDict, deque
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from typing import Any, Dict, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+# Processes are spawned so they never inherit the API's threads or open sockets
+_mp = mp.get_context('spawn')
+
+
+class SharedFrameRing:
+    """
+    Fixed-size ring of frame slots in shared memory.
+
+    Layout: int64 header [latest_seq, slot_seq * slots], float64 capture
+    timestamps per slot, then the uint8 frames. Each slot works as a
+    seqlock: the writer marks it -1 while copying, and readers check that
+    the slot still holds the sequence number they asked for after copying.
+    A single writer (the capture process) is assumed.
+    """
+
+    def __init__(self, shape: Tuple[int, int, int], slots: int = 8,
+                 name: Optional[str] = None, create: bool = False):
+        self.shape = tuple(shape)
+        self.slots = slots
+        frame_bytes = int(np.prod(self.shape))
+        header_bytes = 8 * (1 + slots) + 8 * slots
+        size = header_bytes + frame_bytes * slots
+
+        self.shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self.name = self.shm.name
+
+        buf = self.shm.buf
+        self.seqs = np.ndarray((1 + slots,), dtype=np.int64, buffer=buf, offset=0)
+        self.timestamps = np.ndarray((slots,), dtype=np.float64, buffer=buf, offset=8 * (1 + slots))
+        self.frames = np.ndarray((slots,) + self.shape, dtype=np.uint8, buffer=buf, offset=header_bytes)
+        if create:
+            self.seqs[:] = 0
+            self.timestamps[:] = 0
+
+    def write(self, frame: np.ndarray, captured_at: float) -> int:
+        """Copy a frame into the next slot and publish it"""
+        seq = int(self.seqs[0]) + 1
+        slot = seq % self.slots
+        self.seqs[1 + slot] = -1
+        if frame.shape != self.shape:
+            frame = cv2.resize(frame, (self.shape[1], self.shape[0]))
+        self.frames[slot] = frame
+        self.timestamps[slot] = captured_at
+        self.seqs[1 + slot] = seq
+        self.seqs[0] = seq
+        return seq
+
+    def latest(self) -> Tuple[int, float]:
+        """Sequence number and capture time of the newest frame"""
+        seq = int(self.seqs[0])
+        return seq, float(self.timestamps[seq % self.slots])
+
+    def read(self, seq: int) -> Optional[np.ndarray]:
+        """Consistent copy of a frame, or None if it was already overwritten"""
+        slot = seq % self.slots
+        if self.seqs[1 + slot] != seq:
+            return None
+        frame = self.frames[slot].copy()
+        if self.seqs[1 + slot] != seq:
+            return None
+        return frame
+
+    def close(self):
+        """Detach from the shared memory block"""
+        self.seqs = self.timestamps = self.frames = None
+        try:
+            self.shm.close()
+        except BufferError:
+            # Readers only get copies; if an array over the buffer is still alive, the mapping is
+            # released when it is collected
+            pass
+
+    def unlink(self):
+        """Remove the shared memory block (owner only)"""
+        try:
+            self.shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def _capture_main(source, slots, decoder, decoder_options, info_queue, frame_event, stop_event):
+    """Capture process: decode the stream into a shared frame ring"""
+    from frame_source import create_capture
+
+    # Used synchronously: this process has nothing else to do but decode
+    cap = create_capture(source, decoder, **(decoder_options or {}))
+    if not cap.open():
+        info_queue.put({'success': False, 'message': f'Failed to open stream: {source}'})
+        return
+    fps = cap.fps
+
+    ret, frame = cap._read_frame()
+    if not ret:
+        cap._release()
+        info_queue.put({'success': False, 'message': f'Failed to read from stream: {source}'})
+        return
+
+    ring = SharedFrameRing(frame.shape, slots=slots, create=True)
+    info_queue.put({'success': True, 'name': ring.name, 'shape': frame.shape, 'fps': fps,
+                    'source_size': (cap.source_width, cap.source_height)})
+    try:
+        ring.write(frame, time.time())
+        frame_event.set()
+        while not stop_event.is_set():
+            ret, frame = cap._read_frame()
+            if not ret:
+                stop_event.wait(1.0)
+                continue
+            ring.write(frame, time.time())
+            frame_event.set()
+    finally:
+        cap._release()
+        ring.close()
+        ring.unlink()
+
+
+class SharedRingCapture:
+    """
+    Frame source whose decoding runs in a separate process.
+
+    Same interface as LatestFrameCapture. read() returns a checked copy of
+    the newest slot, because the worker keeps the frame for previews and
+    overlays long after the ring has wrapped, and the frame's sequence
+    number, which is what the inference processes use to find the frame.
+    """
+
+    def __init__(self, source: Union[str, int], name: Optional[str] = None,
+                 slots: int = 8, open_timeout: float = 15, decoder: str = 'opencv',
+                 decoder_options: Optional[Dict[str, Any]] = None):
+        self.source = source
+        self.name = name or str(source)
+        self.slots = slots
+        self.decoder = decoder
+        self.decoder_options = decoder_options
+        self.open_timeout = open_timeout
+
+        self.ring = None
+        self.process = None
+        self.frame_event = _mp.Event()
+        self.stop_event = _mp.Event()
+        self.width = 0
+        self.height = 0
+        self.source_width = 0
+        self.source_height = 0
+        self.fps = 0
+
+        self.is_running = False
+        self.consumed_seq = 0
+        self.frames_dropped = 0
+
+    def open(self) -> bool:
+        """Start the capture process and attach to its frame ring"""
+        info_queue = _mp.Queue()
+        self.process = _mp.Process(target=_capture_main, name=f"capture-{self.name}", daemon=True,
+                                   args=(self.source, self.slots, self.decoder, self.decoder_options,
+                                         info_queue, self.frame_event, self.stop_event))
+        self.process.start()
+        try:
+            info = info_queue.get(timeout=self.open_timeout)
+        except queue.Empty:
+            info = {'success': False, 'message': f'Timed out opening stream: {self.source}'}
+        if not info['success']:
+            logger.error(info['message'])
+            self.stop_event.set()
+            self.process.join(timeout=5)
+            return False
+
+        self.ring = SharedFrameRing(info['shape'], slots=self.slots, name=info['name'])
+        self.height, self.width = info['shape'][:2]
+        self.source_width, self.source_height = info['source_size']
+        self.fps = info['fps']
+        return True
+
+    def start(self) -> bool:
+        """Open the capture process if needed"""
+        if self.ring is None and not self.open():
+            return False
+        self.is_running = True
+        return True
+
+    def stop(self, timeout: float = 5):
+        """Stop the capture process and detach from the ring"""
+        self.is_running = False
+        self.stop_event.set()
+        if self.process and self.process.is_alive():
+            self.process.join(timeout=timeout)
+        if self.ring:
+            self.ring.close()
+
+    def read(self, timeout: float = 1.0) -> Optional[Tuple[np.ndarray, float, int]]:
+        """Wait for a frame newer than the last one read"""
+        deadline = time.time() + timeout
+        while self.is_running:
+            # Clear before checking so a frame published in between still wakes us up
+            self.frame_event.clear()
+            seq, captured_at = self.ring.latest()
+            if seq > self.consumed_seq:
+                # None if the slot was rewritten during the copy; the next pass picks up the newer frame
+                frame = self.ring.read(seq)
+                if frame is not None:
+                    if self.consumed_seq:
+                        self.frames_dropped += seq - self.consumed_seq - 1
+                    self.consumed_seq = seq
+                    return frame, captured_at, seq
+            remaining = deadline - time.time()
+            if remaining <= 0 or not self.frame_event.wait(timeout=remaining):
+                return None
+        return None
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Capture counters"""
+        seq, captured_at = self.ring.latest() if self.ring else (0, 0.0)
+        return {
+            'frames_captured': seq,
+            'frames_dropped': self.frames_dropped,
+            'last_capture_at': captured_at or None,
+            'capture_process_alive': bool(self.process and self.process.is_alive()),
+            'decoder': self.decoder,
+        }
+
+
+def _inference_main(model_path, conf, classes, tiling, task_queue, result_queue, max_rings=64):
+    """Inference process: run the detector on frames referenced in shared memory"""
+    from ultralytics import YOLO
+    from detections import decode_person_boxes
+    from tiling import TiledDetector
+
+    model = YOLO(model_path)
+    tiler = None
+    if tiling and tiling['tile_size']:
+        tiler = TiledDetector(lambda crops, **options: model.predict(crops, conf=conf, device='cpu', classes=classes,
+                                                                     verbose=False, **options),
+                              conf=conf, classes=classes, **tiling)
+    # Warm up before reporting ready so the first real frame doesn't pay for initialization
+    model.predict(np.zeros((640, 640, 3), dtype=np.uint8), conf=conf, device='cpu', verbose=False)
+    rings = OrderedDict()
+    result_queue.put(('ready', None, None))
+
+    while True:
+        task = task_queue.get()
+        if task is None:
+            break
+        task_id, ring_name, shape, slots, seq, imgsz = task
+        try:
+            ring = rings.get(ring_name)
+            if ring is None:
+                ring = SharedFrameRing(shape, slots=slots, name=ring_name)
+                rings[ring_name] = ring
+                if len(rings) > max_rings:
+                    rings.popitem(last=False)[1].close()
+            rings.move_to_end(ring_name)
+
+            frame = ring.read(seq)
+            if frame is None:
+                result_queue.put((task_id, None, 'frame overwritten before inference'))
+                continue
+
+            options = {'imgsz': imgsz} if imgsz else {}
+            started = time.time()
+            if tiler:
+                boxes = tiler.detect(frame, **options)
+            else:
+                results = model.predict(frame, conf=conf, device='cpu', classes=classes, verbose=False, **options)
+                boxes = decode_person_boxes(results[0] if results else None, conf=conf, classes=classes)
+            result_queue.put((task_id, boxes, time.time() - started))
+        except Exception as e:
+            rings.pop(ring_name, None)
+            result_queue.put((task_id, None, str(e)))
+
+    for ring in rings.values():
+        ring.close()
+
+
+class ProcessInferencePool:
+    """
+    Pool of detector processes, each holding its own copy of the model.
+
+    Tasks carry only the ring name and frame sequence number; results come
+    back as small (N, 4) box arrays over a queue and are routed to the
+    waiting stream by a collector thread.
+    """
+
+    def __init__(self, model_path: str = 'yolov8s.pt', workers: int = 2, conf: float = 0.5,
+                 classes: Optional[Sequence[int]] = None, tile_size: int = 0, tile_overlap: float = 0.2,
+                 tiles_per_batch: int = 8, stats_window: int = 100):
+        self.model_path = model_path
+        self.workers = max(1, workers)
+        self.conf = conf
+        self.classes = list(classes) if classes is not None else None
+        self.tiling = {'tile_size': tile_size, 'overlap': tile_overlap, 'tiles_per_batch': tiles_per_batch}
+
+        self.task_queue = _mp.Queue()
+        self.result_queue = _mp.Queue()
+        self.processes = []
+        self.collector = None
+        self.is_running = False
+        self.ready_workers = 0
+
+        self.lock = threading.Lock()
+        self.pending: Dict[int, Future] = {}
+        self.task_ids = itertools.count(1)
+        self.latencies = deque(maxlen=stats_window)
+        self.total_frames = 0
+        self.failed_frames = 0
+
+    def start(self):
+        """Start the inference processes and the result collector"""
+        self.is_running = True
+        for i in range(self.workers):
+            process = _mp.Process(target=_inference_main, name=f"inference-{i}", daemon=True,
+                                  args=(self.model_path, self.conf, self.classes, self.tiling,
+                                        self.task_queue, self.result_queue))
+            process.start()
+            self.processes.append(process)
+        self.collector = threading.Thread(target=self._collect, name="inference-collector", daemon=True)
+        self.collector.start()
+        logger.info(f"Started {self.workers} inference processes for {self.model_path}")
+
+    def stop(self, timeout: float = 5):
+        """Stop the inference processes"""
+        self.is_running = False
+        for _ in self.processes:
+            self.task_queue.put(None)
+        for process in self.processes:
+            process.join(timeout=timeout)
+            if process.is_alive():
+                process.terminate()
+        self.processes = []
+        with self.lock:
+            for future in self.pending.values():
+                future.cancel()
+            self.pending.clear()
+
+    def submit(self, ring: SharedFrameRing, seq: int, imgsz: Optional[int] = None) -> Future:
+        """Queue inference for a frame in a shared ring"""
+        future = Future()
+        task_id = next(self.task_ids)
+        with self.lock:
+            self.pending[task_id] = future
+        self.task_queue.put((task_id, ring.name, ring.shape, ring.slots, seq, imgsz))
+        return future
+
+    def infer(self, ring: SharedFrameRing, seq: int, timeout: float = 10,
+              imgsz: Optional[int] = None) -> Optional[np.ndarray]:
+        """Run inference on a frame and wait for its person boxes; None if it was skipped"""
+        return self.submit(ring, seq, imgsz=imgsz).result(timeout=timeout)
+
+    def _collect(self):
+        """Route results from the inference processes to waiting streams"""
+        while self.is_running:
+            try:
+                task_id, boxes, info = self.result_queue.get(timeout=0.5)
+            except queue.Empty:
+                continue
+            if task_id == 'ready':
+                self.ready_workers += 1
+                continue
+
+            with self.lock:
+                future = self.pending.pop(task_id, None)
+                if boxes is None:
+                    self.failed_frames += 1
+                else:
+                    self.total_frames += 1
+                    self.latencies.append(info)
+            if future is None or not future.set_running_or_notify_cancel():
+                continue
+            if boxes is None:
+                logger.warning(f"Inference skipped for task {task_id}: {info}")
+            future.set_result(boxes)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Inference process statistics"""
+        with self.lock:
+            latencies = np.array(self.latencies, dtype=np.float64) * 1000
+            stats = {
+                'mode': 'process',
+                'workers': self.workers,
+                'ready_workers': self.ready_workers,
+                'alive_workers': sum(1 for p in self.processes if p.is_alive()),
+                'pending_tasks': len(self.pending),
+                'total_frames': self.total_frames,
+                'failed_frames': self.failed_frames,
+            }
+        if len(latencies):
+            stats.update({
+                'avg_latency_ms': float(latencies.mean()),
+                'p95_latency_ms': float(np.percentile(latencies, 95)),
+            })
+        return stats
@@ -0,0 +1,111 @@
+import cv2
+import json
+from typing import Any, Dict, List, Optional, Sequence, Tuple, Union
+
+import numpy as np
+
+from geometry import scale_points
+
+RegionSpec = Dict[str, Any]
+
+# Point of a person box that decides which region they are in
+ANCHORS = ('bottom', 'center')
+
+
+def parse_regions(spec: Union[None, str, Sequence[RegionSpec]]) -> List[RegionSpec]:
+    """
+    Validate a region configuration.
+
+    Each region is {"name": ..., "points": [[x, y], ...]} with at least
+    three points, in pixels or fractions of the frame (see
+    geometry.scale_points). Regions may overlap.
+
+    Raises:
+        ValueError: if the configuration is malformed
+    """
+    if spec is None or spec == '':
+        return []
+    if isinstance(spec, str):
+        spec = json.loads(spec)
+    if not isinstance(spec, (list, tuple)):
+        raise ValueError("Regions must be a list")
+    if len(spec) > 64:
+        raise ValueError("At most 64 regions are supported per camera")
+
+    regions = []
+    names = set()
+    for i, region in enumerate(spec):
+        if not isinstance(region, dict):
+            raise ValueError(f"Region {i} must be an object with 'points'")
+        points = np.asarray(region.get('points', []), dtype=np.float64)
+        if points.ndim != 2 or points.shape[1] != 2 or len(points) < 3:
+            raise ValueError(f"Region {i} needs at least three [x, y] points")
+        name = str(region.get('name') or f'region{i + 1}')
+        if name in names:
+            raise ValueError(f"Duplicate region name '{name}'")
+        names.add(name)
+        regions.append({'name': name, 'points': points.tolist()})
+    return regions
+
+
+class RegionCounter:
+    """
+    Per-region occupancy from a precomputed label mask.
+
+    The polygons are rasterized once per frame size. Every pixel gets a
+    label for the set of regions covering it (overlaps get their own
+    label), so classifying people is one mask lookup per person. Counting
+    is one bincount over the labels, multiplied by a label-to-region
+    membership matrix. Neither step depends on how complex the polygons are.
+    """
+
+    def __init__(self, regions: Sequence[RegionSpec], width: int, height: int, anchor: str = 'bottom',
+                 source_size: Optional[Tuple[int, int]] = None):
+        if anchor not in ANCHORS:
+            raise ValueError(f"Unknown anchor '{anchor}', expected one of {', '.join(ANCHORS)}")
+        self.names = [region['name'] for region in regions]
+        self.width = width
+        self.height = height
+        self.anchor = anchor
+
+        self.polygons = []
+        bits = np.zeros((height, width), dtype=np.uint64)
+        for index, region in enumerate(regions):
+            points = scale_points(region['points'], width, height, source_size)
+            polygon = points.round().astype(np.int32)
+            self.polygons.append(polygon)
+            mask = np.zeros((height, width), dtype=np.uint8)
+            cv2.fillPoly(mask, [polygon], 1)
+            bits[mask.astype(bool)] |= np.uint64(1 << index)
+
+        # Compact the per-pixel region bitsets into consecutive labels
+        combos, labels = np.unique(bits, return_inverse=True)
+        self.labels = labels.reshape(height, width).astype(np.uint16 if len(combos) < 65536 else np.uint32)
+        shifts = np.arange(len(regions), dtype=np.uint64)
+        self.membership = ((combos[:, None] >> shifts[None, :]) & np.uint64(1)).astype(np.int64)
+
+    def anchors(self, tracks: Sequence[Sequence[int]]) -> np.ndarray:
+        """Anchor point of every track box, clipped to the frame"""
+        data = np.asarray(tracks, dtype=np.int64).reshape(-1, 5)
+        xs = (data[:, 0] + data[:, 2]) // 2
+        ys = data[:, 3] if self.anchor == 'bottom' else (data[:, 1] + data[:, 3]) // 2
+        return np.column_stack([np.clip(xs, 0, self.width - 1), np.clip(ys, 0, self.height - 1)])
+
+    def count(self, tracks: Sequence[Sequence[int]]) -> Dict[str, int]:
+        """Number of people in every region"""
+        if not self.names:
+            return {}
+        points = self.anchors(tracks)
+        per_label = np.bincount(self.labels[points[:, 1], points[:, 0]], minlength=len(self.membership))
+        counts = per_label @ self.membership
+        return {name: int(c) for name, c in zip(self.names, counts)}
+
+    def draw(self, frame: np.ndarray, counts: Dict[str, int], color=(0, 255, 255)) -> np.ndarray:
+        """Outline every region with its name and count onto the frame in place"""
+        if self.polygons:
+            cv2.polylines(frame, self.polygons, True, color, 2)
+        for name, polygon in zip(self.names, self.polygons):
+            x, y = polygon.min(axis=0)
+            cv2.putText(frame, f'{name}: {counts.get(name, 0)}', (int(x) + 5, int(y) + 20),
+                        cv2.FONT_HERSHEY_SIMPLEX, 0.6, color, 2)
+        return frame
@@ -0,0 +1,78 @@
+import logging
+import math
+import time
+from collections import deque
+from typing import Any, Dict
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+
+class ResolutionController:
+    """
+    Steps the detector input size up or down to hold a target detection rate.
+
+    Detection latency (including time spent waiting for a batch slot, so it
+    reflects how loaded the host is) is collected for the current size. Once
+    a full window is in, the median is compared with the per-detection
+    budget. Over budget, the size drops in proportion to the overshoot,
+    since inference cost grows with the input area. Well under budget, it
+    climbs one step at a time. Sizes stay multiples of the model stride.
+    """
+
+    def __init__(self, target_fps: float, min_imgsz: int = 320, max_imgsz: int = 640,
+                 step: int = 32, window: int = 15, headroom: float = 0.7):
+        self.target_fps = target_fps
+        self.budget = 1.0 / target_fps
+        self.step = step
+        self.min_imgsz = self._snap(min_imgsz)
+        self.max_imgsz = max(self.min_imgsz, self._snap(max_imgsz))
+        self.headroom = headroom
+        self.imgsz = self.max_imgsz
+
+        self.samples = deque(maxlen=window)
+        self.changes = 0
+        self.last_change_at = None
+
+    def _snap(self, size: float) -> int:
+        """Round down to a multiple of the stride"""
+        return max(self.step, int(size) // self.step * self.step)
+
+    def record(self, latency: float) -> int:
+        """Add a detection latency in seconds and return the input size to use next"""
+        self.samples.append(latency)
+        if len(self.samples) < self.samples.maxlen:
+            return self.imgsz
+
+        median = float(np.median(self.samples))
+        size = self.imgsz
+        if median > self.budget and size > self.min_imgsz:
+            scaled = self._snap(size * math.sqrt(self.budget / median))
+            size = max(self.min_imgsz, min(scaled, size - self.step))
+        elif median < self.budget * self.headroom and size < self.max_imgsz:
+            size = min(self.max_imgsz, size + self.step)
+
+        if size != self.imgsz:
+            logger.info(f"Detector input size {self.imgsz} -> {size} "
+                        f"(median latency {median * 1000:.0f}ms, budget {self.budget * 1000:.0f}ms)")
+            self.imgsz = size
+            self.changes += 1
+            self.last_change_at = time.time()
+            # Latencies measured at the old size say nothing about the new one
+            self.samples.clear()
+        return self.imgsz
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Current input size and controller state"""
+        samples = list(self.samples)
+        return {
+            'imgsz': self.imgsz,
+            'auto': True,
+            'target_fps': self.target_fps,
+            'min_imgsz': self.min_imgsz,
+            'max_imgsz': self.max_imgsz,
+            'median_latency_ms': float(np.median(samples)) * 1000 if samples else None,
+            'changes': self.changes,
+            'last_change_at': self.last_change_at,
+        }
@@ -0,0 +1,69 @@
+import cv2
+import numpy as np
+import pytest
+
+# PersonCounter loads the detector backends, which need the full inference stack
+pytest.importorskip('ultralytics')
+pytest.importorskip('cvzone')
+
+import PersonCounter  # noqa: E402
+from counting_lines import parse_lines  # noqa: E402
+
+WIDTH, HEIGHT, FRAMES = 320, 240, 120
+
+
+class _Boxes:
+    def __init__(self, data):
+        self.data = data
+
+
+class _Result:
+    def __init__(self, data):
+        self.boxes = _Boxes(data)
+
+
+class BlobDetector:
+    """Stands in for YOLO: every bright blob in the frame is a person"""
+
+    def predict(self, frame, conf=0.5, **options):
+        mask = (frame.max(axis=2) > 128).astype(np.uint8)
+        count, _, stats, _ = cv2.connectedComponentsWithStats(mask)
+        data = [[x, y, x + w, y + h, 0.9, 0] for x, y, w, h, area in stats[1:count] if area > 50]
+        return [_Result(np.array(data, dtype=np.float32).reshape(-1, 6))]
+
+
+def _write_clip(path):
+    """People walking back and forth across the center line in separate lanes, at different speeds"""
+    lanes = [(20, 3, 0), (80, -4, 300), (140, 5, 40), (200, -2, 200)]
+    writer = cv2.VideoWriter(str(path), cv2.VideoWriter_fourcc(*'MJPG'), 30, (WIDTH, HEIGHT))
+    for frame_index in range(FRAMES):
+        frame = np.zeros((HEIGHT, WIDTH, 3), dtype=np.uint8)
+        for top, speed, start in lanes:
+            # Bounce between the edges so everyone crosses the line more than once
+            x = (start + speed * frame_index) % (2 * (WIDTH - 20))
+            x = x if x < WIDTH - 20 else 2 * (WIDTH - 20) - x
+            cv2.rectangle(frame, (int(x), top), (int(x) + 14, top + 30), (255, 255, 255), -1)
+        writer.write(frame)
+    writer.release()
+
+
+def _run(video, bounds, warmup_frames=2):
+    lines = parse_lines(None)
+    segments = [PersonCounter._process_segment((i, str(video), start, end, warmup_frames, 0.5, False, lines))
+                for i, (start, end) in enumerate(bounds)]
+    return PersonCounter.stitch_segments(segments)
+
+
+@pytest.mark.parametrize('segment_frames', [7, 16, 45])
+def test_segmented_run_matches_a_sequential_run(tmp_path, monkeypatch, segment_frames):
+    video = tmp_path / 'clip.avi'
+    _write_clip(video)
+    monkeypatch.setattr(PersonCounter, '_worker_model', BlobDetector())
+
+    sequential_events, sequential_people = _run(video, [(0, FRAMES)])
+    bounds = [(start, min(start + segment_frames, FRAMES)) for start in range(0, FRAMES, segment_frames)]
+    events, people = _run(video, bounds)
+
+    assert len(sequential_events) > 4
+    assert events == sequential_events
+    assert people == sequential_people
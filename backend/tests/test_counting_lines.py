@@ -0,0 +1,64 @@
+import pytest
+
+from counting_lines import LineCounter, parse_lines
+
+
+def _walk(counter, path, person_id=1, size=20):
+    """Move one person along the path of centers; returns every crossing"""
+    crossings = []
+    for cx, cy in path:
+        crossings += counter.update([[cx - size, cy - size, cx + size, cy + size, person_id]])
+    return crossings
+
+
+def test_default_line_counts_left_to_right_as_entry():
+    counter = LineCounter(parse_lines(None), 640, 480)
+    assert [c[0] for c in _walk(counter, [(300, 240), (310, 240), (330, 240)])] == ['entry']
+    assert [c[0] for c in _walk(counter, [(330, 240), (300, 240)], person_id=2)] == ['exit']
+    assert counter.get_counts() == {'center': {'entry': 1, 'exit': 1}}
+
+
+def test_invert_swaps_entry_and_exit():
+    lines = parse_lines([{'name': 'door', 'points': [[0.5, 0], [0.5, 1]], 'invert': True}])
+    counter = LineCounter(lines, 640, 480)
+    assert [c[0] for c in _walk(counter, [(300, 240), (340, 240)])] == ['exit']
+
+
+def test_rotated_line_rotates_the_direction():
+    # The default line turned by -90 degrees: drawn left to right, so moving up is an entry
+    lines = parse_lines([{'name': 'gate', 'points': [[0, 240], [640, 240]]}])
+    counter = LineCounter(lines, 640, 480)
+    assert [c[0] for c in _walk(counter, [(320, 280), (320, 200)])] == ['entry']
+    assert [c[0] for c in _walk(counter, [(100, 200), (100, 280)], person_id=2)] == ['exit']
+
+
+def test_movement_that_misses_the_segment_does_not_count():
+    lines = parse_lines([{'name': 'short', 'points': [[320, 0], [320, 100]]}])
+    counter = LineCounter(lines, 640, 480)
+    assert _walk(counter, [(300, 300), (340, 300)]) == []
+
+
+def test_polyline_vertex_counts_once():
+    lines = parse_lines([{'name': 'bend', 'points': [[320, 0], [320, 240], [400, 480]]}])
+    counter = LineCounter(lines, 640, 480)
+    assert len(_walk(counter, [(300, 240), (340, 240)])) == 1
+
+
+def test_in_and_back_out_between_frames_counts_nothing():
+    lines = parse_lines([{'name': 'bend', 'points': [[200, 0], [320, 240], [200, 480]]}])
+    counter = LineCounter(lines, 640, 480)
+    # Right of the bend, across both of its segments, and right of it again
+    assert _walk(counter, [(260, 60), (260, 420)]) == []
+
+
+def test_pixel_lines_scale_with_the_decoded_size():
+    lines = parse_lines([{'name': 'a', 'points': [[960, 0], [960, 1080]]}])
+    counter = LineCounter(lines, 640, 360, source_size=(1920, 1080))
+    assert counter.polylines[0].tolist() == [[320, 0], [320, 360]]
+
+
+def test_parse_lines_rejects_bad_specs():
+    with pytest.raises(ValueError):
+        parse_lines([{'points': [[0, 0]]}])
+    with pytest.raises(ValueError):
+        parse_lines([{'name': 'a', 'points': [[0, 0], [1, 1]]}, {'name': 'a', 'points': [[0, 0], [1, 1]]}])
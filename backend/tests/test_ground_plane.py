@@ -0,0 +1,37 @@
+import numpy as np
+
+from ground_plane import merge_points
+
+
+def _group(camera, points, ids=None):
+    points = np.array(points, dtype=float)
+    return {'camera': camera, 'points': points, 'ids': np.arange(len(points)) if ids is None else np.array(ids)}
+
+
+def test_points_from_different_cameras_within_the_radius_collapse_to_one():
+    merged = merge_points([_group('a', [[0, 0]]), _group('b', [[0.3, 0]])], units='metres')
+    assert merged == [{'camera': 'a', 'id': 0, 'position': [0.0, 0.0]}]
+
+
+def test_people_from_the_same_camera_at_the_same_distance_stay_separate():
+    merged = merge_points([_group('a', [[0, 0], [0.3, 0]]), _group('b', [[10, 10]])], units='metres')
+    assert [(point['camera'], point['id']) for point in merged] == [('a', 0), ('a', 1), ('b', 0)]
+
+
+def test_points_beyond_the_radius_are_kept():
+    merged = merge_points([_group('a', [[0, 0]]), _group('b', [[0.6, 0]])], units='metres')
+    assert len(merged) == 2
+
+
+def test_a_point_dropped_as_a_duplicate_does_not_drop_others():
+    # b's point is a duplicate of a's; c's point is only close to b's, so it stays
+    groups = [_group('a', [[0, 0]]), _group('b', [[0.4, 0]]), _group('c', [[0.8, 0]])]
+    merged = merge_points(groups, units='metres')
+    assert [point['camera'] for point in merged] == ['a', 'c']
+
+
+def test_lonlat_radius_is_in_metres():
+    # About 0.33 m and 3.3 m apart along latitude
+    near = merge_points([_group('a', [[0, 0]]), _group('b', [[0, 3e-6]])])
+    far = merge_points([_group('a', [[0, 0]]), _group('b', [[0, 3e-5]])])
+    assert (len(near), len(far)) == (1, 2)
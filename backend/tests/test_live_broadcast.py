@@ -0,0 +1,41 @@
+import asyncio
+import json
+
+from live_broadcast import CountBroadcaster, Subscriber
+
+
+def test_discard_state_keeps_queued_alerts():
+    subscriber = Subscriber(None, 0.2)
+    state = {'type': 'delta', 'version': 1, 'zones': {'hall': {'counts': 3}}}
+    subscriber.offer(state, json.dumps(state))
+    alert = {'zone': 'hall', 'message': 'over capacity'}
+    message = {'type': 'delta', 'version': 1, 'alerts': [alert]}
+    subscriber.offer(message, json.dumps(message))
+
+    subscriber.discard_state()
+
+    assert json.loads(subscriber.take()) == {'type': 'delta', 'version': 1, 'alerts': [alert]}
+    assert subscriber.take() is None
+
+
+def test_alert_queued_before_connecting_follows_the_snapshot():
+    status = {'zones': {'hall': {'status': 'running', 'counts': 3}}}
+
+    async def first_two_messages():
+        broadcaster = CountBroadcaster(lambda: status, interval=60)
+        subscriber = broadcaster.subscribe()
+        status['zones']['hall']['counts'] = 4
+        broadcaster._update(broadcaster._snapshot())
+        broadcaster.publish_alert({'zone': 'hall', 'message': 'over capacity'})
+        stream = broadcaster.messages(subscriber)
+        messages = [json.loads(await asyncio.wait_for(stream.__anext__(), 1)) for _ in range(2)]
+        await stream.aclose()
+        broadcaster.unsubscribe(subscriber)
+        broadcaster.task.cancel()
+        return messages
+
+    snapshot, delta = asyncio.run(first_two_messages())
+    assert snapshot['type'] == 'snapshot'
+    assert snapshot['zones']['hall']['counts'] == 4
+    assert delta['alerts'] == [{'zone': 'hall', 'message': 'over capacity'}]
+    assert 'zones' not in delta
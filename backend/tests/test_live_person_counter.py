@@ -0,0 +1,38 @@
+import pytest
+
+# LivePersonCounter loads the detector backends, which need the full inference stack
+pytest.importorskip('ultralytics')
+pytest.importorskip('cvzone')
+
+import live_person_counter  # noqa: E402
+from live_person_counter import LivePersonCounter  # noqa: E402
+
+
+class DownscaledCapture:
+    """A 1920x1080 stream decoded at 640x360, as the ffmpeg decoder does by default"""
+    width, height, fps = 640, 360, 30
+    source_width, source_height = 1920, 1080
+
+    def open(self):
+        return True
+
+
+@pytest.fixture
+def counter(monkeypatch):
+    monkeypatch.setattr(live_person_counter.model_registry, 'get', lambda *args, **kwargs: object())
+    monkeypatch.setattr(live_person_counter, 'create_capture', lambda *args, **kwargs: DownscaledCapture())
+    counter = LivePersonCounter('rtsp://camera/stream', headless=True, decoder='ffmpeg',
+                                lines=[{'name': 'door', 'points': [[960, 0], [960, 1080]]}],
+                                regions=[{'name': 'left', 'points': [[0, 0], [960, 0], [960, 1080], [0, 1080]]}])
+    assert counter._connect_to_stream()
+    return counter
+
+
+def test_pixel_lines_and_regions_follow_a_downscaled_decode(counter):
+    assert counter.line_counter.polylines[0].tolist() == [[320, 0], [320, 360]]
+    assert counter.region_counter.polygons[0].tolist() == [[0, 0], [320, 0], [320, 360], [0, 360]]
+
+
+def test_reset_keeps_the_scaled_lines(counter):
+    counter.reset_counts()
+    assert counter.line_counter.polylines[0].tolist() == [[320, 0], [320, 360]]
@@ -0,0 +1,64 @@
+import cv2
+import numpy as np
+import pytest
+
+from regions import RegionCounter, parse_regions
+
+
+def _person(cx, feet_y, person_id=1):
+    return [cx - 10, feet_y - 60, cx + 10, feet_y, person_id]
+
+
+def test_people_are_counted_in_the_region_under_their_feet():
+    regions = parse_regions([{'name': 'left', 'points': [[0, 0], [0.5, 0], [0.5, 1], [0, 1]]},
+                             {'name': 'right', 'points': [[0.5, 0], [1, 0], [1, 1], [0.5, 1]]}])
+    counter = RegionCounter(regions, 640, 480)
+    tracks = [_person(100, 300, 1), _person(500, 300, 2), _person(520, 400, 3)]
+    assert counter.count(tracks) == {'left': 1, 'right': 2}
+
+
+def test_overlapping_regions_both_count_a_person():
+    regions = parse_regions([{'name': 'hall', 'points': [[0, 0], [640, 0], [640, 480], [0, 480]]},
+                             {'name': 'queue', 'points': [[100, 100], [300, 100], [300, 300], [100, 300]]}])
+    counter = RegionCounter(regions, 640, 480)
+    assert counter.count([_person(200, 200), _person(500, 400, 2)]) == {'hall': 2, 'queue': 1}
+
+
+def test_center_anchor_uses_the_middle_of_the_box():
+    regions = parse_regions([{'name': 'top', 'points': [[0, 0], [640, 0], [640, 240], [0, 240]]}])
+    tracks = [_person(320, 260)]
+    assert RegionCounter(regions, 640, 480).count(tracks) == {'top': 0}
+    assert RegionCounter(regions, 640, 480, anchor='center').count(tracks) == {'top': 1}
+
+
+def test_boxes_outside_the_frame_are_clipped():
+    regions = parse_regions([{'name': 'all', 'points': [[0, 0], [1, 0], [1, 1], [0, 1]]}])
+    counter = RegionCounter(regions, 640, 480)
+    assert counter.count([[-50, 400, -10, 520, 1]]) == {'all': 1}
+
+
+def test_matches_a_point_in_polygon_check():
+    rng = np.random.default_rng(0)
+    triangle = np.array([[50, 50], [600, 120], [200, 450]])
+    counter = RegionCounter(parse_regions([{'name': 'tri', 'points': triangle.tolist()}]), 640, 480)
+    xs, ys = rng.integers(0, 640, 500), rng.integers(0, 480, 500)
+    tracks = [[x - 5, y - 30, x + 5, y, i] for i, (x, y) in enumerate(zip(xs, ys))]
+
+    inside = sum(cv2.pointPolygonTest(triangle.astype(np.float32), (float(x), float(y)), True) > 1
+                 for x, y in zip(xs, ys))
+    on_edge = sum(abs(cv2.pointPolygonTest(triangle.astype(np.float32), (float(x), float(y)), True)) <= 1
+                  for x, y in zip(xs, ys))
+    assert inside <= counter.count(tracks)['tri'] <= inside + on_edge
+
+
+def test_pixel_regions_scale_with_the_decoded_size():
+    regions = parse_regions([{'name': 'a', 'points': [[0, 0], [960, 0], [960, 1080], [0, 1080]]}])
+    counter = RegionCounter(regions, 640, 360, source_size=(1920, 1080))
+    assert counter.count([_person(300, 200, 1), _person(340, 200, 2)]) == {'a': 1}
+
+
+def test_parse_regions_rejects_bad_specs():
+    with pytest.raises(ValueError):
+        parse_regions([{'name': 'a', 'points': [[0, 0], [1, 1]]}])
+    with pytest.raises(ValueError):
+        parse_regions([{'points': [[0, 0], [1, 0], [1, 1]]}] * 65)
@@ -0,0 +1,64 @@
+import numpy as np
+
+import tiling
+from tiling import TiledDetector, nms, tile_grid
+
+
+def test_nms_keeps_an_occluded_pair():
+    # A person partly behind another: IoU is low, intersection over the smaller box is high
+    detections = np.array([[100, 100, 200, 400, 0.9], [150, 150, 210, 350, 0.8]], dtype=np.float64)
+    assert len(nms(detections)) == 2
+    assert len(nms(detections, metric='ios')) == 1
+
+
+def test_nms_drops_a_duplicate():
+    detections = np.array([[100, 100, 200, 400, 0.9], [102, 98, 201, 405, 0.7]], dtype=np.float64)
+    kept = nms(detections)
+    assert kept.tolist() == detections[:1].tolist()
+
+
+def test_nms_drops_a_partial_box_only_across_a_seam():
+    # Same person, cut by the border of the second tile
+    detections = np.array([[500, 100, 600, 400, 0.9], [560, 100, 600, 400, 0.85]], dtype=np.float64)
+    assert len(nms(detections, tile_index=[0, 1], cut=[False, True])) == 1
+    assert len(nms(detections, tile_index=[0, 0], cut=[False, True])) == 2
+
+
+def test_nms_matches_the_dense_all_pairs_result():
+    rng = np.random.default_rng(0)
+    corners = rng.uniform(0, 500, (400, 2))
+    detections = np.column_stack([corners, corners + rng.uniform(20, 80, (400, 2)), rng.uniform(0, 1, 400)])
+
+    areas = (detections[:, 2] - detections[:, 0]) * (detections[:, 3] - detections[:, 1])
+    order = np.lexsort((-areas, -detections[:, 4]))
+    boxes, area = detections[order, :4], areas[order]
+    top_left = np.maximum(boxes[:, None, :2], boxes[None, :, :2])
+    bottom_right = np.minimum(boxes[:, None, 2:], boxes[None, :, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=2)
+    iou = np.triu(intersection / (area[:, None] + area[None, :] - intersection), k=1)
+    expected = detections[order[iou.max(axis=0) <= 0.5]]
+
+    assert np.array_equal(nms(detections), expected)
+
+
+def test_tile_grid_covers_the_frame():
+    tiles = tile_grid(1920, 1080, 640, overlap=0.2)
+    assert tiles[:, 0].min() == 0 and tiles[:, 1].min() == 0
+    assert tiles[:, 2].max() == 1920 and tiles[:, 3].max() == 1080
+    assert ((tiles[:, 2] - tiles[:, 0]) == 640).all()
+
+
+def test_tiled_detector_merges_a_person_on_a_seam(monkeypatch):
+    # Tiles start at x = 0, 512 and 560; the person is whole in the first and cut in the other two
+    frame = np.zeros((640, 1200, 3), dtype=np.uint8)
+    detector = TiledDetector(lambda crops: list(range(len(crops))), tile_size=640, overlap=0.2)
+    tiles = detector.tiles_for(frame)
+    person = np.array([500, 100, 620, 400])
+
+    def decode(tile_number, conf, classes):
+        x1, y1, x2, y2 = tiles[tile_number]
+        box = np.clip(person, [x1, y1, x1, y1], [x2, y2, x2, y2]) - [x1, y1, x1, y1]
+        return np.array([[*box, 0.9]], dtype=np.float64)
+
+    monkeypatch.setattr(tiling, 'decode_detections', decode)
+    assert detector.detect(frame).tolist() == [person.tolist()]
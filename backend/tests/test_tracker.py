@@ -0,0 +1,79 @@
+import numpy as np
+import pytest
+
+import tracker
+from tracker import KalmanTracker, Tracker, associate
+
+
+def _pairs(i, j):
+    return sorted(zip(i.tolist(), j.tolist()))
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_grid_index_finds_the_same_pairs_as_the_dense_matrix(monkeypatch, seed):
+    rng = np.random.default_rng(seed)
+    points = rng.uniform(0, 1000, (300, 2))
+    targets = points[rng.permutation(300)[:250]] + rng.normal(0, 15, (250, 2))
+
+    monkeypatch.setattr(tracker, 'DENSE_PAIR_LIMIT', 10 ** 9)
+    dense = tracker._candidate_pairs(points, targets, 35)
+    dense_match = associate(points, targets, 35)
+    monkeypatch.setattr(tracker, 'DENSE_PAIR_LIMIT', 0)
+    grid = tracker._candidate_pairs(points, targets, 35)
+    grid_match = associate(points, targets, 35)
+
+    assert _pairs(*grid[:2]) == _pairs(*dense[:2])
+    assert _pairs(*grid_match) == _pairs(*dense_match)
+
+
+def test_association_is_optimal_not_greedy():
+    # Greedy nearest-first would match point 0 to target 0 and leave point 1 unmatched
+    points = np.array([[10.0, 0.0], [0.0, 0.0]])
+    targets = np.array([[5.0, 0.0], [30.0, 0.0]])
+    i, j = associate(points, targets, 25)
+    assert _pairs(i, j) == [(0, 1), (1, 0)]
+
+
+def test_association_respects_the_radius():
+    i, j = associate(np.array([[0.0, 0.0]]), np.array([[40.0, 0.0]]), 35)
+    assert len(i) == len(j) == 0
+
+
+def test_tracker_keeps_ids_while_people_move():
+    t = Tracker(max_distance=35)
+    first = t.update([[0, 0, 20, 40], [100, 0, 120, 40]])
+    second = t.update([[110, 0, 130, 40], [10, 0, 30, 40]])
+    ids = {box[0]: box[4] for box in first}
+    assert {box[0]: box[4] for box in second} == {10: ids[0], 110: ids[100]}
+
+
+def test_tracker_starts_new_ids_for_new_people_and_ends_lost_ones():
+    t = Tracker(max_distance=35)
+    (first,) = t.update([[0, 0, 20, 40]])
+    (second,) = t.update([[500, 0, 520, 40]])
+    assert second[4] != first[4]
+    assert t.update([]) == []
+
+
+def test_kalman_tracker_predicts_between_detections():
+    t = KalmanTracker(detect_every=3, measurement_noise=1e-3)
+    for x in range(0, 50, 10):
+        (box,) = t.update([[x, 0, x + 20, 40]])
+    assert not t.should_detect()
+    (predicted,) = t.predict()
+    assert predicted[4] == box[4]
+    assert abs(predicted[0] - 50) <= 1
+    (matched,) = t.update([[70, 0, 90, 40]])
+    assert matched[4] == box[4]
+
+
+def test_kalman_tracker_density_is_steady_between_detections():
+    t = KalmanTracker(detect_every=3)
+    present = [[100, 100, 120, 140]]
+    density = []
+    for frame in range(12):
+        # The person is in view for the first six frames, then leaves
+        boxes = present if frame < 6 else []
+        tracks = t.update(boxes) if t.should_detect() else t.predict()
+        density.append(len(tracks))
+    assert density == [1] * 6 + [0] * 6
@@ -0,0 +1,165 @@
+import logging
+from typing import Callable, List, Optional, Sequence
+
+import numpy as np
+
+from detections import decode_detections, person_class_ids
+
+logger = logging.getLogger(__name__)
+
+
+def tile_grid(width: int, height: int, tile_size: int, overlap: float = 0.2) -> np.ndarray:
+    """
+    Tiles covering the frame, overlapping by the given fraction.
+
+    The last row and column are aligned to the frame edge, so every tile
+    has the full tile size unless the frame itself is smaller.
+
+    Returns:
+        (T, 4) int array of [x1, y1, x2, y2]
+    """
+    def starts(length):
+        if length <= tile_size:
+            return np.array([0])
+        step = max(1, int(tile_size * (1 - overlap)))
+        positions = np.arange(0, length - tile_size, step)
+        return np.append(positions, length - tile_size)
+
+    xs, ys = starts(width), starts(height)
+    x1, y1 = np.meshgrid(xs, ys)
+    x1, y1 = x1.ravel(), y1.ravel()
+    return np.stack([x1, y1, np.minimum(x1 + tile_size, width), np.minimum(y1 + tile_size, height)], axis=1)
+
+
+def _candidate_pairs(boxes: np.ndarray):
+    """Index pairs (i < j) of boxes whose x ranges overlap, found with a sort and a sweep instead of all N^2"""
+    by_x = np.argsort(boxes[:, 0], kind='stable')
+    x1 = boxes[by_x, 0]
+    widest = (boxes[:, 2] - boxes[:, 0]).max()
+    low = np.searchsorted(x1, boxes[:, 0] - widest, side='left')
+    high = np.searchsorted(x1, boxes[:, 2], side='right')
+    counts = high - low
+    first = np.repeat(np.arange(len(boxes)), counts)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    second = by_x[np.repeat(low, counts) + offsets]
+    forward = first < second
+    return first[forward], second[forward]
+
+
+def nms(detections: np.ndarray, threshold: float = 0.5, metric: str = 'iou',
+        tile_index: Optional[np.ndarray] = None, cut: Optional[np.ndarray] = None) -> np.ndarray:
+    """
+    Vectorized (Fast) NMS over [x1, y1, x2, y2, score] rows.
+
+    Every box is compared with all higher-scoring boxes and dropped if any
+    of them overlaps it by more than the threshold. Only pairs whose x
+    ranges overlap are compared, so crowded frames cost far less than N^2.
+
+    The overlap is intersection over union, or with metric='ios'
+    intersection over the smaller box. IoS also removes a partial box
+    inside a full one, but it removes occluded people the same way, so it
+    is only applied where needed: given each row's tile_index and whether
+    it is cut by a tile border, pairs from different tiles where either box
+    is cut are compared by IoS and every other pair by IoU.
+
+    Returns:
+        The kept rows, highest score first
+    """
+    if len(detections) == 0:
+        return detections
+    # Highest score first; on ties the larger (less truncated) box wins
+    areas = (detections[:, 2] - detections[:, 0]) * (detections[:, 3] - detections[:, 1])
+    order = np.lexsort((-areas, -detections[:, 4]))
+    boxes = detections[order, :4]
+    area = areas[order]
+    seams = tile_index is not None and cut is not None
+    if seams:
+        tile_index = np.asarray(tile_index)[order]
+        cut = np.asarray(cut, dtype=bool)[order]
+
+    # i ranks above j, so only i can suppress j
+    i, j = _candidate_pairs(boxes)
+    top_left = np.maximum(boxes[i, :2], boxes[j, :2])
+    bottom_right = np.minimum(boxes[i, 2:], boxes[j, 2:])
+    intersection = np.clip(bottom_right - top_left, 0, None).prod(axis=1)
+    smaller = np.minimum(area[i], area[j])
+    union = area[i] + area[j] - intersection
+    if metric == 'ios':
+        denominator = smaller
+    elif seams:
+        across_seam = (tile_index[i] != tile_index[j]) & (cut[i] | cut[j])
+        denominator = np.where(across_seam, smaller, union)
+    else:
+        denominator = union
+    overlap = intersection / np.maximum(denominator, 1e-9)
+
+    suppression = np.zeros(len(boxes))
+    np.maximum.at(suppression, j, overlap)
+    keep = suppression <= threshold
+    return detections[order[keep]]
+
+
+class TiledDetector:
+    """
+    Runs the detector on overlapping tiles of a high-resolution frame.
+
+    Tiles are cut as views of the frame (no copies), sent to predict_fn in
+    groups of tiles_per_batch, shifted back to frame coordinates and merged
+    with NMS. detect() returns the same (N, 4) int32 boxes as
+    decode_person_boxes, so the output goes straight into the tracker.
+    """
+
+    def __init__(self, predict_fn: Callable[[List[np.ndarray]], list], tile_size: int = 640,
+                 overlap: float = 0.2, tiles_per_batch: int = 8, conf: float = 0.5,
+                 classes: Optional[Sequence[int]] = None, nms_threshold: float = 0.5):
+        self.predict_fn = predict_fn
+        self.tile_size = tile_size
+        self.overlap = overlap
+        self.tiles_per_batch = max(1, tiles_per_batch)
+        self.conf = conf
+        self.classes = list(classes) if classes is not None else list(person_class_ids())
+        self.nms_threshold = nms_threshold
+        self._grid_shape = None
+        self._grid = None
+
+    def tiles_for(self, frame: np.ndarray) -> np.ndarray:
+        """Tile grid for the frame size, cached until the size changes"""
+        shape = frame.shape[:2]
+        if shape != self._grid_shape:
+            self._grid = tile_grid(shape[1], shape[0], self.tile_size, self.overlap)
+            self._grid_shape = shape
+            logger.info(f"Tiling {shape[1]}x{shape[0]} frames into {len(self._grid)} tiles of {self.tile_size}px")
+        return self._grid
+
+    def detect(self, frame: np.ndarray, **predict_options) -> np.ndarray:
+        """Person boxes for the whole frame; predict_options (e.g. imgsz) are passed to predict_fn"""
+        tiles = self.tiles_for(frame)
+        crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in tiles]
+
+        height, width = frame.shape[:2]
+        merged, tile_index, cut = [], [], []
+        for start in range(0, len(crops), self.tiles_per_batch):
+            results = self.predict_fn(crops[start:start + self.tiles_per_batch], **predict_options)
+            for index, ((x1, y1, x2, y2), result) in enumerate(zip(tiles[start:], results), start):
+                detections = decode_detections(result, self.conf, self.classes)
+                if len(detections):
+                    detections[:, [0, 2]] += x1
+                    detections[:, [1, 3]] += y1
+                    merged.append(detections)
+                    tile_index.append(np.full(len(detections), index))
+                    cut.append(self._cut_by_border(detections, (x1, y1, x2, y2), width, height))
+
+        if not merged:
+            return np.empty((0, 4), dtype=np.int32)
+        kept = nms(np.concatenate(merged), self.nms_threshold,
+                   tile_index=np.concatenate(tile_index), cut=np.concatenate(cut))
+        return kept[:, :4].astype(np.int32)
+
+    @staticmethod
+    def _cut_by_border(detections: np.ndarray, tile, width: int, height: int, margin: float = 2) -> np.ndarray:
+        """Boxes touching an edge of their tile that is inside the frame, i.e. possibly a partial person"""
+        x1, y1, x2, y2 = tile
+        return (((detections[:, 0] <= x1 + margin) & (x1 > 0))
+                | ((detections[:, 1] <= y1 + margin) & (y1 > 0))
+                | ((detections[:, 2] >= x2 - margin) & (x2 < width))
+                | ((detections[:, 3] >= y2 - margin) & (y2 < height)))
@@ -1,40 +1,283 @@
-import math
+import time
+
+import numpy as np
+from scipy.optimize import linear_sum_assignment
+from scipy.sparse import coo_matrix
+from scipy.sparse.csgraph import connected_components
+
+# Below this many detection/track pairs a dense distance matrix is cheaper than the grid index
+DENSE_PAIR_LIMIT = 4096
+
+
+def _candidate_pairs(points, targets, radius):
+    """
+    Find all (i, j) with |points[i] - targets[j]| < radius.
+
+    Small problems use a dense distance matrix. Larger ones bucket the
+    targets into a uniform grid with cells of size radius, so each point
+    only looks at targets in its own and the 8 neighbouring cells.
+
+    Returns:
+        (i, j, distance) arrays
+    """
+    if len(points) == 0 or len(targets) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float32)
+
+    if len(points) * len(targets) <= DENSE_PAIR_LIMIT:
+        dist = np.linalg.norm(points[:, None, :] - targets[None, :, :], axis=2)
+        i, j = np.nonzero(dist < radius)
+        return i, j, dist[i, j]
+
+    target_cells = np.floor(targets / radius).astype(np.int64)
+    origin = target_cells.min(axis=0) - 1
+    target_cells -= origin
+    span = int(target_cells[:, 1].max()) + 2
+    keys = target_cells[:, 0] * span + target_cells[:, 1]
+    order = np.argsort(keys, kind='stable')
+    sorted_keys = keys[order]
+
+    point_cells = np.floor(points / radius).astype(np.int64) - origin
+    point_index = np.arange(len(points))
+    pairs_i, pairs_j = [], []
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            cx = point_cells[:, 0] + dx
+            cy = point_cells[:, 1] + dy
+            cell_keys = cx * span + cy
+            lo = np.searchsorted(sorted_keys, cell_keys, side='left')
+            hi = np.searchsorted(sorted_keys, cell_keys, side='right')
+            # Rows outside the grid would alias onto a neighbouring column
+            counts = np.where((cy >= 0) & (cy < span), hi - lo, 0)
+            total = int(counts.sum())
+            if total == 0:
+                continue
+            offsets = np.arange(total) - np.repeat(np.cumsum(counts) - counts, counts)
+            pairs_i.append(np.repeat(point_index, counts))
+            pairs_j.append(order[np.repeat(lo, counts) + offsets])
+
+    if not pairs_i:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty, np.empty(0, dtype=np.float32)
+
+    i = np.concatenate(pairs_i)
+    j = np.concatenate(pairs_j)
+    dist = np.linalg.norm(points[i] - targets[j], axis=1)
+    keep = dist < radius
+    return i[keep], j[keep], dist[keep]
+
+
+def associate(points, targets, radius):
+    """
+    Optimally match points to targets closer than radius.
+
+    The candidate pairs form a bipartite graph; each connected component is
+    solved independently with the Hungarian algorithm, and components made
+    of a single pair are matched directly. In crowds the components stay
+    small, so the cost grows roughly linearly with the number of people.
+
+    Returns:
+        (point_index, target_index) arrays of matched pairs
+    """
+    i, j, dist = _candidate_pairs(points, targets, radius)
+    if len(i) == 0:
+        empty = np.empty(0, dtype=np.int64)
+        return empty, empty
+
+    n_points = len(points)
+    size = n_points + len(targets)
+    graph = coo_matrix((np.ones(len(i)), (i, n_points + j)), shape=(size, size))
+    _, labels = connected_components(graph, directed=False)
+    component = labels[i]
+
+    # A component with one edge is a single unambiguous match
+    single = np.bincount(component)[component] == 1
+    matched_i = [i[single]]
+    matched_j = [j[single]]
+
+    multi = np.nonzero(~single)[0]
+    if len(multi):
+        multi = multi[np.argsort(component[multi], kind='stable')]
+        bounds = np.nonzero(np.diff(component[multi]))[0] + 1
+        for edges in np.split(multi, bounds):
+            rows, row_index = np.unique(i[edges], return_inverse=True)
+            cols, col_index = np.unique(j[edges], return_inverse=True)
+            # Non-edges cost more than any full set of real edges, so matching count is maximized first
+            cost = np.full((len(rows), len(cols)), radius * (len(edges) + 1), dtype=np.float64)
+            cost[row_index, col_index] = dist[edges]
+            r, c = linear_sum_assignment(cost)
+            valid = cost[r, c] < radius
+            matched_i.append(rows[r[valid]])
+            matched_j.append(cols[c[valid]])
+
+    return np.concatenate(matched_i), np.concatenate(matched_j)
+
+
+def _as_boxes(objects_rect):
+    """Detector boxes as an (N, 4) float array of [x1, y1, x2, y2]"""
+    return np.asarray(objects_rect, dtype=np.float32).reshape(-1, 4)
 
 
 class Tracker:
-    def __init__(self):
-        self.center_points = {}
-        self.id_count = 0
+    """
+    Centroid tracker with array-backed state.
 
+    update() takes the frame's person boxes as [x1, y1, x2, y2] and returns
+    [x1, y1, x2, y2, id] for each of them. Boxes are matched to the previous
+    frame's centers by optimal assignment within max_distance pixels;
+    unmatched boxes start new tracks and tracks not seen this frame end.
+    """
+
+    def __init__(self, max_distance=35):
+        self.max_distance = max_distance
+        self.ids = np.empty(0, dtype=np.int64)
+        self.centers = np.empty((0, 2), dtype=np.float32)
+        self.id_count = 0
 
     def update(self, objects_rect):
-        objects_bbs_ids = []
-
-        for rect in objects_rect:
-            x, y, w, h = rect
-            cx = (x + x + w) // 2
-            cy = (y + y + h) // 2
-
-            same_object_detected = False
-            for id, pt in self.center_points.items():
-                dist = math.hypot(cx - pt[0], cy - pt[1])
-
-                if dist < 35:
-                    self.center_points[id] = (cx, cy)
-                    objects_bbs_ids.append([x, y, w, h, id])
-                    same_object_detected = True
-                    break
-
-            if same_object_detected is False:
-                self.center_points[self.id_count] = (cx, cy)
-                objects_bbs_ids.append([x, y, w, h, self.id_count])
-                self.id_count += 1
-
-        new_center_points = {}
-        for obj_bb_id in objects_bbs_ids:
-            _, _, _, _, object_id = obj_bb_id
-            center = self.center_points[object_id]
-            new_center_points[object_id] = center
-
-        self.center_points = new_center_points.copy()
-        return objects_bbs_ids
\ No newline at end of file
+        boxes = _as_boxes(objects_rect)
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+
+        det_index, track_index = associate(centers, self.centers, self.max_distance)
+
+        ids = np.empty(len(boxes), dtype=np.int64)
+        ids[det_index] = self.ids[track_index]
+        new = np.ones(len(boxes), dtype=bool)
+        new[det_index] = False
+        n_new = int(new.sum())
+        ids[new] = np.arange(self.id_count, self.id_count + n_new)
+        self.id_count += n_new
+
+        self.ids = ids
+        self.centers = centers
+        return np.column_stack([boxes.astype(np.int64), ids]).tolist()
+
+
+class KalmanTracker:
+    """
+    Tracker for running the detector only on some frames.
+
+    Call should_detect() once per frame. On detector frames pass the person
+    boxes ([x1, y1, x2, y2]) to update(); on the frames in between call
+    predict() and each track's constant-velocity Kalman filter moves its box
+    forward. Both return [x1, y1, x2, y2, id] lists, like Tracker.update,
+    for the same tracks: those matched by the last detector run. Tracks it
+    missed are still predicted, so they can be matched again, but are not
+    reported, so a person who left doesn't reappear between detections.
+
+    All track state lives in parallel arrays and every filter step is
+    applied to all tracks at once.
+    """
+
+    # Constant-velocity transition over one frame; state is cx, cy, vx, vy
+    F = np.array([[1, 0, 1, 0],
+                  [0, 1, 0, 1],
+                  [0, 0, 1, 0],
+                  [0, 0, 0, 1]], dtype=np.float64)
+
+    # Discrete white-noise acceleration over one frame
+    Q_UNIT = np.array([[0.25, 0, 0.5, 0],
+                       [0, 0.25, 0, 0.5],
+                       [0.5, 0, 1, 0],
+                       [0, 0.5, 0, 1]], dtype=np.float64)
+
+    def __init__(self, detect_every=1, detect_interval=None, max_distance=35,
+                 max_missed=2, process_noise=1.0, measurement_noise=10.0):
+        self.detect_every = max(1, detect_every)
+        self.detect_interval = detect_interval
+        self.max_distance = max_distance
+        self.max_missed = max_missed
+        self.Q = self.Q_UNIT * process_noise
+        self.R = np.eye(2) * measurement_noise
+        self.initial_cov = np.diag([measurement_noise, measurement_noise, 1000.0, 1000.0])
+
+        self.ids = np.empty(0, dtype=np.int64)
+        self.state = np.empty((0, 4), dtype=np.float64)
+        self.cov = np.empty((0, 4, 4), dtype=np.float64)
+        self.sizes = np.empty((0, 2), dtype=np.float64)
+        self.missed = np.empty(0, dtype=np.int64)
+        self.id_count = 0
+
+        self.frames_since_detection = 0
+        self.last_detection_time = None
+
+    def should_detect(self, now=None):
+        """Whether the detector should run on the current frame"""
+        if self.last_detection_time is None:
+            return True
+        if self.detect_interval is not None:
+            now = time.time() if now is None else now
+            return now - self.last_detection_time >= self.detect_interval
+        return self.frames_since_detection + 1 >= self.detect_every
+
+    def _advance(self):
+        """Kalman predict step for all tracks"""
+        self.state = self.state @ self.F.T
+        self.cov = self.F @ self.cov @ self.F.T + self.Q
+
+    def _correct(self, index, centers):
+        """Kalman update step for the tracks at index with measured centers"""
+        P = self.cov[index]
+        S = P[:, :2, :2] + self.R
+        K = P[:, :, :2] @ np.linalg.inv(S)
+        innovation = centers - self.state[index, :2]
+        self.state[index] += np.einsum('nij,nj->ni', K, innovation)
+        # (I - KH) P, with H selecting the position rows
+        self.cov[index] = P - K @ P[:, :2, :]
+
+    def _boxes(self, mask=None):
+        """Current track boxes as [x1, y1, x2, y2, id] lists"""
+        centers, sizes, ids = self.state[:, :2], self.sizes, self.ids
+        if mask is not None:
+            centers, sizes, ids = centers[mask], sizes[mask], ids[mask]
+        corners = np.hstack([centers - sizes / 2, centers + sizes / 2]).astype(np.int64)
+        return np.column_stack([corners, ids]).tolist()
+
+    def predict(self):
+        """Advance every track by one frame without a detection"""
+        self._advance()
+        self.frames_since_detection += 1
+        return self._boxes(self.missed == 0)
+
+    def update(self, objects_rect, now=None):
+        """Advance tracks by one frame and correct them with detector boxes"""
+        self._advance()
+
+        boxes = _as_boxes(objects_rect).astype(np.float64)
+        centers = (boxes[:, :2] + boxes[:, 2:]) / 2
+        sizes = boxes[:, 2:] - boxes[:, :2]
+
+        # Each detector run may cover several frames of motion, so allow for the stride
+        gate = self.max_distance * (self.frames_since_detection + 1)
+        det_index, track_index = associate(centers, self.state[:, :2], gate)
+
+        self._correct(track_index, centers[det_index])
+        self.sizes[track_index] = sizes[det_index]
+        self.missed += 1
+        self.missed[track_index] = 0
+
+        # Drop tracks that have gone unmatched for too many detector runs
+        keep = self.missed <= self.max_missed
+        self.ids = self.ids[keep]
+        self.state = self.state[keep]
+        self.cov = self.cov[keep]
+        self.sizes = self.sizes[keep]
+        self.missed = self.missed[keep]
+
+        # Unmatched detections start new tracks
+        new = np.ones(len(boxes), dtype=bool)
+        new[det_index] = False
+        n_new = int(new.sum())
+        if n_new:
+            new_state = np.zeros((n_new, 4))
+            new_state[:, :2] = centers[new]
+            self.ids = np.concatenate([self.ids, np.arange(self.id_count, self.id_count + n_new)])
+            self.state = np.vstack([self.state, new_state])
+            self.cov = np.concatenate([self.cov, np.broadcast_to(self.initial_cov, (n_new, 4, 4))])
+            self.sizes = np.vstack([self.sizes, sizes[new]])
+            self.missed = np.concatenate([self.missed, np.zeros(n_new, dtype=np.int64)])
+            self.id_count += n_new
+
+        self.frames_since_detection = 0
+        self.last_detection_time = time.time() if now is None else now
+        return self._boxes(self.missed == 0)
@@ -310,6 +310,25 @@ export default function CrowdHeatmap({
     };
   }, [bounds, isMounted, retryCount]);
 
+  // Live positions of people from calibrated cameras, projected onto the map by the backend
+  useEffect(() => {
+    const updatePeople = async () => {
+      const map = mapRef.current;
+      if (!map || !map.isStyleLoaded()) return;
+      try {
+        const response = await fetch('http://localhost:8000/api/person-counting-ground');
+        const data = await response.json();
+        const people = data.success ? (data.points?.lonlat ?? []) : [];
+        drawPeople(map, people);
+      } catch (error) {
+        console.error('Error fetching ground positions:', error);
+      }
+    };
+
+    const interval = setInterval(updatePeople, 2000);
+    return () => clearInterval(interval);
+  }, [retryCount]);
+
   // Handle alert location changes
   useEffect(() => {
     if (mapRef.current && highlightAlertLocation && alertZone) {
@@ -417,6 +436,42 @@ export default function CrowdHeatmap({
     new Marker({ color: '#2563eb' }).setLngLat(CENTER).addTo(map);
   };
 
+  const drawPeople = (map: Map, people: { camera: string; id: number; position: [number, number] }[]) => {
+    const features = people.map((p) => ({
+      type: 'Feature' as const,
+      geometry: { type: 'Point' as const, coordinates: p.position },
+      properties: { camera: p.camera, id: p.id }
+    }));
+
+    if (!map.getSource('live-people')) {
+      map.addSource('live-people', { type: 'geojson', data: { type: 'FeatureCollection', features } });
+    } else {
+      (map.getSource('live-people') as mapboxgl.GeoJSONSource).setData({ type: 'FeatureCollection', features } as any);
+    }
+
+    if (!map.getLayer('live-people-heat')) {
+      map.addLayer({
+        id: 'live-people-heat',
+        type: 'heatmap',
+        source: 'live-people',
+        maxzoom: 20,
+        paint: {
+          'heatmap-weight': 0.3,
+          'heatmap-intensity': 1,
+          'heatmap-radius': ['interpolate', ['exponential', 2], ['zoom'], 16, 4, 20, 64],
+          'heatmap-color': [
+            'interpolate', ['linear'], ['heatmap-density'],
+            0, 'rgba(0,0,0,0)',
+            0.2, 'rgba(16,185,129,0.35)',
+            0.4, 'rgba(250,204,21,0.45)',
+            0.7, 'rgba(245,158,11,0.6)',
+            1, 'rgba(239,68,68,0.75)'
+          ]
+        }
+      });
+    }
+  };
+
   const drawZones = (map: Map) => {
     const features = ZONE_DATA.map((z) => ({
       type: 'Feature' as const,
@@ -144,6 +144,8 @@ export default function Dashboard() {
   const [imageRefreshInterval, setImageRefreshInterval] = useState<NodeJS.Timeout | null>(null);
   const videoRef = useRef<HTMLVideoElement | null>(null);
   const imgRef = useRef<HTMLImageElement | null>(null);
+  const countingSourceRef = useRef<EventSource | null>(null);
+  const snapshotUrlRef = useRef<string | null>(null);
   
   // Alert System State
   const [alerts, setAlerts] = useState([
@@ -455,6 +457,13 @@ export default function Dashboard() {
     }
   };
 
+  const releaseSnapshotUrl = () => {
+    if (snapshotUrlRef.current) {
+      URL.revokeObjectURL(snapshotUrlRef.current);
+      snapshotUrlRef.current = null;
+    }
+  };
+
   const startImageRefresh = (camera: typeof activeFeeds[0]) => {
     const baseUrl = camera.baseUrl;
     
@@ -462,13 +471,36 @@ export default function Dashboard() {
     if (imageRefreshInterval) {
       clearInterval(imageRefreshInterval);
     }
+    releaseSnapshotUrl();
+    
+    // Prefer the backend relay, so the phone keeps a single client; fall back to the camera itself.
+    // The relay has no frames until counting starts, so it is tried again every few seconds.
+    const relayUrl = `http://localhost:8000/api/camera-snapshot?zone=${encodeURIComponent(camera.zone)}`;
+    const relayRetryMs = 5000;
+    let relayRetryAt = 0;
     
     // Function to update image
-    const updateImage = () => {
-      if (imgRef.current) {
-        // Add timestamp to prevent caching
-        imgRef.current.src = `${baseUrl}/shot.jpg?t=${Date.now()}`;
+    const updateImage = async () => {
+      if (!imgRef.current) return;
+      if (Date.now() >= relayRetryAt) {
+        try {
+          // Revalidates with the ETag, so an unchanged frame is not sent again
+          const response = await fetch(relayUrl, { cache: 'no-cache' });
+          if (!response.ok) throw new Error(`Relay returned ${response.status}`);
+          const blob = await response.blob();
+          releaseSnapshotUrl();
+          snapshotUrlRef.current = URL.createObjectURL(blob);
+          if (imgRef.current) imgRef.current.src = snapshotUrlRef.current;
+          return;
+        } catch (error) {
+          if (!relayRetryAt) {
+            console.log('Camera relay not available, loading snapshots from the camera:', error);
+          }
+          relayRetryAt = Date.now() + relayRetryMs;
+        }
       }
+      // Add timestamp to prevent caching
+      imgRef.current.src = `${baseUrl}/shot.jpg?t=${Date.now()}`;
     };
     
     // Initial load
@@ -548,6 +580,7 @@ export default function Dashboard() {
       clearInterval(imageRefreshInterval);
       setImageRefreshInterval(null);
     }
+    releaseSnapshotUrl();
   };
 
   // Alert System Functions
@@ -739,35 +772,65 @@ export default function Dashboard() {
     }
   };
 
+  const closeCountingStream = () => {
+    if (countingSourceRef.current) {
+      countingSourceRef.current.close();
+      countingSourceRef.current = null;
+    }
+  };
+
+  // Close the live count stream when the camera changes, the modal closes or the page unmounts
+  useEffect(() => closeCountingStream, [selectedCamera?.zone]);
+
   const startCountingPolling = () => {
-    const pollInterval = setInterval(async () => {
+    // The backend pushes a snapshot and then only the changes, instead of every browser polling
+    closeCountingStream();
+    const zoneName = selectedCamera?.zone || '';
+    const source = new EventSource(
+      `http://localhost:8000/api/person-counting-stream?zone=${encodeURIComponent(zoneName)}&max_rate=2`
+    );
+    let zoneState: any = {};
+    
+    const mergeDelta = (into: any, delta: any) => {
+      Object.entries(delta || {}).forEach(([key, value]) => {
+        if (value && typeof value === 'object' && !Array.isArray(value) && into[key] && typeof into[key] === 'object') {
+          mergeDelta(into[key], value);
+        } else {
+          into[key] = value;
+        }
+      });
+      return into;
+    };
+    
+    source.onmessage = (event) => {
       try {
-        const response = await fetch('http://localhost:8000/api/person-counting-status');
-        const result = await response.json();
+        const message = JSON.parse(event.data);
+        if (message.type === 'snapshot') {
+          zoneState = message.zones?.[zoneName] || {};
+        } else if (message.zones?.[zoneName]) {
+          mergeDelta(zoneState, message.zones[zoneName]);
+        }
+        if (!zoneState.counts) return;
         
-        if (result.success) {
-          setPersonCounts({
-            entry: result.counts.entry || 0,
-            exit: result.counts.exit || 0,
-            density: result.counts.density || 0
-          });
-          
-          // Update the UI elements
-          updateCountingUI(result.counts);
-          
-          if (result.status === 'completed' || result.status === 'error') {
-            clearInterval(pollInterval);
-            setIsCountingActive(false);
-            setCountingStatus(result.status);
-          }
+        setPersonCounts({
+          entry: zoneState.counts.entry || 0,
+          exit: zoneState.counts.exit || 0,
+          density: zoneState.counts.density || 0
+        });
+        
+        // Update the UI elements
+        updateCountingUI(zoneState.counts);
+        
+        if (zoneState.status === 'stopped') {
+          closeCountingStream();
+          setIsCountingActive(false);
         }
       } catch (error) {
-        console.error('Error polling counting status:', error);
+        console.error('Error reading live counts:', error);
       }
-    }, 1000); // Poll every second
+    };
     
-    // Store interval ID for cleanup
-    return pollInterval;
+    countingSourceRef.current = source;
   };
 
   const updateCountingUI = (counts: any) => {
@@ -784,7 +847,13 @@ export default function Dashboard() {
   const stopPersonCounting = async () => {
     try {
       const response = await fetch('http://localhost:8000/api/stop-person-counting', {
-        method: 'POST'
+        method: 'POST',
+        headers: {
+          'Content-Type': 'application/json',
+        },
+        body: JSON.stringify({
+          zone: selectedCamera?.zone
+        })
       });
 
       const result = await response.json();